@@ -1,20 +1,67 @@
 # app/ai_logic.py
 from __future__ import annotations
+import asyncio
 import json
 import logging
-from typing import Any, Dict, Optional
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
-from openai import AsyncOpenAI
 from .config import settings
 from .formatting import ensure_min_words, sanitize_html
+from .metrics import Counter, Histogram
+from .tracing import span
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 log = logging.getLogger(__name__)
 
-# Используем единый асинхронный клиент OpenAI
-client = AsyncOpenAI(
-    api_key=settings.OPENAI_API_KEY,
-    timeout=settings.OPENAI_TIMEOUT,
-)
+LLM_SECONDS = Histogram("llm_request_seconds", "Запросы к OpenAI", ["function", "model"])
+LLM_ERRORS = Counter("llm_errors_total", "Ошибки запросов к OpenAI", ["function", "model"])
+LLM_TOKENS = Counter("llm_tokens_total", "Токены OpenAI", ["function", "model", "kind"])
+
+# Единый асинхронный клиент OpenAI. Пакет openai импортируется долго (сотни мс типов),
+# поэтому клиент создаётся при первом запросе или в фоновом прогреве (см. startup.py)
+_client: Optional[AsyncOpenAI] = None
+
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            timeout=settings.OPENAI_TIMEOUT,
+        )
+    return _client
+
+
+async def warmup() -> None:
+    """Создаёт клиент вне event loop и открывает соединение с API (TLS-рукопожатие — до первого пользователя)."""
+    client = await asyncio.to_thread(get_client)
+    await client.models.retrieve(settings.OPENAI_MODEL)
+
+
+async def _chat(function: str, **kwargs: Any) -> Any:
+    """chat.completions.create с метриками: время, ошибки и токены по функции и модели."""
+    model = kwargs["model"]
+    started = time.perf_counter()
+    with span("openai.chat", function=function, model=model) as sp:
+        try:
+            response = await get_client().chat.completions.create(**kwargs)
+        except Exception:
+            LLM_ERRORS.labels(function, model).inc()
+            raise
+        finally:
+            LLM_SECONDS.labels(function, model).observe(time.perf_counter() - started)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.labels(function, model, "prompt").inc(usage.prompt_tokens or 0)
+            LLM_TOKENS.labels(function, model, "completion").inc(usage.completion_tokens or 0)
+            sp.set("prompt_tokens", usage.prompt_tokens or 0)
+            sp.set("completion_tokens", usage.completion_tokens or 0)
+    return response
 
 
 def _read_prompt(file_path: str) -> str:
@@ -23,10 +70,10 @@ def _read_prompt(file_path: str) -> str:
         with open(file_path, "r", encoding="utf-8") as f:
             return f.read()
     except FileNotFoundError:
-        log.error(f"Файл промпта не найден: {file_path}")
+        log.error("Файл промпта не найден: %s", file_path)
         return ""
     except Exception as e:
-        log.error(f"Ошибка при чтении файла промпта {file_path}: {e}")
+        log.error("Ошибка при чтении файла промпта %s: %s", file_path, e)
         return ""
 
 
@@ -45,7 +92,8 @@ async def route_user_message_registration(user_text: str, current_step: str) ->
 
     try:
         log.debug("AI-Router (Регистрация): Отправка запроса...")
-        response = await client.chat.completions.create(
+        response = await _chat(
+            "route_user_message_registration",
             model=settings.REG_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -55,10 +103,10 @@ async def route_user_message_registration(user_text: str, current_step: str) ->
             response_format={"type": "json_object"},
         )
         result = json.loads(response.choices[0].message.content)
-        log.debug(f"AI-Router (Регистрация) | Результат: {result}")
+        log.debug("AI-Router (Регистрация) | Результат: %s", result)
         return result
     except Exception as e:
-        log.error(f"AI-Router (Регистрация) | Ошибка: {e}")
+        log.error("AI-Router (Регистрация) | Ошибка: %s", e)
         return None
 
 
@@ -82,8 +130,9 @@ async def generate_assistant_response_registration(state: Dict[str, Any], next_s
     }
 
     try:
-        log.debug(f"AI-Responder (Регистрация): Отправка запроса для шага '{next_step}'...")
-        response = await client.chat.completions.create(
+        log.debug("AI-Responder (Регистрация): Отправка запроса для шага '%s'...", next_step)
+        response = await _chat(
+            "generate_assistant_response_registration",
             model=settings.RESPONDER_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -93,15 +142,47 @@ async def generate_assistant_response_registration(state: Dict[str, Any], next_s
             response_format={"type": "json_object"},
         )
         result_json = json.loads(response.choices[0].message.content)
-        log.debug(f"AI-Responder (Регистрация) | Результат: {result_json}")
+        log.debug("AI-Responder (Регистрация) | Результат: %s", result_json)
         return result_json.get("assistant_text", "Я не совсем поняла, можете повторить?")
     except Exception as e:
-        log.error(f"AI-Responder (Регистрация) | Ошибка: {e}")
+        log.error("AI-Responder (Регистрация) | Ошибка: %s", e)
         return "Извините, у меня возникли технические неполадки. Давайте попробуем чуть позже."
 
 
 # --- Логика для ЭТАПА 2: ПОДБОР ИНФЛЮЕНСЕРОВ ---
 
+async def route_user_message_postreg(user_text: str, filters: Dict[str, Any],
+                                     pending_step: str) -> Optional[Dict[str, Any]]:
+    """
+    ИИ-Router для этапа подбора.
+    Достаёт из свободного текста обновления фильтров (см. router_postreg_prompt.txt).
+    """
+    system_prompt = _read_prompt("app/prompts/router_postreg_prompt.txt")
+    if not system_prompt:
+        return None
+
+    input_data = {"filters": filters, "user_text": user_text, "pending_step": pending_step}
+
+    try:
+        log.debug("AI-Router (Подбор): Отправка запроса...")
+        response = await _chat(
+            "route_user_message_postreg",
+            model=settings.OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps(input_data, ensure_ascii=False)},
+            ],
+            temperature=0.0,
+            response_format={"type": "json_object"},
+        )
+        result = json.loads(response.choices[0].message.content)
+        log.debug("AI-Router (Подбор) | Результат: %s", result)
+        return result
+    except Exception as e:
+        log.error("AI-Router (Подбор) | Ошибка: %s", e)
+        return None
+
+
 async def generate_text(intent: str, context: Optional[Dict[str, Any]] = None, fallback: Optional[str] = None) -> str:
     """
     Универсальная функция для генерации текста Арай на этапе подбора инфлюенсеров.
@@ -116,8 +197,9 @@ async def generate_text(intent: str, context: Optional[Dict[str, Any]] = None, f
     }
 
     try:
-        log.debug(f"AI-Generator (Подбор): Отправка запроса для интента '{intent}'...")
-        response = await client.chat.completions.create(
+        log.debug("AI-Generator (Подбор): Отправка запроса для интента '%s'...", intent)
+        response = await _chat(
+            "generate_text",
             model=settings.RESPONDER_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -128,13 +210,13 @@ async def generate_text(intent: str, context: Optional[Dict[str, Any]] = None, f
         )
         result_json = json.loads(response.choices[0].message.content)
         text = result_json.get("assistant_text")
-        log.debug(f"AI-Generator (Подбор) | Результат: {text}")
+        log.debug("AI-Generator (Подбор) | Результат: %s", text)
         if not text:
             raise ValueError("Ответ ИИ не содержит текста")
         return sanitize_html(text)
 
     except Exception as e:
-        log.error(f"AI-Generator (Подбор) | Ошибка: {e}")
+        log.error("AI-Generator (Подбор) | Ошибка: %s", e)
         return fallback or "Извините, возникла небольшая проблема. Давайте продолжим."
 
 
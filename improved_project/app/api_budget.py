@@ -0,0 +1,137 @@
+# app/api_budget.py
+"""
+Счётчик вызовов Bot API на один апдейт.
+
+CountingRequestMiddleware (на сессии бота) увеличивает счётчик, лежащий в contextvar,
+ApiBudgetMiddleware (outer, уровень Update) заводит новый счётчик на каждый апдейт и пишет
+итог в гистограмму. В тестах тот же счётчик можно использовать напрямую:
+
+    async with count_api_calls(budget=2) as calls:
+        await on_results_nav(cb, state)
+    # ApiBudgetExceeded, если хендлер сделал больше двух запросов
+
+Отложенные правки (coalescer) создаются внутри апдейта и наследуют его контекст, поэтому их
+запросы идут в счётчик этого апдейта; сами задачи правок регистрируются через defer(). Итог
+подводится, когда они завершились (или были отменены более новой правкой): count_api_calls
+их дожидается, а ApiBudgetMiddleware не ждёт — очередь чата освобождается сразу, а гистограмма
+и проверка бюджета выполняются по завершении последней правки.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from .metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+    from aiogram.methods import Response, TelegramMethod
+
+log = logging.getLogger(__name__)
+
+CALLS_PER_UPDATE = Histogram(
+    "bot_api_calls_per_update", "Запросы к Bot API на один апдейт", ["event_type"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10),
+)
+OVER_BUDGET_TOTAL = Counter("bot_api_over_budget_total", "Апдейты, превысившие бюджет запросов к Bot API")
+
+
+class ApiBudgetExceeded(AssertionError):
+    pass
+
+
+class ApiCallCounter:
+    __slots__ = ("calls", "methods", "deferred")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.methods: List[str] = []
+        self.deferred: List["asyncio.Task[Any]"] = []
+
+    def pending(self) -> List["asyncio.Task[Any]"]:
+        return [t for t in self.deferred if not t.done()]
+
+    async def settle(self) -> None:
+        """Дожидается отложенных правок апдейта."""
+        while pending := self.pending():
+            await asyncio.wait(pending)
+
+
+_current: ContextVar[Optional[ApiCallCounter]] = ContextVar("api_call_counter", default=None)
+
+
+def defer(task: "asyncio.Task[Any]") -> None:
+    """Задача, созданная апдейтом и отправляющая запросы после его хендлера (см. coalesce.py)."""
+    counter = _current.get()
+    if counter is not None:
+        counter.deferred.append(task)
+
+
+@asynccontextmanager
+async def count_api_calls(budget: Optional[int] = None) -> AsyncIterator[ApiCallCounter]:
+    counter = ApiCallCounter()
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+    await counter.settle()
+    if budget is not None and counter.calls > budget:
+        raise ApiBudgetExceeded(f"{counter.calls} запросов к Bot API при бюджете {budget}: {counter.methods}")
+
+
+class CountingRequestMiddleware(BaseRequestMiddleware):
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: "TelegramMethod[TelegramType]",
+    ) -> "Response[TelegramType]":
+        counter = _current.get()
+        if counter is not None:
+            counter.calls += 1
+            counter.methods.append(type(method).__name__)
+        return await make_request(bot, method)
+
+
+class ApiBudgetMiddleware(BaseMiddleware):
+    """Считает запросы к Bot API на каждый апдейт и предупреждает, если их больше бюджета."""
+
+    def __init__(self, budget: int) -> None:
+        self._budget = budget
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        event_type = event.event_type if isinstance(event, Update) else type(event).__name__
+        counter = ApiCallCounter()
+        token = _current.set(counter)
+        try:
+            return await handler(event, data)
+        finally:
+            _current.reset(token)
+            self._observe(event, event_type, counter)
+
+    def _observe(self, event: TelegramObject, event_type: str, counter: ApiCallCounter) -> None:
+        pending = counter.pending()
+        if pending:
+            # Отложенные правки ещё впереди: итог — когда они завершатся, хендлер их не ждёт
+            asyncio.gather(*pending, return_exceptions=True).add_done_callback(
+                lambda _: self._observe(event, event_type, counter))
+            return
+        CALLS_PER_UPDATE.labels(event_type).observe(counter.calls)
+        if counter.calls > self._budget:
+            OVER_BUDGET_TOTAL.inc()
+            log.warning("Апдейт %s: %d запросов к Bot API (бюджет %d): %s",
+                        getattr(event, "update_id", None), counter.calls, self._budget, counter.methods)
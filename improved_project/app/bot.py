@@ -1,4 +1,9 @@
 # app/bot.py
+import time
+
+# Отсчёт для startup_first_update_seconds: до импортов aiogram и остального бота
+_STARTED = time.monotonic()
+
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
@@ -7,10 +12,22 @@ from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from .config import settings
-from .logger import setup_logging
+from .logger import setup_logging, stop_logging
 from .routers import common as common_router
 from .routers import influencers
+from .routers import admin as admin_router
 from .middlewares import TypingMiddleware, LoggingMiddleware
+from .scheduler import SchedulerMiddleware
+from .supersede import SupersedeMiddleware
+from .outbound import OutboundMiddleware
+from .api_budget import ApiBudgetMiddleware, CountingRequestMiddleware
+from .saved_searches import alerts
+from .export_worker import exporter
+from .startup import FirstUpdateMiddleware, warmup
+from .instrumentation import HandlerMetricsMiddleware, TimedStorage
+from .metrics import start_http_server
+from .tracing import TracingMiddleware, TracingRequestMiddleware, tracer
+from .watchdog import watchdog
 
 
 async def main() -> None:
@@ -18,22 +35,81 @@ async def main() -> None:
     log = logging.getLogger("bot")
 
     bot = Bot(token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher(storage=MemoryStorage())
+    # Спан трассы на каждый запрос к Bot API (первым: вместе с ожиданием в очереди отправки)
+    bot.session.middleware(TracingRequestMiddleware())
+    # Счётчик запросов к Bot API на апдейт (снаружи очереди: повторы после RetryAfter не считаются)
+    bot.session.middleware(CountingRequestMiddleware())
+    # Все исходящие запросы проходят через общую очередь с flood-лимитами и приоритетами
+    bot.session.middleware(OutboundMiddleware(
+        global_rate=settings.OUTBOUND_GLOBAL_RATE,
+        chat_rate=settings.OUTBOUND_CHAT_RATE,
+        chat_burst=settings.OUTBOUND_CHAT_BURST,
+        max_retries=settings.OUTBOUND_MAX_RETRIES,
+    ))
+    # Время операций FSM — в метрике fsm_storage_seconds
+    dp = Dispatcher(storage=TimedStorage(MemoryStorage()))
+
+    # Трасса апдейта (выборочно, см. tracing.py): самой первой, чтобы видеть и ожидание в очередях
+    dp.update.outer_middleware(TracingMiddleware())
+    dp.update.outer_middleware(FirstUpdateMiddleware(_STARTED))
+    # Новое действие пользователя отменяет его же устаревшее: когда планировщик принял апдейт,
+    # но до постановки в очередь чата
+    dp.update.outer_middleware(SupersedeMiddleware())
+    # Очередь апдейтов по чатам и глобальный лимит параллельных хендлеров
+    dp.update.outer_middleware(SchedulerMiddleware(
+        max_concurrency=settings.SCHED_MAX_CONCURRENCY,
+        max_queue_per_chat=settings.SCHED_MAX_QUEUE_PER_CHAT,
+        max_waiting=settings.SCHED_MAX_WAITING,
+    ))
+    dp.update.outer_middleware(ApiBudgetMiddleware(budget=settings.BOT_API_CALLS_BUDGET))
+
+    # Время и ошибки хендлеров по роутеру и функции (первым: меряет хендлер вместе с остальными middleware)
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
+    dp.inline_query.middleware(HandlerMetricsMiddleware())
 
     # Middlewares для логирования и "печатает..."
     dp.message.middleware(LoggingMiddleware())
     dp.callback_query.middleware(LoggingMiddleware())
-    dp.message.middleware(TypingMiddleware())
-    dp.callback_query.middleware(TypingMiddleware())
+    dp.message.middleware(TypingMiddleware(settings.TYPING_DELAY_MS))
+    dp.callback_query.middleware(TypingMiddleware(settings.TYPING_DELAY_MS))
 
     # ПРАВИЛЬНЫЙ ПОРЯДОК:
-    # Сначала подключаем роутер с состояниями (FSM)
+    # Команды администраторов — раньше всех (для остальных роутер прозрачен)
+    dp.include_router(admin_router.router)
+    # Затем подключаем роутер с состояниями (FSM)
     dp.include_router(influencers.router)
     # А затем - общий роутер для сообщений без состояния
     dp.include_router(common_router.router)
 
+    # Оповещения по сохранённым поискам: своя очередь и свой темп отправки
+    alerts.start(bot)
+
+    # Polling стартует сразу; каталог, Sheets и OpenAI догружаются в фоне (см. startup.py)
+    if settings.STARTUP_WARMUP:
+        warmup()
+
+    metrics_server = None
+    if settings.METRICS_PORT:
+        metrics_server = await start_http_server(settings.METRICS_HOST, settings.METRICS_PORT)
+        log.info("Метрики: http://%s:%d/metrics", settings.METRICS_HOST, settings.METRICS_PORT)
+
+    tracer.start()
+    # Задержка loop и стеки блокирующего кода (см. watchdog.py)
+    if settings.LOOP_WATCHDOG_ENABLED:
+        watchdog.start()
+
     log.info("Starting polling… (START_MODE=%s)", settings.START_MODE)
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    try:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        watchdog.stop()
+        exporter.shutdown()
+        alerts.shutdown()
+        await tracer.stop()
+        stop_logging()
 
 
 if __name__ == "__main__":
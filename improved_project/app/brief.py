@@ -0,0 +1,268 @@
+# app/brief.py
+"""
+Бриф одним сообщением: «Алматы, мамы-блогеры 25–35, до 50k подписчиков, бюджет 200k» -> все фильтры подбора.
+
+Сообщение режется на фрагменты по запятым, «;» и переводам строк. Числа в каждом фрагменте
+классифицируются по соседним словам (подписчики, бюджет/тенге, лет), перечислимые фильтры
+(язык, пол, семейное положение, дети, форматы) — по словарю слов, а остаток текста — это города
+и тематики, которые разрешает канонизатор каталога (синонимы, латиница, опечатки).
+Нераспознанный остаток, если он есть, дополнительно разбирает ИИ-роутер (router_postreg_prompt.txt).
+"""
+from __future__ import annotations
+
+import logging
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+log = logging.getLogger(__name__)
+
+_SEGMENT_SPLIT_RE = re.compile(r"[;\n]+|,(?!\d)")
+_DIGIT_GROUP_RE = re.compile(r"(?<=\d)[   ](?=\d{3}\b)")
+_NUM = r"\d+(?:[.,]\d+)?(?:\s*(?:млн|m|тыс[а-я]*\.?|k|к)(?![а-яёa-z]))?"
+# «30+» — первой альтернативой: иначе общий шаблон съел бы «30» и плюс потерялся бы
+_NUMBER_RE = re.compile(rf"\d+\+|(?:(?:от|до|>=?|<=?)\s*)?{_NUM}(?:\s*(?:-|до)\s*{_NUM})?")
+_SUFFIX_RE = re.compile(r"\d\s*(?:млн|m|тыс|k|к)")
+
+# Ключевые слова рядом с числом -> какой это фильтр
+_NUMBER_KINDS: Tuple[Tuple[str, re.Pattern], ...] = (
+    ("followers", re.compile(r"подп\w*|фоллов\w*|follower\w*|охват\w*|аудитор\w*")),
+    ("budget", re.compile(r"бюджет\w*|тенге|тг|₸|kzt|цен\w*|стоим\w*|оплат\w*")),
+    ("age", re.compile(r"лет|год\w*|возраст\w*")),
+)
+_KEYWORDS_RE = re.compile(
+    r"\b(?:" + "|".join(rx.pattern for _, rx in _NUMBER_KINDS) + r")\b"
+)
+
+_CHILDREN_COUNT_RE = re.compile(r"(\d+)\s*(?:детьми|детей|ребен\w*|ребён\w*)")
+_FLAGS: Tuple[Tuple[str, Any, re.Pattern], ...] = (
+    # порядок важен: «не замужем» раньше «замужем», семейное положение раньше пола («замужем» ⊃ «муж»)
+    ("marital", "не замужем/не женат", re.compile(r"\bне\s+(?:замуж\w*|женат\w*)|\bхолост\w*|\bсвободн\w*")),
+    ("marital", "замужем/женат", re.compile(r"\bзамуж\w*|\bженат\w*")),
+    ("marital", "разведен(а)", re.compile(r"\bразвед\w*")),
+    ("has_children", False, re.compile(r"\bбез\s+детей")),
+    ("has_children", True, re.compile(r"\bс\s+детьми|\bесть\s+дети|\bс\s+ребенком|\bс\s+ребёнком")),
+    ("language", "Двуязычный", re.compile(r"\bдвуязычн\w*|\bна\s+двух\s+языках")),
+    ("language", "Казахский", re.compile(r"\bказах\w*|\bқазақ\w*|\bkazakh\w*")),
+    ("language", "Русский", re.compile(r"\bрусск\w*|\bрусскоязычн\w*|\brussian\w*")),
+    ("gender", "ж", re.compile(r"\bженщин\w*|\bдевуш\w*|\bдевочк\w*|\bблогерш\w*|\bженск\w*|\bжен\b")),
+    ("gender", "м", re.compile(r"\bмужчин\w*|\bпарн\w*|\bпарен\w*|\bмужск\w*|\bмуж\b")),
+)
+_FORMATS_RE = re.compile(r"\b(stories|сторис|reels|рилс\w*|posts?|посты?|постов)\b")
+_FORMAT_NAMES = {"с": "stories", "s": "stories", "r": "reels", "р": "reels", "p": "post", "п": "post"}
+
+# Слова, которые не несут фильтра и не должны уходить ни в поиск городов/тематик, ни в ИИ
+_STOPWORDS = {
+    "и", "или", "в", "во", "из", "для", "с", "со", "на", "по", "а", "от", "до", "не", "нужны", "нужен",
+    "нужно", "ищу", "ищем", "надо", "хочу", "хотим", "подбор", "подберите", "найди", "найдите",
+    "блогер", "блогеры", "блогеров", "блогера", "инфлюенсер", "инфлюенсеры", "инфлюенсеров",
+    "город", "города", "городе", "тематика", "тематики", "тема", "темы", "ниша", "примерно", "около",
+    "тысяч", "тыс", "человек", "людей", "язык", "языке", "языком", "контент", "формат", "форматы",
+}
+_WORD_SPLIT_RE = re.compile(r"[\s/+&()«»\"'.!?]+")
+_MAX_NGRAM = 3
+
+
+class Brief:
+    """Фильтры, разобранные из одного сообщения. Города и тематики — id словарей каталога."""
+
+    __slots__ = ("cities", "topics", "age_text", "followers_text", "budget_text", "language", "gender",
+                 "marital", "has_children", "children_count", "formats", "leftovers")
+
+    def __init__(self) -> None:
+        self.cities: List[int] = []
+        self.topics: List[int] = []
+        self.age_text: Optional[str] = None
+        self.followers_text: Optional[str] = None
+        self.budget_text: Optional[str] = None
+        self.language: Optional[str] = None
+        self.gender: Optional[str] = None
+        self.marital: Optional[str] = None
+        self.has_children: Optional[bool] = None
+        self.children_count: Optional[str] = None
+        self.formats: Optional[str] = None
+        self.leftovers: List[str] = []
+
+    def missing(self) -> List[str]:
+        """Обязательные фасеты, которых в брифе нет."""
+        return [facet for facet, ids in (("city", self.cities), ("topic", self.topics)) if not ids]
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, f) for f in self.__slots__ if f != "leftovers") and self.has_children is None
+
+    def state_data(self) -> Dict[str, Any]:
+        """Ключи FSM в том виде, в каком их заполняет пошаговый подбор."""
+        return {
+            "brief": True,
+            "sel_cities": sum(1 << i for i in self.cities),
+            "sel_topics": sum(1 << i for i in self.topics),
+            "age_text": self.age_text,
+            "followers_text": self.followers_text,
+            "budget_text": self.budget_text,
+            "language": self.language,
+            "gender": self.gender,
+            "marital": self.marital,
+            "has_children": self.has_children,
+            "children_count": self.children_count,
+            "formats": self.formats,
+        }
+
+    def describe(self, cat: "Catalog") -> str:
+        parts = [", ".join(cat.cities.values[i] for i in self.cities),
+                 ", ".join(cat.topics.values[i] for i in self.topics)]
+        if self.age_text:
+            parts.append(f"возраст {self.age_text}")
+        if self.followers_text:
+            parts.append(f"подписчики {self.followers_text}")
+        if self.budget_text:
+            parts.append(f"бюджет {self.budget_text}")
+        if self.language:
+            parts.append(f"язык: {self.language.lower()}")
+        if self.gender:
+            parts.append("женщины" if self.gender == "ж" else "мужчины")
+        if self.marital:
+            parts.append(self.marital)
+        if self.has_children is not None:
+            parts.append(f"детей: {self.children_count}" if self.children_count
+                         else "с детьми" if self.has_children else "без детей")
+        if self.formats:
+            parts.append(self.formats)
+        return " · ".join(p for p in parts if p)
+
+
+def _range_text(lo: Optional[int], hi: Optional[int]) -> Optional[str]:
+    if lo is not None and hi is not None:
+        return f"{lo}-{hi}"
+    if lo is not None:
+        return f"от {lo}"
+    if hi is not None:
+        return f"до {hi}"
+    return None
+
+
+def _classify_number(before: str, after: str) -> Optional[str]:
+    # Сначала слово сразу после числа («50k подписчиков», «25 лет»), затем перед ним («бюджет 200k»)
+    for words in (" ".join(after.split()[:2]), " ".join(before.split()[-2:])):
+        for kind, rx in _NUMBER_KINDS:
+            if rx.search(words):
+                return kind
+    return None
+
+
+def _parse_numbers(seg: str, brief: Brief) -> str:
+    """Разбирает числа фрагмента; возвращает фрагмент без них."""
+    matches = list(_NUMBER_RE.finditer(seg))
+    for i, m in enumerate(matches):
+        before = seg[matches[i - 1].end() if i else 0:m.start()]
+        after = seg[m.end():matches[i + 1].start() if i + 1 < len(matches) else len(seg)]
+        value = m.group(0).strip()
+        kind = _classify_number(before, after)
+        if kind is None and not _SUFFIX_RE.search(value) and all(int(n) < 100 for n in re.findall(r"\d+", value)):
+            # «25-35», «до 30» без пояснений — это возраст: подписчики и бюджет меньше сотни не бывают
+            kind = "age"
+        field = {"followers": "followers_text", "budget": "budget_text", "age": "age_text"}.get(kind)
+        if field is None or getattr(brief, field):
+            brief.leftovers.append(value)
+        else:
+            setattr(brief, field, value)
+    return _NUMBER_RE.sub(" ", seg)
+
+
+def _parse_names(words: List[str], cat: "Catalog", brief: Brief) -> None:
+    """Жадно сопоставляет слова (и пары/тройки слов) городам и тематикам."""
+    i = 0
+    while i < len(words):
+        for n in range(min(_MAX_NGRAM, len(words) - i), 0, -1):
+            phrase = " ".join(words[i:i + n])
+            # Опечатки прощаем только одиночным словам: у склеенных фраз слишком много ложных совпадений
+            fuzzy = n == 1 and len(phrase) >= 4
+            hit = False
+            for facet, ids in (("city", brief.cities), ("topic", brief.topics)):
+                item_id = cat.canonicalizer(facet).resolve(phrase, fuzzy=fuzzy)
+                if item_id is not None:
+                    if item_id not in ids:
+                        ids.append(item_id)
+                    hit = True
+                    break
+            if hit:
+                i += n
+                break
+        else:
+            if len(words[i]) >= 3:
+                brief.leftovers.append(words[i])
+            i += 1
+
+
+def parse_brief(text: str, cat: "Catalog") -> Brief:
+    """Детерминированный разбор брифа, без сети. Нераспознанное складывается в brief.leftovers."""
+    brief = Brief()
+    t = _DIGIT_GROUP_RE.sub("", text.lower()).replace("ё", "е")
+    t = t.replace("—", "-").replace("–", "-").replace("−", "-")
+    formats: List[str] = []
+    for seg in _SEGMENT_SPLIT_RE.split(t):
+        m = _CHILDREN_COUNT_RE.search(seg)
+        if m:
+            brief.has_children = True
+            brief.children_count = "more" if int(m.group(1)) > 4 else m.group(1)
+            seg = seg[:m.start()] + " " + seg[m.end():]
+        for field, value, rx in _FLAGS:
+            if rx.search(seg):
+                if getattr(brief, field) is None:
+                    setattr(brief, field, value)
+                seg = rx.sub(" ", seg)
+        for fm in _FORMATS_RE.finditer(seg):
+            name = _FORMAT_NAMES[fm.group(1)[0]]
+            if name not in formats:
+                formats.append(name)
+        seg = _FORMATS_RE.sub(" ", seg)
+        seg = _parse_numbers(seg, brief)
+        seg = _KEYWORDS_RE.sub(" ", seg)
+        words = [w for w in _WORD_SPLIT_RE.split(seg) if w and w not in _STOPWORDS and not w.isdigit()]
+        _parse_names(words, cat, brief)
+    brief.formats = ", ".join(formats) or None
+    return brief
+
+
+def _merge_router_updates(brief: Brief, updates: Dict[str, Any], cat: "Catalog") -> None:
+    # Явно разобранное детерминированно не перетираем: ИИ только дополняет
+    for facet, ids in (("city", brief.cities), ("topic", brief.topics)):
+        for item_id in cat.resolve(facet, updates.get("cities" if facet == "city" else "topics") or []):
+            if item_id not in ids:
+                ids.append(item_id)
+    for key, field in (("age_range", "age_text"), ("followers_range", "followers_text")):
+        rng = updates.get(key)
+        if isinstance(rng, dict) and getattr(brief, field) is None:
+            setattr(brief, field, _range_text(rng.get("min"), rng.get("max")))
+    price = updates.get("price_range")
+    if isinstance(price, dict) and brief.budget_text is None and price.get("max") is not None:
+        brief.budget_text = f"до {price['max']}"
+    for key in ("language", "gender"):
+        value = updates.get(key)
+        if value and getattr(brief, key) is None:
+            for field, flag_value, rx in _FLAGS:
+                if field == key and rx.search(str(value).lower()):
+                    setattr(brief, key, flag_value)
+                    break
+
+
+async def complete_brief(brief: Brief, text: str, cat: "Catalog") -> Brief:
+    """Если детерминированный разбор что-то не понял, отдаёт сообщение ИИ-роутеру и дополняет бриф."""
+    if not brief.leftovers:
+        return brief
+    from .ai_logic import route_user_message_postreg
+
+    filters = {
+        "cities": [cat.cities.values[i] for i in brief.cities],
+        "topics": [cat.topics.values[i] for i in brief.topics],
+        "age": brief.age_text, "followers": brief.followers_text, "budget": brief.budget_text,
+        "language": brief.language, "gender": brief.gender,
+    }
+    result = await route_user_message_postreg(text, filters, pending_step="brief")
+    updates = (result or {}).get("updates")
+    if isinstance(updates, dict):
+        _merge_router_updates(brief, updates, cat)
+    else:
+        log.debug("Бриф: ИИ-роутер не вернул обновлений, остаток %s", brief.leftovers)
+    return brief
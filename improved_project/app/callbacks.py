@@ -0,0 +1,38 @@
+# app/callbacks.py
+"""
+Компактный формат callback_data для пикеров городов и тематик.
+
+Вместо текста значения (`city:pick:<название города>`, риск упереться в лимит 64 байта)
+в кнопку кладётся короткий id из Vocabulary текущей версии каталога:
+
+    city:p:17    выбрать/снять значение с id 17
+    city:g:2     перейти на страницу 2
+    city:d       готово
+
+Версия каталога закрепляется в FSM при открытии пикера, поэтому в callback её не передаём.
+"""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+PICK = "p"
+PAGE = "g"
+DONE = "d"
+
+
+def encode(prefix: str, action: str, arg: Optional[int] = None) -> str:
+    if arg is None:
+        return f"{prefix}:{action}"
+    return f"{prefix}:{action}:{arg}"
+
+
+def decode(data: str) -> Tuple[str, str, Optional[int]]:
+    """`city:p:17` -> ("city", "p", 17). Битые данные дают action == ""."""
+    prefix, _, rest = data.partition(":")
+    action, _, raw = rest.partition(":")
+    if not raw:
+        return prefix, action, None
+    try:
+        return prefix, action, int(raw)
+    except ValueError:
+        return prefix, "", None
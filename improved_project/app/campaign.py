@@ -0,0 +1,131 @@
+# app/campaign.py
+"""
+Сборка кампании под общий бюджет: какой набор блогеров даёт максимальный суммарный охват.
+
+Это задача о рюкзаке (вес — price, ценность — оценка охвата, см. Ranker.reach). Решаем в три шага:
+  1. жадно по охвату на тенге — O(n log n), плюс лучший одиночный блогер (гарантия ≥ 1/2 оптимума);
+  2. верхняя граница — дробная (LP) релаксация того же жадного порядка: по ней видно, насколько
+     решение далеко от оптимума;
+  3. если зазор есть и время осталось — динамика по бюджету, округлённому до CAMPAIGN_DP_RESOLUTION
+     делений (цены округляются вверх, поэтому найденный набор укладывается и в настоящий бюджет),
+     векторно по NumPy на CAMPAIGN_DP_MAX_ITEMS лучших по охвату на тенге кандидатах.
+Динамика проверяет дедлайн CAMPAIGN_TIME_BUDGET_MS и при его превышении отдаёт жадное решение.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+
+from .config import settings
+from .metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+log = logging.getLogger(__name__)
+
+SOLVE_SECONDS = Histogram("campaign_solve_seconds", "Время сборки кампании под бюджет")
+SOLUTIONS_TOTAL = Counter("campaign_solutions_total", "Каким методом получено итоговое решение", ["method"])
+
+# Как часто динамика сверяется с дедлайном (в кандидатах)
+_DEADLINE_CHECK_EVERY = 32
+
+
+class Campaign:
+    """Выбранные строки каталога (по убыванию охвата), их стоимость и охват, верхняя граница охвата."""
+
+    __slots__ = ("rows", "cost", "reach", "upper_bound", "method")
+
+    def __init__(self, rows: np.ndarray, cost: float, reach: float, upper_bound: float, method: str) -> None:
+        self.rows = rows
+        self.cost = cost
+        self.reach = reach
+        self.upper_bound = upper_bound
+        self.method = method
+
+    @property
+    def gap(self) -> float:
+        """Насколько (в долях) решение может уступать оптимуму."""
+        return 0.0 if not self.upper_bound else max(0.0, 1.0 - self.reach / self.upper_bound)
+
+
+def _greedy(price: np.ndarray, reach: np.ndarray, budget: float):
+    """Жадный набор по убыванию охвата на тенге и LP-граница. Индексы — в массивах price/reach."""
+    order = np.argsort(-(reach / price), kind="stable")
+    cum = np.cumsum(price[order])
+    cut = int(np.searchsorted(cum, budget, side="right"))
+    chosen = list(order[:cut])
+    spent = float(cum[cut - 1]) if cut else 0.0
+    upper = float(reach[order[:cut]].sum())
+    if cut < len(order):
+        # Дробная часть первого не влезшего — граница релаксации
+        nxt = order[cut]
+        upper += float(reach[nxt] * (budget - spent) / price[nxt])
+        # Остаток бюджета добираем теми, кто ещё влезает
+        for i in order[cut + 1:]:
+            if spent + price[i] <= budget:
+                chosen.append(i)
+                spent += float(price[i])
+    return np.asarray(chosen, dtype=np.int64), order, upper
+
+
+def _dp(price: np.ndarray, reach: np.ndarray, budget: float, deadline: float) -> Optional[np.ndarray]:
+    """Рюкзак по округлённым ценам; None — не успели до дедлайна."""
+    units = settings.CAMPAIGN_DP_RESOLUTION
+    unit = budget / units
+    weights = np.ceil(price / unit - 1e-9).astype(np.int64)
+    best = np.zeros(units + 1)
+    take = np.zeros((len(price), units + 1), dtype=bool)
+    for i, (w, v) in enumerate(zip(weights.tolist(), reach.tolist())):
+        if i % _DEADLINE_CHECK_EVERY == 0 and time.perf_counter() > deadline:
+            return None
+        if w > units:
+            continue
+        candidate = best[:units + 1 - w] + v
+        better = candidate > best[w:]
+        take[i, w:] = better
+        best[w:] = np.where(better, candidate, best[w:])
+    chosen = []
+    cap = int(np.argmax(best))
+    for i in range(len(price) - 1, -1, -1):
+        if take[i, cap]:
+            chosen.append(i)
+            cap -= int(weights[i])
+    return np.asarray(chosen, dtype=np.int64)
+
+
+def build_campaign(cat: "Catalog", rows: np.ndarray, budget: float) -> Campaign:
+    """Набор строк rows с максимальным суммарным охватом при сумме price не больше budget."""
+    started = time.perf_counter()
+    deadline = started + settings.CAMPAIGN_TIME_BUDGET_MS / 1000
+    rows = np.asarray(rows, dtype=np.int64)
+    price = cat.filter_index().price[rows]
+    reach = cat.ranker().reach[rows]
+    ok = (price > 0) & (price <= budget) & (reach > 0)
+    rows, price, reach = rows[ok], price[ok], reach[ok]
+    if not len(rows):
+        return Campaign(rows, 0.0, 0.0, 0.0, "empty")
+
+    chosen, order, upper = _greedy(price, reach, budget)
+    method, value = "greedy", float(reach[chosen].sum())
+    single = int(np.argmax(reach))
+    if reach[single] > value:
+        chosen, method, value = np.asarray([single]), "single", float(reach[single])
+
+    if value < upper * (1 - 1e-6):
+        # Динамика по лучшим по охвату на тенге: остальные в оптимум почти не попадают
+        top = order[:settings.CAMPAIGN_DP_MAX_ITEMS]
+        picked = _dp(price[top], reach[top], budget, deadline)
+        if picked is None:
+            log.debug("Кампания: динамика не уложилась в %d мс, отдаём жадное решение",
+                      settings.CAMPAIGN_TIME_BUDGET_MS)
+        elif reach[top[picked]].sum() > value:
+            chosen, method, value = top[picked], "dp", float(reach[top[picked]].sum())
+
+    chosen = chosen[np.argsort(-reach[chosen], kind="stable")]
+    SOLVE_SECONDS.observe(time.perf_counter() - started)
+    SOLUTIONS_TOTAL.labels(method).inc()
+    return Campaign(rows[chosen], float(price[chosen].sum()), value, max(upper, value), method)
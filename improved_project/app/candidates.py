@@ -0,0 +1,215 @@
+# app/candidates.py
+"""
+Пошаговое сужение кандидатов подбора.
+
+Фильтры собираются по шагам (города -> тематики -> возраст -> язык -> ...). Вместо того чтобы
+в конце пересчитывать всё заново, каждый шаг пересекает битовую карту строк каталога, которая
+хранится в FSM-сессии пользователя (ключ "cand", упакованные байты; None — все строки).
+Итоговый запрос — это последнее пересечение, а «подходит N блогеров» — popcount карты.
+
+FilterIndex строится один раз на снимок каталога (см. Catalog.filter_index): колонки заранее
+приведены к числам/кодам значений, возраст разобран по строкам, порядок по свежести посчитан.
+Маски отдельных фильтров кешируются — одинаковые шаги у разных пользователей не пересчитываются.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+# Сколько масок отдельных фильтров держим на снимок (маска 100k строк — 100 КБ)
+_MASK_CACHE_SIZE = 256
+
+# Значения колонки marital_status для каждого варианта фильтра
+MARITAL_VALUES = {
+    "married": ("женат", "замужем"),
+    "single": ("не женат", "не замужем"),
+    "divorced": ("разведен", "разведена"),
+}
+
+
+def pack(mask: np.ndarray) -> bytes:
+    return np.packbits(mask).tobytes()
+
+
+def unpack(bits: bytes, size: int) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(bits, dtype=np.uint8), count=size).astype(bool)
+
+
+def count(bits: Optional[bytes], size: int) -> int:
+    """Сколько строк в карте; None — все строки."""
+    if bits is None:
+        return size
+    return int.from_bytes(bits, "little").bit_count()
+
+
+class FilterIndex:
+    """Колонки снимка, подготовленные для векторных фильтров, и кеш масок."""
+
+    def __init__(self, cat: "Catalog") -> None:
+        import pandas as pd
+
+        from .influencers import parse_age_range
+
+        self.cat = cat
+        df = cat.df
+        n = self.size = len(df)
+
+        def categorical(col: str) -> Tuple[np.ndarray, List[str]]:
+            # Различных значений единицы: приводим к нижнему регистру их, а не каждую строку;
+            # фильтр проверяет значения, а строки сравниваются по коду
+            if col not in df.columns:
+                return np.zeros(n, dtype=np.int64), [""]
+            codes, uniques = pd.factorize(df[col])
+            values = ["" if pd.isna(u) else str(u).strip().lower() for u in uniques]
+            codes = np.where(codes < 0, len(values), codes)
+            return codes, values + [""]
+
+        def number(col: str) -> np.ndarray:
+            if col not in df.columns:
+                return np.full(n, np.nan)
+            return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+
+        self.language = categorical("language")
+        self.gender = categorical("gender")
+        self.marital = categorical("marital_status")
+        self.followers = number("followers")
+        self.price = number("price")
+        self.children = np.nan_to_num(number("children_count"), nan=0.0)
+
+        # Возраст в ячейке — число («27») или диапазон («25-30», «до 30»): разбираем один раз
+        age_codes, age_values = categorical("age")
+        has_age = np.zeros(len(age_values), dtype=bool)
+        age_lo = np.full(len(age_values), np.nan)
+        age_hi = np.full(len(age_values), np.nan)
+        for i, cell in enumerate(age_values):
+            if not cell:
+                continue
+            rng = (int(cell), int(cell)) if cell.isdigit() else parse_age_range(cell)
+            if rng is None:
+                continue
+            has_age[i] = True
+            if rng[0] is not None:
+                age_lo[i] = rng[0]
+            if rng[1] is not None:
+                age_hi[i] = rng[1]
+        self.has_age, self.age_lo, self.age_hi = has_age[age_codes], age_lo[age_codes], age_hi[age_codes]
+
+        # Порядок по свежести: новые обновления выше, при равенстве — больше подписчиков; пустые в конце.
+        # Ранжирование (ranking.py) разрешает им равные очки
+        if "updated_at" in df.columns:
+            ts = pd.to_datetime(df["updated_at"], errors="coerce")
+            ts_key = np.where(ts.isna(), np.inf, -ts.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(float))
+        else:
+            ts_key = np.zeros(n)
+        followers_key = np.where(np.isnan(self.followers), np.inf, -self.followers)
+        self.order = np.lexsort((followers_key, ts_key))
+
+        self._masks: "OrderedDict[Hashable, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- маски отдельных фильтров ---
+
+    def _cached(self, key: Hashable, build) -> np.ndarray:
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = build()
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > _MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    @staticmethod
+    def _match(column: Tuple[np.ndarray, List[str]], pred) -> np.ndarray:
+        codes, values = column
+        return np.isin(codes, [i for i, v in enumerate(values) if pred(v)])
+
+    def _facet_mask(self, facet: str, values: List[str]) -> np.ndarray:
+        ids = tuple(sorted(self.cat.resolve(facet, values)))
+
+        def build() -> np.ndarray:
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self.cat.rows_for(facet, ids)] = True
+            return mask
+
+        return self._cached((facet, ids), build)
+
+    def _age_mask(self, lo: Optional[int], hi: Optional[int]) -> np.ndarray:
+        def build() -> np.ndarray:
+            # Ячейка подходит, если её возраст/диапазон пересекается с запрошенным
+            mask = self.has_age.copy()
+            if lo is not None:
+                mask &= ~(self.age_hi < lo) | np.isnan(self.age_lo)
+            if hi is not None:
+                mask &= ~(self.age_lo > hi)
+            return mask
+
+        return self._cached(("age", lo, hi), build)
+
+    def masks(self, *, city: Optional[List[str]] = None, topic: Optional[List[str]] = None,
+              age_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+              gender: Optional[str] = None, language: Optional[str] = None,
+              marital_status: Optional[str] = None, has_children: Optional[bool] = None,
+              children_count: Optional[str] = None,
+              followers_min: Optional[int] = None, followers_max: Optional[int] = None,
+              budget_max: Optional[int] = None, **_: Any) -> List[np.ndarray]:
+        """Маски заданных фильтров (аргументы — как у query_influencers)."""
+        out: List[np.ndarray] = []
+        if city:
+            out.append(self._facet_mask("city", city))
+        if topic:
+            out.append(self._facet_mask("topic", topic))
+        if language:
+            lang = language.strip().lower()
+            out.append(self._cached(("language", lang),
+                                    lambda: self._match(self.language, lambda v: lang in v)))
+        if gender:
+            g = gender.strip().lower()[:1]
+            out.append(self._cached(("gender", g), lambda: self._match(self.gender, lambda v: v.startswith(g))))
+        if marital_status in MARITAL_VALUES:
+            out.append(self._cached(("marital", marital_status),
+                                    lambda: self._match(self.marital, lambda v: v in MARITAL_VALUES[marital_status])))
+        if has_children is not None:
+            out.append(self._cached(("has_children", has_children),
+                                    lambda: self.children > 0 if has_children else self.children == 0))
+        if children_count == "more":
+            out.append(self._cached(("children", "more"), lambda: self.children > 4))
+        elif children_count and children_count.isdigit():
+            out.append(self._cached(("children", children_count), lambda: self.children == int(children_count)))
+        if age_range:
+            out.append(self._age_mask(*age_range))
+        if followers_min is not None:
+            out.append(self._cached(("followers_min", followers_min),
+                                    lambda: np.nan_to_num(self.followers, nan=-1) >= followers_min))
+        if followers_max is not None:
+            out.append(self._cached(("followers_max", followers_max),
+                                    lambda: np.nan_to_num(self.followers, nan=10 ** 12) <= followers_max))
+        if budget_max is not None:
+            out.append(self._cached(("budget_max", budget_max),
+                                    lambda: np.nan_to_num(self.price, nan=10 ** 12) <= budget_max))
+        return out
+
+    # --- карта кандидатов сессии ---
+
+    def evaluate(self, bits: Optional[bytes] = None, **filters: Any) -> np.ndarray:
+        """Пересечение карты bits (None — все строки) с масками фильтров."""
+        mask = np.ones(self.size, dtype=bool) if bits is None else unpack(bits, self.size)
+        for m in self.masks(**filters):
+            mask &= m
+        return mask
+
+    def narrow(self, bits: Optional[bytes], **filters: Any) -> Optional[bytes]:
+        """Следующий шаг подбора: карта, суженная новыми фильтрами. Без фильтров — та же карта."""
+        if not self.masks(**filters):
+            return bits
+        return pack(self.evaluate(bits, **filters))
@@ -0,0 +1,168 @@
+# app/canon.py
+"""
+Канонизация городов и тематик: «Алматы» = «Almaty» = «Алма-Ата», «бьюти» = «beauty».
+
+Каждое написание сводится к ключу: нижний регистр, без пробелов/дефисов/знаков, латиница
+транслитерирована в кириллицу, а известные синонимы заменены по таблице ALIASES.
+Значения каталога канонизируются один раз при загрузке снимка (см. catalog.Catalog),
+пользовательский ввод — один раз на запрос через Canonicalizer.resolve. Опечатки, которых
+нет в таблице, ловит триграммный индекс по ключам словаря.
+"""
+from __future__ import annotations
+
+import re
+from difflib import SequenceMatcher
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Optional, Set
+
+if TYPE_CHECKING:
+    from .catalog import Vocabulary
+
+# Каноническое написание -> известные синонимы и варианты написания
+ALIASES: Dict[str, List[str]] = {
+    # города
+    "Алматы": ["Almaty", "Алма-Ата", "Alma-Ata", "Алмата"],
+    "Астана": ["Astana", "Нур-Султан", "Nur-Sultan", "Акмола", "Целиноград"],
+    "Шымкент": ["Shymkent", "Чимкент", "Shymkent city"],
+    "Караганда": ["Karaganda", "Қарағанды", "Караганды"],
+    "Актобе": ["Aktobe", "Ақтөбе", "Актюбинск"],
+    "Усть-Каменогорск": ["Oskemen", "Өскемен", "Оскемен", "Ust-Kamenogorsk"],
+    "Семей": ["Semey", "Семипалатинск"],
+    "Уральск": ["Oral", "Орал", "Uralsk"],
+    "Кызылорда": ["Kyzylorda", "Қызылорда"],
+    "Атырау": ["Atyrau"],
+    "Тараз": ["Taraz", "Джамбул"],
+    "Павлодар": ["Pavlodar"],
+    "Костанай": ["Kostanay", "Қостанай", "Кустанай"],
+    "Петропавловск": ["Petropavl", "Петропавл"],
+    "Актау": ["Aktau", "Ақтау"],
+    "Талдыкорган": ["Taldykorgan", "Талдықорған"],
+    # тематики
+    "бьюти": ["beauty", "красота", "бьюти-блог", "макияж", "makeup"],
+    "мода": ["fashion", "стиль", "style"],
+    "мамы": ["мама", "мамы-блогеры", "мамочки", "материнство", "mom", "moms"],
+    "спорт": ["sport", "фитнес", "fitness", "зож"],
+    "еда": ["food", "кулинария", "рецепты", "foodblog"],
+    "путешествия": ["travel", "тревел", "туризм"],
+    "лайфстайл": ["lifestyle", "лайф-стайл"],
+    "авто": ["auto", "cars", "автомобили"],
+    "юмор": ["humor", "comedy", "приколы"],
+    "IT": ["айти", "tech", "технологии"],
+    "финансы": ["finance", "инвестиции"],
+    "образование": ["education", "обучение"],
+}
+
+_DIGRAPHS = (("shch", "щ"), ("sch", "щ"), ("sh", "ш"), ("ch", "ч"), ("zh", "ж"), ("kh", "х"),
+             ("ts", "ц"), ("ya", "я"), ("yu", "ю"), ("yo", "е"), ("ye", "е"))
+_LETTERS = str.maketrans({
+    "a": "а", "b": "б", "c": "к", "d": "д", "e": "е", "f": "ф", "g": "г", "h": "х", "i": "и",
+    "j": "ж", "k": "к", "l": "л", "m": "м", "n": "н", "o": "о", "p": "п", "q": "к", "r": "р",
+    "s": "с", "t": "т", "u": "у", "v": "в", "w": "в", "x": "кс", "y": "ы", "z": "з",
+    # казахские буквы -> ближайшие русские
+    "ә": "а", "ғ": "г", "қ": "к", "ң": "н", "ө": "о", "ұ": "у", "ү": "у", "һ": "х", "і": "и",
+    "ё": "е",
+})
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_LATIN_RE = re.compile(r"[a-z]")
+
+
+def _raw_key(text: str) -> str:
+    t = _NON_WORD_RE.sub("", str(text).lower())
+    if _LATIN_RE.search(t):
+        for src, dst in _DIGRAPHS:
+            t = t.replace(src, dst)
+    return t.translate(_LETTERS)
+
+
+_ALIAS_KEYS: Dict[str, str] = {}
+CANONICAL_DISPLAY: Dict[str, str] = {}
+for _canon, _aliases in ALIASES.items():
+    _ck = _raw_key(_canon)
+    CANONICAL_DISPLAY[_ck] = _canon
+    for _alias in _aliases:
+        _ALIAS_KEYS[_raw_key(_alias)] = _ck
+
+
+def canonical_key(text: str) -> str:
+    key = _raw_key(text)
+    return _ALIAS_KEYS.get(key, key)
+
+
+def group_values(raw_counts: Mapping[str, int]) -> Dict[str, str]:
+    """
+    Сопоставляет каждому исходному написанию каноническое отображаемое имя.
+    Для известных из ALIASES — каноническое написание, иначе самое частое написание группы.
+    """
+    by_key: Dict[str, Counter] = defaultdict(Counter)
+    for raw, n in raw_counts.items():
+        by_key[canonical_key(raw)][raw] += n
+    out: Dict[str, str] = {}
+    for key, spellings in by_key.items():
+        display = CANONICAL_DISPLAY.get(key) or spellings.most_common(1)[0][0]
+        for raw in spellings:
+            out[raw] = display
+    return out
+
+
+# Сколько лучших по триграммам ключей сравниваем посимвольно
+_MAX_CANDIDATES = 16
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Canonicalizer:
+    """Разрешает пользовательский ввод в id словаря одной версии каталога."""
+
+    def __init__(self, vocab: "Vocabulary", min_similarity: float = 0.75) -> None:
+        self._min_similarity = min_similarity
+        self._exact: Dict[str, int] = {}
+        for item_id, value in enumerate(vocab.values):
+            self._exact[canonical_key(value)] = item_id
+        for alias_key, canon_key in _ALIAS_KEYS.items():
+            if canon_key in self._exact:
+                self._exact.setdefault(alias_key, self._exact[canon_key])
+        # Триграммный индекс по всем известным ключам (значения + синонимы)
+        self._keys: List[str] = list(self._exact)
+        self._sizes: List[int] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for pos, key in enumerate(self._keys):
+            grams = trigrams(key)
+            self._sizes.append(len(grams))
+            for g in grams:
+                self._postings[g].append(pos)
+
+    def resolve(self, text: str, fuzzy: bool = True) -> Optional[int]:
+        key = canonical_key(text)
+        if not key:
+            return None
+        item_id = self._exact.get(key)
+        if item_id is not None or not fuzzy:
+            return item_id
+        # Опечатка: кандидаты — ключи с общими триграммами (лучшие по Жаккару),
+        # среди них выбираем самый похожий посимвольно. На коротких словах одна опечатка
+        # ломает половину триграмм, поэтому окончательное решение принимает SequenceMatcher.
+        grams = trigrams(key)
+        shared: Counter = Counter()
+        for g in grams:
+            for pos in self._postings.get(g, ()):
+                shared[pos] += 1
+        candidates = sorted(
+            shared, key=lambda pos: -shared[pos] / (len(grams) + self._sizes[pos] - shared[pos])
+        )[:_MAX_CANDIDATES]
+        best_pos, best_sim = None, self._min_similarity
+        for pos in candidates:
+            sim = SequenceMatcher(None, key, self._keys[pos]).ratio()
+            if sim > best_sim:
+                best_pos, best_sim = pos, sim
+        return None if best_pos is None else self._exact[self._keys[best_pos]]
+
+    def resolve_many(self, texts: Iterable[str]) -> List[int]:
+        ids = []
+        for t in texts:
+            item_id = self.resolve(t)
+            if item_id is not None and item_id not in ids:
+                ids.append(item_id)
+        return ids
@@ -0,0 +1,333 @@
+# app/catalog.py
+"""
+Снимок каталога инфлюенсеров (лист influencers) с версией по содержимому.
+
+Раньше каждый list_cities / list_topics / query_influencers заново читал весь лист из Google Sheets.
+Теперь лист читается не чаще раза в CATALOG_TTL_SECONDS, а всё, что из него выводится
+(словари городов и тематик, индексы, кеши клавиатур), привязано к версии снимка:
+версия меняется только тогда, когда меняются данные.
+
+current() может сходить в Sheets, поэтому из асинхронного кода его зовут через asyncio.to_thread;
+get(version) и vocabulary() только смотрят в память.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import canon
+from .config import settings
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from .candidates import FilterIndex
+    from .ranking import Ranker
+    from .search import PrefixIndex
+    from .similar import SimilarIndex
+
+log = logging.getLogger(__name__)
+
+TOPIC_SPLIT_RE = re.compile(r"[;,/|]+|\s*,\s*")
+
+# Сколько последних снимков держим в памяти: пользователь, начавший подбор на старой версии,
+# должен суметь его закончить
+_HISTORY_SIZE = 4
+
+
+class CatalogExpired(LookupError):
+    """Снимок, закреплённый в FSM, вытеснен из памяти: id из его словарей больше не расшифровать."""
+
+
+def split_topics(raw: str) -> List[str]:
+    return [p.strip() for p in TOPIC_SPLIT_RE.split(str(raw)) if p.strip()]
+
+
+class Vocabulary:
+    """
+    Значения одного фасета (город, тематика) с короткими целыми id внутри версии каталога.
+
+    id — позиция в отсортированном списке, поэтому набор выбранных значений
+    удобно хранить битовой маской (бит i = значение с id i).
+    counts[i] — сколько блогеров в каталоге с этим значением.
+    """
+
+    __slots__ = ("facet", "version", "values", "counts", "_ids")
+
+    def __init__(self, facet: str, version: str, values: Iterable[str]) -> None:
+        self.facet = facet
+        self.version = version
+        freq = values if isinstance(values, Mapping) else Counter(values)
+        self.values: Tuple[str, ...] = tuple(sorted(freq, key=str.lower))
+        self.counts: Tuple[int, ...] = tuple(int(freq[v]) for v in self.values)
+        self._ids: Dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __hash__(self) -> int:
+        return hash((self.facet, self.version))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Vocabulary) and (self.facet, self.version) == (other.facet, other.version)
+
+    def id_of(self, value: str) -> Optional[int]:
+        return self._ids.get(value)
+
+    def value_of(self, item_id: int) -> Optional[str]:
+        if 0 <= item_id < len(self.values):
+            return self.values[item_id]
+        return None
+
+    def decode_mask(self, mask: int) -> List[str]:
+        out = []
+        while mask:
+            low = mask & -mask
+            item_id = low.bit_length() - 1
+            if item_id < len(self.values):
+                out.append(self.values[item_id])
+            mask ^= low
+        return out
+
+    def encode_mask(self, values: Iterable[str]) -> int:
+        mask = 0
+        for v in values:
+            item_id = self._ids.get(v)
+            if item_id is not None:
+                mask |= 1 << item_id
+        return mask
+
+
+class Catalog:
+    """
+    Неизменяемый снимок листа influencers. df не модифицируется после создания.
+
+    Города и тематики канонизируются при загрузке (см. canon.py): словари содержат канонические
+    имена, city_ids[row] — id города строки (-1, если пусто), row_topics[row] — id тематик строки,
+    а postings — отсортированные номера строк для каждого id. Поэтому фильтр по городу/тематике —
+    объединение нескольких массивов, а не проход по всем строкам.
+    """
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        # pandas — тяжёлый импорт: грузится с первым снимком каталога, а не при старте бота (см. startup.py)
+        import pandas as pd
+
+        self.df = df.reset_index(drop=True)
+        # Хеш каждой строки: из них складывается версия, по ним же видно, какие строки изменились
+        self.row_hashes = pd.util.hash_pandas_object(self.df, index=False).to_numpy()
+        self.version = content_version(self.df, self.row_hashes)
+        n = len(self.df)
+
+        raw_cities = (self.df["city"].fillna("").astype(str).str.strip().tolist()
+                      if "city" in self.df.columns else [""] * n)
+        city_display = canon.group_values(Counter(c for c in raw_cities if c))
+        self.cities = Vocabulary("city", self.version, Counter(city_display[c] for c in raw_cities if c))
+        city_id_of = {raw: self.cities.id_of(name) for raw, name in city_display.items()}
+        self.city_ids = np.fromiter((city_id_of.get(c, -1) for c in raw_cities), dtype=np.int32, count=n)
+
+        raw_topics = [split_topics(t) if t else [] for t in
+                      (self.df["topics"].fillna("").astype(str).tolist() if "topics" in self.df.columns else [""] * n)]
+        topic_display = canon.group_values(Counter(t for row in raw_topics for t in row))
+        row_topic_names = [{topic_display[t] for t in row} for row in raw_topics]
+        self.topics = Vocabulary("topic", self.version, Counter(t for row in row_topic_names for t in row))
+        self.row_topics: List[Tuple[int, ...]] = [
+            tuple(sorted(self.topics.id_of(t) for t in row)) for row in row_topic_names
+        ]
+
+        self._postings: Dict[str, List[np.ndarray]] = {
+            "city": _postings_from_ids(self.city_ids, len(self.cities)),
+            "topic": _postings_from_lists(self.row_topics, len(self.topics)),
+        }
+        self._canonicalizers: Dict[str, canon.Canonicalizer] = {}
+        self._prefix_indexes: Dict[str, "PrefixIndex"] = {}
+        self._filter_index: Optional["FilterIndex"] = None
+        self._ranker: Optional["Ranker"] = None
+        self._similar_index: Optional["SimilarIndex"] = None
+        self._username_rows: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def vocabulary(self, facet: str) -> Vocabulary:
+        return self.cities if facet == "city" else self.topics
+
+    def canonicalizer(self, facet: str) -> canon.Canonicalizer:
+        resolver = self._canonicalizers.get(facet)
+        if resolver is None:
+            resolver = self._canonicalizers[facet] = canon.Canonicalizer(self.vocabulary(facet))
+        return resolver
+
+    def resolve(self, facet: str, texts: Iterable[str]) -> List[int]:
+        """Пользовательские написания -> id словаря (с синонимами и исправлением опечаток)."""
+        return self.canonicalizer(facet).resolve_many(texts)
+
+    def row_of(self, username: str) -> Optional[int]:
+        """Строка блогера по username (без @, без учёта регистра)."""
+        if self._username_rows is None:
+            rows: Dict[str, int] = {}
+            if "username" in self.df.columns:
+                names = self.df["username"].fillna("").astype(str).str.strip().str.lstrip("@").str.lower()
+                for row, name in enumerate(names.tolist()):
+                    if name:
+                        rows.setdefault(name, row)
+            self._username_rows = rows
+        return self._username_rows.get(str(username).strip().lstrip("@").lower())
+
+    def changed_rows(self, previous: "Catalog") -> np.ndarray:
+        """Строки этого снимка, которых нет в previous (новые блогеры и изменённые строки)."""
+        return np.flatnonzero(~np.isin(self.row_hashes, previous.row_hashes))
+
+    def rows_for(self, facet: str, ids: Sequence[int]) -> np.ndarray:
+        """Отсортированные номера строк, у которых есть хотя бы одно из значений ids."""
+        postings = self._postings[facet]
+        arrays = [postings[i] for i in ids if 0 <= i < len(postings)]
+        if not arrays:
+            return np.empty(0, dtype=np.int64)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
+
+    def prefix_index(self, facet: str) -> "PrefixIndex":
+        """Префиксный индекс словаря; строится при первом обращении и живёт вместе со снимком."""
+        index = self._prefix_indexes.get(facet)
+        if index is None:
+            from .search import PrefixIndex
+            vocab = self.vocabulary(facet)
+            index = self._prefix_indexes[facet] = PrefixIndex(vocab, vocab.counts)
+        return index
+
+    def filter_index(self) -> "FilterIndex":
+        """Колонки для пошаговых фильтров (см. candidates.py); строятся при первом обращении."""
+        if self._filter_index is None:
+            from .candidates import FilterIndex
+            self._filter_index = FilterIndex(self)
+        return self._filter_index
+
+    def ranker(self) -> "Ranker":
+        """Признаки ранжирования (см. ranking.py); считаются при первом обращении."""
+        if self._ranker is None:
+            from .ranking import Ranker
+            self._ranker = Ranker(self)
+        return self._ranker
+
+    def similar_index(self) -> "SimilarIndex":
+        """Соседи для кнопки «Похожие» (см. similar.py); строятся при первом обращении."""
+        if self._similar_index is None:
+            from .similar import SimilarIndex
+            self._similar_index = SimilarIndex(self)
+        return self._similar_index
+
+    def prepare(self) -> None:
+        """Строит индексы снимка заранее, чтобы первые запросы к нему их не ждали."""
+        self.filter_index()
+        self.ranker()
+        self.similar_index()
+
+
+def _postings_from_ids(ids: np.ndarray, size: int) -> List[np.ndarray]:
+    order = np.argsort(ids, kind="stable")
+    bounds = np.searchsorted(ids[order], np.arange(size + 1))
+    return [order[bounds[i]:bounds[i + 1]].astype(np.int64) for i in range(size)]
+
+
+def _postings_from_lists(rows: Sequence[Tuple[int, ...]], size: int) -> List[np.ndarray]:
+    lists: List[List[int]] = [[] for _ in range(size)]
+    for row, ids in enumerate(rows):
+        for i in ids:
+            lists[i].append(row)
+    return [np.asarray(x, dtype=np.int64) for x in lists]
+
+
+def content_version(df: pd.DataFrame, row_hashes: Optional[np.ndarray] = None) -> str:
+    """Короткий хеш содержимого: одинаковые данные дают одинаковую версию и после перезапуска."""
+    h = hashlib.sha1(",".join(map(str, df.columns)).encode("utf-8"))
+    if len(df):
+        if row_hashes is None:
+            import pandas as pd
+
+            row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        h.update(row_hashes.tobytes())
+    return h.hexdigest()[:8]
+
+
+_lock = threading.Lock()
+_current: Optional[Catalog] = None
+_loaded_at = 0.0
+_history: "OrderedDict[str, Catalog]" = OrderedDict()
+
+
+def current() -> Catalog:
+    """Актуальный снимок; перечитывает лист, если снимок старше CATALOG_TTL_SECONDS."""
+    if _current is None or time.monotonic() - _loaded_at > settings.CATALOG_TTL_SECONDS:
+        return refresh(force=False)
+    return _current
+
+
+def get(version: Optional[str]) -> Optional[Catalog]:
+    """Снимок конкретной версии, если он ещё в памяти."""
+    if version is None:
+        return _current
+    return _history.get(version)
+
+
+def refresh(force: bool = True) -> Catalog:
+    """Перечитывает лист. force=False — только если снимок устарел (см. current())."""
+    global _current, _loaded_at
+    # Ленивый импорт: influencers сам пользуется каталогом
+    from .influencers import _read_influencers_worksheet
+
+    previous: Optional[Catalog] = None
+    built = False
+    with _lock:
+        # Пока ждали замок, снимок мог обновить другой поток
+        if not force and _current is not None and time.monotonic() - _loaded_at <= settings.CATALOG_TTL_SECONDS:
+            return _current
+        started = time.perf_counter()
+        cat = Catalog(_read_influencers_worksheet())
+        if _current is not None and cat.version == _current.version:
+            cat = _current
+        else:
+            built = True
+            _history[cat.version] = cat
+            while len(_history) > _HISTORY_SIZE:
+                _history.popitem(last=False)
+            # Результаты вытесненных версий больше никому не понадобятся
+            from .result_cache import results
+            results.retain(_history)
+            log.info("Каталог обновлён: версия %s, %d строк (%.0f мс)",
+                     cat.version, len(cat), (time.perf_counter() - started) * 1000)
+            previous = _current
+        _current = cat
+        _loaded_at = time.monotonic()
+
+    if built:
+        # Индексы — один раз на снимок (а не на каждый подбор), вне замка
+        cat.prepare()
+    if previous is not None:
+        # Новые/изменённые строки сверяются с сохранёнными поисками в фоне (поток очереди оповещений)
+        from . import saved_searches
+        saved_searches.on_catalog_update(previous, cat)
+    return cat
+
+
+def snapshots() -> List[Catalog]:
+    """Снимки в памяти, от старых к новым."""
+    return list(_history.values())
+
+
+def vocabulary(facet: str, version: Optional[str]) -> Vocabulary:
+    """
+    Словарь фасета для версии, закреплённой в FSM. Если её уже нет — CatalogExpired: битовые маски
+    выбора относятся к её id, и расшифровка по другому словарю дала бы другие города и тематики.
+    """
+    cat = get(version)
+    if cat is None:
+        raise CatalogExpired(version)
+    return cat.vocabulary(facet)
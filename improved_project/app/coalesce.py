@@ -0,0 +1,118 @@
+# app/coalesce.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from .api_budget import defer
+from .config import settings
+from .metrics import Counter
+
+log = logging.getLogger(__name__)
+
+EDITS_SCHEDULED = Counter("coalesce_edits_scheduled_total", "Запрошенные отложенные редактирования сообщений")
+EDITS_SAVED = Counter("coalesce_edits_saved_total", "Редактирования, которые не понадобились: их перекрыло более новое")
+EDITS_NOT_MODIFIED = Counter("coalesce_not_modified_total", "Ответы Telegram «message is not modified»")
+
+Render = Callable[[], Awaitable[Any]]
+
+
+class _Pending:
+    __slots__ = ("task", "fired", "after", "render", "full")
+
+    def __init__(self, after: Optional[asyncio.Task], render: Render, full: bool) -> None:
+        self.task: Optional[asyncio.Task] = None
+        self.fired = False
+        self.render = render
+        self.full = full
+        # Правка, которая уже ушла в Telegram, когда запланировали эту: её дожидаемся, а не отменяем
+        self.after = after
+
+
+class EditCoalescer:
+    """
+    Склеивает серию быстрых правок одного сообщения в одну.
+
+    Хендлер сразу применяет изменение к FSM и вызывает schedule(): само редактирование
+    выполняется через `window` секунд после последнего нажатия (trailing debounce).
+    Более новый вызов для того же сообщения отменяет только ожидающую правку. Уже отправленный
+    edit_text не прерывается: запрос мог дойти до Telegram, и отмена посреди него оставила бы
+    сообщение в неизвестном виде; новая правка выполнится после него. Поэтому render() должен
+    читать актуальное состояние в момент запуска.
+
+    full=False — частичная правка (например, только клавиатура). Она не заменяет ожидающую полную
+    (текст и клавиатура): тогда выполнится полная, она покажет и частичное изменение.
+    """
+
+    def __init__(self, window: float) -> None:
+        self._window = window
+        self._pending: Dict[Tuple[int, int], _Pending] = {}
+
+    @staticmethod
+    def _key(message: Message) -> Tuple[int, int]:
+        return message.chat.id, message.message_id
+
+    def schedule(self, message: Message, render: Render, full: bool = True) -> None:
+        key = self._key(message)
+        EDITS_SCHEDULED.inc()
+        prev = self._pending.get(key)
+        after = None
+        if prev is not None:
+            if prev.fired:
+                after = prev.task
+            else:
+                EDITS_SAVED.inc()
+                prev.task.cancel()
+                after = prev.after
+                if prev.full and not full:
+                    render, full = prev.render, True
+        pending = _Pending(after, render, full)
+        pending.task = asyncio.create_task(self._run(key, pending))
+        # Запросы правки — на счету апдейта, который её запланировал (см. api_budget.py)
+        defer(pending.task)
+        self._pending[key] = pending
+
+    async def cancel(self, message: Message) -> None:
+        """
+        Отменяет отложенную правку, например перед переходом к следующему шагу, и дожидается уже
+        отправленной: следующий edit_text хендлера не должен с ней разминуться.
+        """
+        pending = self._pending.pop(self._key(message), None)
+        if pending is None:
+            return
+        if not pending.fired:
+            EDITS_SAVED.inc()
+            pending.task.cancel()
+            in_flight = pending.after
+        else:
+            in_flight = pending.task
+        if in_flight is not None and not in_flight.done():
+            # wait, а не await: отмена ждущего хендлера не должна прерывать саму правку
+            await asyncio.wait([in_flight])
+
+    async def _run(self, key: Tuple[int, int], pending: _Pending) -> None:
+        try:
+            await asyncio.sleep(self._window)
+            if pending.after is not None and not pending.after.done():
+                await asyncio.wait([pending.after])
+            pending.fired = True
+            await pending.render()
+        except asyncio.CancelledError:
+            pass
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                EDITS_NOT_MODIFIED.inc()
+            else:
+                log.warning("Не удалось обновить сообщение %s: %s", key, e)
+        except Exception:
+            log.exception("Ошибка при отложенном обновлении сообщения %s", key)
+        finally:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+
+
+coalescer = EditCoalescer(window=settings.EDIT_DEBOUNCE_SECONDS)
@@ -13,6 +13,10 @@ class Settings(BaseSettings):
     START_MODE: str = "strict"
     MANAGER_CONTACT: str = "@your_manager"
     INVITE_TOKENS: str = ""
+    # Telegram id администраторов через запятую: им доступна /profile (см. routers/admin.py)
+    ADMIN_IDS: str = ""
+    # Прогревать каталог, сессию Sheets и соединение с OpenAI в фоне сразу после старта (см. startup.py)
+    STARTUP_WARMUP: bool = True
 
     # --- Google Sheets ---
     GOOGLE_SHEET_ID: str
@@ -39,6 +43,111 @@ class Settings(BaseSettings):
 
     # --- Results ---
     RESULTS_PER_PAGE: int = 4
+    # Сколько лучших по релевантности блогеров попадает в выдачу
+    RESULTS_TOP_K: int = 200
+    # Веса признаков ранжирования (см. ranking.py)
+    RANK_WEIGHT_TOPIC: float = 0.35
+    RANK_WEIGHT_ER: float = 0.25
+    RANK_WEIGHT_VALUE: float = 0.25
+    RANK_WEIGHT_FRESHNESS: float = 0.15
+    RANK_FRESHNESS_HALF_LIFE_DAYS: float = 90.0
+    # Сборка кампании под общий бюджет (см. campaign.py)
+    CAMPAIGN_TIME_BUDGET_MS: int = 150
+    CAMPAIGN_DP_RESOLUTION: int = 2000
+    CAMPAIGN_DP_MAX_ITEMS: int = 1500
+    # «Похожие» блогеры (см. similar.py): сколько соседей, сколько строк помнить, веса признаков
+    SIMILAR_TOP_N: int = 8
+    SIMILAR_CACHE_SIZE: int = 20000
+    SIMILAR_WEIGHT_TOPIC: float = 0.4
+    SIMILAR_WEIGHT_CITY: float = 0.2
+    SIMILAR_WEIGHT_LANGUAGE: float = 0.1
+    SIMILAR_WEIGHT_FOLLOWERS: float = 0.15
+    SIMILAR_WEIGHT_PRICE: float = 0.15
+
+    # --- Export ---
+    # Процессы пула экспорта (см. export_worker.py), лимит заданий в пуле и на пользователя
+    EXPORT_WORKERS: int = 2
+    EXPORT_QUEUE_MAX: int = 16
+    EXPORT_MAX_PER_USER: int = 1
+    EXPORT_TASKS_PER_CHILD: int = 50
+    # Файлы экспорта и снимки каталога для пула (относительно корня проекта); потолок строк в выгрузке
+    EXPORT_DIR: str = "data/exports"
+    EXPORT_MAX_ROWS: int = 100_000
+    EXPORT_CHUNK_ROWS: int = 5000
+    # Кеш готовых файлов экспорта (см. export_cache.py): потолок суммарного размера на диске
+    EXPORT_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+
+    # --- Catalog ---
+    # Как часто перечитывать лист influencers из Google Sheets
+    CATALOG_TTL_SECONDS: int = 300
+    # Общий кеш результатов подбора (номера строк по нормализованным фильтрам)
+    RESULT_CACHE_MAX_ENTRIES: int = 512
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Сохранённые поиски (см. saved_searches.py): журнал относительно корня проекта, лимит на пользователя,
+    # очередь оповещений и их темп (сообщений в секунду)
+    SAVED_SEARCHES_FILE: str = "data/saved_searches.jsonl"
+    SAVED_SEARCHES_PER_USER: int = 5
+    SAVED_SEARCH_QUEUE_MAX: int = 10000
+    SAVED_SEARCH_ALERT_RATE: float = 5.0
+
+    # --- Logging (см. logger.py) ---
+    # Уровень корневого логгера и уровни отдельных логгеров: "имя=УРОВЕНЬ" через запятую
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = "aiogram=INFO,aiogram.event=WARNING,openai=INFO,httpx=WARNING"
+    # "json" — одна JSON-строка на запись, "text" — прежний текстовый формат
+    LOG_FORMAT: str = "json"
+    # Доля логов апдейтов (логгер "updates"), которая попадает в вывод; 1.0 — все
+    LOG_UPDATES_SAMPLE: float = 1.0
+    # Сколько записей может ждать потока вывода; сверх — отбрасываются (logs_dropped_total)
+    LOG_QUEUE_MAX: int = 10000
+
+    # --- Metrics ---
+    # Эндпоинт /metrics (см. metrics.py); порт 0 — не запускать. Только локальный интерфейс:
+    # метрики не для внешнего мира
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+
+    # --- Tracing (см. tracing.py) ---
+    # Доля апдейтов, для которых пишется трасса (0 — трассировка выключена)
+    TRACE_SAMPLE_RATE: float = 0.01
+    # Трассы короче порога не сохраняются; буфер трасс между сбросами на диск и период сброса
+    TRACE_MIN_MS: float = 0.0
+    TRACE_BUFFER: int = 1000
+    TRACE_FLUSH_SECONDS: float = 60.0
+    TRACE_DIR: str = "data/traces"
+
+    # --- Loop watchdog (см. watchdog.py) ---
+    LOOP_WATCHDOG_ENABLED: bool = True
+    # Блокировка loop дольше порога — предупреждение в лог со стеком и хендлером
+    LOOP_LAG_THRESHOLD_MS: float = 100.0
+    # Период пульса в loop (и вдвое чаще — проверки из потока сторожа)
+    LOOP_WATCHDOG_INTERVAL_MS: float = 50.0
+
+    # --- Profiling (/profile, см. profiler.py) ---
+    PROFILE_MAX_SECONDS: float = 300.0
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0
+    # Глубина стеков tracemalloc в режиме mem: больше — точнее, но дороже, пока идёт замер
+    PROFILE_TRACEMALLOC_FRAMES: int = 10
+
+    # --- Scheduling ---
+    # Сколько хендлеров может работать одновременно во всём боте
+    SCHED_MAX_CONCURRENCY: int = 32
+    # Сколько апдейтов одного чата может ждать (включая выполняющийся), прежде чем ответим «подождите»
+    SCHED_MAX_QUEUE_PER_CHAT: int = 5
+    # Сколько апдейтов всего может ждать глобального слота
+    SCHED_MAX_WAITING: int = 500
+    # Пауза перед отложенным редактированием клавиатуры: серия быстрых нажатий даёт одну правку
+    EDIT_DEBOUNCE_SECONDS: float = 0.3
+
+    # --- Outbound (лимиты Telegram на отправку) ---
+    OUTBOUND_GLOBAL_RATE: float = 30.0   # сообщений в секунду на всего бота
+    OUTBOUND_CHAT_RATE: float = 1.0      # сообщений в секунду в один чат
+    OUTBOUND_CHAT_BURST: int = 3         # сколько сообщений подряд можно отправить в чат без ожидания
+    OUTBOUND_MAX_RETRIES: int = 3        # повторы после RetryAfter
+    # Сколько запросов к Bot API считаем нормой на один апдейт (сверх — предупреждение в лог)
+    BOT_API_CALLS_BUDGET: int = 3
+    # «печатает…» — только если хендлер отвечает дольше порога (см. TypingMiddleware)
+    TYPING_DELAY_MS: float = 700.0
 
     # Новая переменная для АБСОЛЮТНОГО пути
     # Она не читается из .env, а вычисляется здесь
@@ -0,0 +1,142 @@
+# app/export_cache.py
+"""
+Кеш готовых файлов экспорта и их file_id в Telegram.
+
+Ключ — по содержимому: версия каталога + формат + состав выгрузки (отсортированные username для
+выбранных блогеров, номера строк для «всех результатов»). Одинаковый выбор на той же версии каталога
+даёт тот же ключ — у того же пользователя или у другого.
+
+Готовый файл лежит на диске (EXPORT_DIR/cache, имя — ключ), суммарный размер ограничен
+EXPORT_CACHE_MAX_BYTES, вытесняются давно не отправлявшиеся (LRU по времени изменения файла,
+поэтому порядок переживает перезапуск). После первой отправки запоминается file_id, который вернул
+Telegram (рядом с файлом, <ключ>.id): повторный экспорт уходит по file_id — без рендера и без загрузки.
+
+Все методы ходят на диск (первый вызов ещё и сканирует каталог кеша): из event loop — через asyncio.to_thread.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .config import settings
+from .export_worker import EXPORT_DIR
+from .metrics import Counter, Gauge
+
+LOOKUPS_TOTAL = Counter("export_cache_lookups_total", "Обращения к кешу экспорта", ["result"])
+SIZE_BYTES = Gauge("export_cache_bytes", "Суммарный размер файлов в кеше экспорта")
+EVICTIONS_TOTAL = Counter("export_cache_evictions_total", "Файлы, вытесненные из кеша экспорта")
+
+
+def export_key(version: str, fmt: str, usernames: Optional[Iterable[str]] = None,
+               rows: Optional[np.ndarray] = None) -> str:
+    """Ключ выгрузки: выбранные блогеры (порядок не важен) или номера строк «всех результатов»."""
+    h = hashlib.sha1(f"{version}:{fmt}:".encode("utf-8"))
+    if usernames is not None:
+        h.update("\n".join(sorted(u.lstrip("@").lower() for u in usernames)).encode("utf-8"))
+    if rows is not None:
+        h.update(b"rows:" + np.asarray(rows, dtype=np.int64).tobytes())
+    return f"{h.hexdigest()}.{fmt}"
+
+
+class ExportCache:
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._file_ids: dict = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        # Под замком, один раз: файлы с прошлых запусков — в порядке последнего использования
+        self._loaded = True
+        if not self.root.exists():
+            return
+        files = [p for p in self.root.iterdir() if p.is_file() and p.suffix != ".id"]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._sizes[path.name] = size
+            self._bytes += size
+            id_path = path.with_name(path.name + ".id")
+            if id_path.exists():
+                self._file_ids[path.name] = id_path.read_text(encoding="utf-8").strip()
+        SIZE_BYTES.set(self._bytes)
+
+    def lookup(self, key: str) -> "tuple[Optional[str], Optional[Path]]":
+        """(file_id, путь): file_id — можно отправить без загрузки; путь — файл уже отрендерен."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if key not in self._sizes:
+                LOOKUPS_TOTAL.labels("miss").inc()
+                return None, None
+            self._sizes.move_to_end(key)
+            path = self.root / key
+            file_id = self._file_ids.get(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Файл удалили снаружи — считаем промахом
+            with self._lock:
+                self._bytes -= self._sizes.pop(key, 0)
+                self._file_ids.pop(key, None)
+            LOOKUPS_TOTAL.labels("miss").inc()
+            return None, None
+        LOOKUPS_TOTAL.labels("file_id" if file_id else "file").inc()
+        return file_id, path
+
+    def put(self, key: str, rendered: Path) -> Path:
+        """Переносит отрендеренный файл в кеш и возвращает его новый путь."""
+        path = self.root / key
+        self.root.mkdir(parents=True, exist_ok=True)
+        os.replace(rendered, path)
+        size = path.stat().st_size
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._bytes += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            self._evict(keep=key)
+            SIZE_BYTES.set(self._bytes)
+        return path
+
+    def remember_file_id(self, key: str, file_id: Optional[str]) -> None:
+        """file_id отправленного документа (None — забыть, например, Telegram его больше не принимает)."""
+        id_path = self.root / (key + ".id")
+        with self._lock:
+            if key not in self._sizes:
+                return
+            if file_id:
+                self._file_ids[key] = file_id
+            else:
+                self._file_ids.pop(key, None)
+        if file_id:
+            id_path.write_text(file_id, encoding="utf-8")
+        else:
+            id_path.unlink(missing_ok=True)
+
+    def _evict(self, keep: str) -> None:
+        while self._bytes > self.max_bytes and len(self._sizes) > 1:
+            key = next(iter(self._sizes))
+            if key == keep:
+                break
+            self._bytes -= self._sizes.pop(key)
+            self._file_ids.pop(key, None)
+            (self.root / key).unlink(missing_ok=True)
+            (self.root / (key + ".id")).unlink(missing_ok=True)
+            EVICTIONS_TOTAL.inc()
+
+    def hit_ratio(self) -> float:
+        misses = LOOKUPS_TOTAL.labels("miss").value
+        hits = LOOKUPS_TOTAL.labels("file_id").value + LOOKUPS_TOTAL.labels("file").value
+        return hits / (hits + misses) if hits + misses else 0.0
+
+
+export_cache = ExportCache(EXPORT_DIR / "cache", settings.EXPORT_CACHE_MAX_BYTES)
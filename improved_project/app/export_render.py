@@ -0,0 +1,146 @@
+# app/export_render.py
+"""
+Рендер файлов экспорта (PDF, Excel, CSV). Модуль выполняется в процессах пула экспорта
+(см. export_worker.py), поэтому не импортирует ни настройки, ни Sheets, ни aiogram.
+
+Строки не собираются в общий DataFrame и файл не копится в BytesIO: строки идут пачками
+прямо в писатель, а писатель пишет в файл на диске, путь к которому даёт родитель:
+  xlsx — xlsxwriter в режиме constant_memory (в памяти только текущая строка листа);
+  csv  — csv.writer пачками по chunk строк;
+  pdf  — canvas ReportLab постранично, со сжатием страниц.
+Источник строк (source):
+  ("catalog", версия, путь к снимку, номера строк) — выгрузка прямо из снимка каталога:
+      процесс пула один раз читает снимок с диска (его пишет родитель, см. export_worker.snapshot_path)
+      и дальше берёт из него только нужные строки — «все результаты» на 100k строк не пересылаются
+      между процессами;
+  ("records", записи) — короткий список словарей (например, выбранные из выдачи, если снимка
+      той версии уже нет в памяти).
+"""
+from __future__ import annotations
+
+import csv
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Колонки PDF: строка таблицы должна умещаться в пару строк листа
+PDF_COLUMNS = ["name", "username", "city", "topics", "language", "followers", "price"]
+
+# Снимок каталога, прочитанный этим процессом: (версия, DataFrame)
+_snapshot: Optional[Tuple[str, pd.DataFrame]] = None
+
+
+def _catalog_df(version: str, path: str) -> pd.DataFrame:
+    global _snapshot
+    import pandas as pd
+
+    if _snapshot is None or _snapshot[0] != version:
+        _snapshot = None  # старый снимок освобождаем до чтения нового
+        _snapshot = (version, pd.read_pickle(path))
+    return _snapshot[1]
+
+
+def _source_columns(source: Tuple[Any, ...]) -> List[str]:
+    if source[0] == "catalog":
+        return [str(c) for c in _catalog_df(source[1], source[2]).columns]
+    columns: Dict[str, None] = {}
+    for rec in source[1]:
+        columns.update(dict.fromkeys(rec))
+    return list(columns)
+
+
+def _iter_chunks(source: Tuple[Any, ...], columns: Sequence[str], chunk: int) -> Iterator[List[List[Any]]]:
+    """Строки источника пачками (списки значений в порядке columns)."""
+    if source[0] == "catalog":
+        df = _catalog_df(source[1], source[2])
+        rows = np.asarray(source[3], dtype=np.int64)
+        present = [c for c in columns if c in df.columns]
+        for start in range(0, len(rows), chunk):
+            part = df.iloc[rows[start:start + chunk]]
+            values = [part[c].tolist() if c in present else [None] * len(part) for c in columns]
+            yield [list(v) for v in zip(*values)]
+    else:
+        records = source[1]
+        for start in range(0, len(records), chunk):
+            yield [[rec.get(c) for c in columns] for rec in records[start:start + chunk]]
+
+
+def _cell(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return value
+
+
+def render_export(fmt: str, source: Tuple[Any, ...], path: str, chunk: int = 5000) -> int:
+    """Точка входа для пула процессов: пишет файл fmt ("pdf" | "xlsx" | "csv") в path, возвращает число строк."""
+    if fmt == "pdf":
+        return export_pdf(source, path, chunk)
+    if fmt == "xlsx":
+        return export_excel(source, path, chunk)
+    if fmt == "csv":
+        return export_csv(source, path, chunk)
+    raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+
+
+def export_excel(source: Tuple[Any, ...], path: str, chunk: int = 5000) -> int:
+    import xlsxwriter
+
+    columns = _source_columns(source)
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    try:
+        sheet = workbook.add_worksheet("Influencers")
+        sheet.write_row(0, 0, columns, workbook.add_format({"bold": True}))
+        n = 0
+        for rows in _iter_chunks(source, columns, chunk):
+            for row in rows:
+                n += 1
+                sheet.write_row(n, 0, [_cell(v) for v in row])
+    finally:
+        workbook.close()
+    return n
+
+
+def export_csv(source: Tuple[Any, ...], path: str, chunk: int = 5000) -> int:
+    columns = _source_columns(source)
+    n = 0
+    # utf-8-sig: Excel открывает кириллицу без мастера импорта
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in _iter_chunks(source, columns, chunk):
+            writer.writerows([_cell(v) for v in row] for row in rows)
+            n += len(rows)
+    return n
+
+
+def export_pdf(source: Tuple[Any, ...], path: str, chunk: int = 5000) -> int:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(path, pagesize=A4, pageCompression=1)
+    width, height = A4
+    y = height - 20 * mm
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(20 * mm, y, "Influencers")
+    y -= 10 * mm
+    c.setFont("Helvetica", 10)
+    n = 0
+    for rows in _iter_chunks(source, PDF_COLUMNS, chunk):
+        for row in rows:
+            n += 1
+            line = " | ".join(str(_cell(v)) for v in row)
+            for w in simpleSplit(line, "Helvetica", 10, width - 40 * mm):
+                if y < 20 * mm:
+                    c.showPage()
+                    y = height - 20 * mm
+                    c.setFont("Helvetica", 10)
+                c.drawString(20 * mm, y, w)
+                y -= 6 * mm
+            y -= 4 * mm
+    c.save()
+    return n
@@ -0,0 +1,171 @@
+# app/export_worker.py
+"""
+Пул процессов для экспорта: рендер PDF/Excel никогда не выполняется в event loop бота.
+
+ReportLab и xlsxwriter — чистый CPU под GIL: даже в asyncio.to_thread большой файл тормозит
+весь бот. Поэтому файлы рендерятся в ProcessPoolExecutor (EXPORT_WORKERS процессов, запуск через
+spawn — дочерний процесс не наследует loop и потоки бота), а хендлер получает awaitable.
+
+Файл пишется процессом пула прямо на диск (EXPORT_DIR, см. export_render.py), хендлер получает путь.
+Для выгрузки из каталога процесс пула читает снимок версии с диска: snapshot_path один раз на версию
+сохраняет DataFrame снимка рядом с файлами экспорта. Файл снимка занят, пока его задание не завершилось
+(release_snapshot), — снимки прежних версий удаляются, только когда на них никто не ссылается.
+
+Очередь ограничена: не больше EXPORT_QUEUE_MAX заданий (включая выполняющиеся) и не больше
+EXPORT_MAX_PER_USER одновременно от одного пользователя; сверх лимита — ExportBusy, и хендлер
+просит подождать. Упавший пул (BrokenProcessPool) пересоздаётся при следующем задании.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from .config import BASE_DIR, settings
+from .export_render import render_export
+from .metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+log = logging.getLogger(__name__)
+
+EXPORT_DIR = BASE_DIR / settings.EXPORT_DIR
+
+JOBS_TOTAL = Counter("export_jobs_total", "Задания экспорта", ["format", "result"])
+RENDER_SECONDS = Histogram("export_render_seconds", "Время задания экспорта (очередь + рендер)", ["format"])
+QUEUE_DEPTH = Gauge("export_queue_depth", "Задания экспорта в пуле (ждут и выполняются)")
+
+
+class ExportBusy(Exception):
+    """Очередь экспорта заполнена или у пользователя уже идёт экспорт."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ExportWorker:
+    def __init__(self, workers: int, queue_max: int, per_user: int) -> None:
+        self.workers = workers
+        self.queue_max = queue_max
+        self.per_user = per_user
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._by_user: Dict[int, int] = defaultdict(int)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                # Процесс перезапускается время от времени: память после больших файлов не копится
+                max_tasks_per_child=settings.EXPORT_TASKS_PER_CHILD,
+            )
+        return self._pool
+
+    def submit(self, user_id: int, fmt: str, source: Tuple[Any, ...]) -> "asyncio.Task[Tuple[Path, int]]":
+        """
+        Ставит задание в пул и сразу возвращает awaitable: путь к готовому файлу и число строк в нём.
+        source — источник строк (см. export_render.py).
+        ExportBusy — синхронно, до постановки: очередь заполнена или лимит пользователя занят.
+        Снимок каталога в source (см. snapshot_path) освобождается, когда задание завершится или отклонено.
+        """
+        if self._pending >= self.queue_max or self._by_user[user_id] >= self.per_user:
+            JOBS_TOTAL.labels(fmt, "rejected").inc()
+            _release_source(source)
+            raise ExportBusy("queue" if self._pending >= self.queue_max else "user")
+        self._pending += 1
+        self._by_user[user_id] += 1
+        QUEUE_DEPTH.set(self._pending)
+        return asyncio.ensure_future(self._run(user_id, fmt, source))
+
+    async def _run(self, user_id: int, fmt: str, source: Tuple[Any, ...]) -> Tuple[Path, int]:
+        started = time.monotonic()
+        path = EXPORT_DIR / f"tmp-{uuid.uuid4().hex}.{fmt}"
+        try:
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(self._executor(), render_export, fmt, source, str(path),
+                                              settings.EXPORT_CHUNK_ROWS)
+        except BrokenProcessPool:
+            path.unlink(missing_ok=True)
+            log.exception("Пул экспорта упал, пересоздаю")
+            self._pool = None
+            JOBS_TOTAL.labels(fmt, "failed").inc()
+            raise
+        except BaseException:
+            path.unlink(missing_ok=True)
+            JOBS_TOTAL.labels(fmt, "failed").inc()
+            raise
+        finally:
+            _release_source(source)
+            self._pending -= 1
+            self._by_user[user_id] -= 1
+            if not self._by_user[user_id]:
+                del self._by_user[user_id]
+            QUEUE_DEPTH.set(self._pending)
+        RENDER_SECONDS.labels(fmt).observe(time.monotonic() - started)
+        JOBS_TOTAL.labels(fmt, "ok").inc()
+        return path, rows
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_snapshot_lock = threading.Lock()
+# Файлы снимков, на которые ссылаются задания (в очереди или в работе): их не удаляем
+_snapshot_refs: Dict[str, int] = defaultdict(int)
+
+
+def snapshot_path(cat: "Catalog") -> Path:
+    """
+    Снимок каталога на диске для процессов пула; пишется один раз на версию. Зовут из потока.
+    Файл занят до release_snapshot (обычно его вызывает ExportWorker по завершении задания).
+    """
+    path = EXPORT_DIR / f"catalog-{cat.version}.pkl"
+    with _snapshot_lock:
+        _snapshot_refs[path.name] += 1
+        if not path.exists():
+            EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            cat.df.to_pickle(tmp)
+            os.replace(tmp, path)
+            # Снимки прежних версий, которые больше не нужны ни одному заданию
+            for old in EXPORT_DIR.glob("catalog-*.pkl"):
+                if old != path and not _snapshot_refs.get(old.name):
+                    old.unlink(missing_ok=True)
+    return path
+
+
+def release_snapshot(path: Path) -> None:
+    """Задание больше не читает файл снимка; сам файл удалит следующая версия (см. snapshot_path)."""
+    with _snapshot_lock:
+        left = _snapshot_refs[path.name] - 1
+        if left > 0:
+            _snapshot_refs[path.name] = left
+        else:
+            _snapshot_refs.pop(path.name, None)
+
+
+def _release_source(source: Tuple[Any, ...]) -> None:
+    if source[0] == "catalog" and source[2]:
+        release_snapshot(Path(source[2]))
+
+
+exporter = ExportWorker(settings.EXPORT_WORKERS, settings.EXPORT_QUEUE_MAX, settings.EXPORT_MAX_PER_USER)
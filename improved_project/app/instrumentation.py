@@ -0,0 +1,126 @@
+# app/instrumentation.py
+"""
+Метрики хендлеров и FSM-хранилища.
+
+HandlerMetricsMiddleware — внутренний middleware: время хендлера по роутеру и имени функции
+(handler_seconds) и исключения (handler_errors_total). Внутренний, поэтому меряет только сам
+хендлер — ожидание в очереди планировщика считается отдельно (sched_wait_seconds).
+В трассе апдейта (см. tracing.py) хендлер — спан "handler".
+
+TimedStorage — обёртка над FSM-хранилищем (сейчас MemoryStorage): время каждой операции
+(fsm_storage_seconds по op), в трассе — спаны "fsm.<op>". При переходе на Redis здесь же будет
+видна сетевая задержка.
+
+Обновления метрик — операции над числами без блокировок (см. metrics.py).
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+from .metrics import Counter, Histogram
+from .tracing import span
+
+HANDLER_SECONDS = Histogram("handler_seconds", "Время хендлера апдейта", ["router", "handler"])
+HANDLER_ERRORS = Counter("handler_errors_total", "Исключения в хендлерах", ["router", "handler"])
+FSM_SECONDS = Histogram(
+    "fsm_storage_seconds", "Операции FSM-хранилища", ["op"],
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    def __init__(self) -> None:
+        # Дочерние метрики по (роутер, хендлер): на горячем пути — один поиск в словаре
+        self._children: Dict[tuple, tuple] = {}
+
+    def _metrics_for(self, data: Dict[str, Any]) -> tuple:
+        handler = data.get("handler")
+        router = data.get("event_router")
+        key = (id(router), id(handler))
+        children = self._children.get(key)
+        if children is None:
+            router_name = getattr(router, "name", None) or "-"
+            callback = getattr(handler, "callback", None)
+            handler_name = getattr(callback, "__name__", None) or "-"
+            children = self._children[key] = (HANDLER_SECONDS.labels(router_name, handler_name),
+                                              HANDLER_ERRORS.labels(router_name, handler_name),
+                                              router_name, handler_name)
+        return children
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        seconds, errors, router_name, handler_name = self._metrics_for(data)
+        started = time.perf_counter()
+        try:
+            with span("handler", router=router_name, handler=handler_name):
+                return await handler(event, data)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+
+
+class TimedStorage(BaseStorage):
+    """FSM-хранилище, которое меряет время операций вложенного хранилища."""
+
+    def __init__(self, storage: BaseStorage) -> None:
+        self.storage = storage
+        self._set_state = FSM_SECONDS.labels("set_state")
+        self._get_state = FSM_SECONDS.labels("get_state")
+        self._set_data = FSM_SECONDS.labels("set_data")
+        self._get_data = FSM_SECONDS.labels("get_data")
+        self._update_data = FSM_SECONDS.labels("update_data")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        started = time.perf_counter()
+        try:
+            with span("fsm.set_state"):
+                await self.storage.set_state(key, state)
+        finally:
+            self._set_state.observe(time.perf_counter() - started)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            with span("fsm.get_state"):
+                return await self.storage.get_state(key)
+        finally:
+            self._get_state.observe(time.perf_counter() - started)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        started = time.perf_counter()
+        try:
+            with span("fsm.set_data"):
+                await self.storage.set_data(key, data)
+        finally:
+            self._set_data.observe(time.perf_counter() - started)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            with span("fsm.get_data"):
+                return await self.storage.get_data(key)
+        finally:
+            self._get_data.observe(time.perf_counter() - started)
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            with span("fsm.update_data"):
+                return await self.storage.update_data(key, data)
+        finally:
+            self._update_data.observe(time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
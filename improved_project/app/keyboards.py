@@ -6,7 +6,13 @@ from aiogram.types import (
     KeyboardButton,
     ReplyKeyboardRemove,
 )
-from typing import List, Optional, Set
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Set
+
+from . import callbacks as cbd
+
+if TYPE_CHECKING:
+    from .catalog import Vocabulary
 
 # НОВАЯ ФУНКЦИЯ
 def join_kb() -> InlineKeyboardMarkup:
@@ -58,6 +64,45 @@ def paginated_multiselect_kb(
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def facet_picker_kb(vocab: "Vocabulary", prefix: str, page: int, selected_mask: int,
+                    limit: int, items_per_page: int = 10, search_query: Optional[str] = None) -> InlineKeyboardMarkup:
+    """
+    Пикер городов/тематик по id из Vocabulary. Клавиатура зависит только от версии словаря,
+    страницы и выбранных значений НА ЭТОЙ странице, поэтому готовые страницы берутся из кеша.
+    search_query — текст для кнопки inline-поиска по всему словарю (см. search.py).
+    """
+    start = page * items_per_page
+    page_mask = (selected_mask >> start) & ((1 << items_per_page) - 1)
+    return _facet_picker_page(vocab, prefix, page, page_mask, limit, items_per_page, search_query)
+
+
+@lru_cache(maxsize=4096)
+def _facet_picker_page(vocab: "Vocabulary", prefix: str, page: int, page_mask: int,
+                       limit: int, items_per_page: int, search_query: Optional[str]) -> InlineKeyboardMarkup:
+    total = min(limit, len(vocab))
+    start = page * items_per_page
+    end = min(start + items_per_page, total)
+
+    rows = []
+    for item_id in range(start, end):
+        mark = "✅" if page_mask >> (item_id - start) & 1 else "☑️"
+        rows.append([InlineKeyboardButton(
+            text=f"{mark} {vocab.values[item_id]}", callback_data=cbd.encode(prefix, cbd.PICK, item_id)
+        )])
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=cbd.encode(prefix, cbd.PAGE, page - 1)))
+    if end < total:
+        nav.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=cbd.encode(prefix, cbd.PAGE, page + 1)))
+    if nav:
+        rows.append(nav)
+    if search_query is not None:
+        rows.append([InlineKeyboardButton(text="🔎 Найти по названию", switch_inline_query_current_chat=search_query)])
+    rows.append([InlineKeyboardButton(text="✅ Готово", callback_data=cbd.encode(prefix, cbd.DONE))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def phone_request_kb() -> ReplyKeyboardMarkup:
     """Клавиатура для запроса номера телефона."""
     return ReplyKeyboardMarkup(
@@ -84,6 +129,10 @@ def results_nav_kb(page: int, total_pages: int, allow_select_done: bool = True)
         buttons.append(nav_row)
     if allow_select_done:
         buttons.append([InlineKeyboardButton(text="✅ Готово", callback_data="res:done")])
+    buttons.append([
+        InlineKeyboardButton(text="🎯 Собрать кампанию", callback_data="res:campaign"),
+        InlineKeyboardButton(text="🔔 Сообщать о новых", callback_data="res:watch"),
+    ])
     buttons.append([
         InlineKeyboardButton(text="🔄 Новый подбор", callback_data="res:new"),
         InlineKeyboardButton(text="📤 Экспорт", callback_data="res:export"),
@@ -91,11 +140,63 @@ def results_nav_kb(page: int, total_pages: int, allow_select_done: bool = True)
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def campaign_kb(page: int, can_take: bool = True) -> InlineKeyboardMarkup:
+    """Под составом кампании: забрать всех в выбор или вернуться к странице результатов."""
+    buttons = []
+    if can_take:
+        buttons.append([InlineKeyboardButton(text="✅ Взять всех в выбор", callback_data="campaign:take")])
+    buttons.append([InlineKeyboardButton(text="⬅️ К результатам", callback_data=f"res:page:{page}")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def export_kb(picked: int, total: int) -> InlineKeyboardMarkup:
+    """Формат экспорта и что выгружать: выбранных блогеров или все результаты подбора."""
+    rows = []
+    for label, kind in (("📄 PDF", "pdf"), ("📊 Excel", "xlsx"), ("🧾 CSV", "csv")):
+        row = []
+        if picked:
+            row.append(InlineKeyboardButton(text=f"{label}: выбранные ({picked})", callback_data=f"expfmt:{kind}:picked"))
+        row.append(InlineKeyboardButton(text=f"{label}: все ({total})", callback_data=f"expfmt:{kind}:all"))
+        rows.append(row)
+    rows.append([InlineKeyboardButton(text="✖️ Отмена", callback_data="expfmt:cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def saved_search_kb(search_id: str) -> InlineKeyboardMarkup:
+    """Под оповещением по сохранённому поиску."""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔕 Больше не присылать", callback_data=f"watch:off:{search_id}")],
+    ])
+
+
+def results_page_kb(usernames: List[str], selected: Optional[Set[str]], page: int, total_pages: int) -> InlineKeyboardMarkup:
+    """Одна клавиатура на страницу результатов: выбор блогеров + навигация и действия."""
+    rows = (
+        result_item_kb(usernames, selected).inline_keyboard
+        + results_nav_kb(page, total_pages, allow_select_done=True).inline_keyboard
+    )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def result_item_kb(usernames: List[str], selected: Optional[Set[str]] = None) -> InlineKeyboardMarkup:
     if selected is None:
         selected = set()
     rows = []
     for u in usernames:
         mark = "✅" if u in selected else "☑️"
-        rows.append([InlineKeyboardButton(text=f"{mark} @{u}", callback_data=f"pick:{u}")])
+        rows.append([
+            InlineKeyboardButton(text=f"{mark} @{u}", callback_data=f"pick:{u}"),
+            InlineKeyboardButton(text="👯 Похожие", callback_data=f"sim:{u}"),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def similar_kb(usernames: List[str], selected: Optional[Set[str]] = None) -> InlineKeyboardMarkup:
+    """Под списком похожих: выбор прямо отсюда (переключатели перерисовывают это же сообщение)."""
+    if selected is None:
+        selected = set()
+    rows = []
+    for u in usernames:
+        mark = "✅" if u in selected else "☑️"
+        rows.append([InlineKeyboardButton(text=f"{mark} @{u}", callback_data=f"simpick:{u}")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
\ No newline at end of file
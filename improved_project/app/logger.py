@@ -1,33 +1,148 @@
 # app/logger.py
+"""
+Логирование без блокировок event loop.
+
+Раньше корневой логгер писал в stdout синхронным StreamHandler на уровне DEBUG: каждая строка —
+форматирование и write прямо в event loop. Теперь:
+  - в loop работает только QueueHandler: запись кладётся в ограниченную очередь как есть,
+    без форматирования (msg % args, трейсбек и JSON собираются в потоке QueueListener);
+    переполненная очередь не тормозит бота — лишние записи отбрасываются и считаются
+    в метрике logs_dropped_total;
+  - QueueListener в своём потоке форматирует (JSON-строка или текст, LOG_FORMAT) и пишет в stdout;
+  - уровни — из настроек: LOG_LEVEL для корня и LOG_LEVELS («aiogram=INFO,updates=WARNING») для
+    отдельных логгеров; ниже уровня запись не создаётся вовсе;
+  - логи апдейтов (логгер "updates") прореживаются: проходит доля LOG_UPDATES_SAMPLE записей
+    уровня INFO и ниже, предупреждения и ошибки — всегда.
+Поля, переданные через extra=..., попадают в JSON отдельными ключами.
+"""
+from __future__ import annotations
+
+import json
 import logging
+import queue
+import random
 import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .metrics import Counter
+
+DROPPED_TOTAL = Counter("logs_dropped_total", "Записи лога, отброшенные из-за переполненной очереди")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)-8s - %(name)-20s - %(message)s"
+
+# Атрибуты LogRecord; всё остальное в __dict__ записи пришло из extra=...
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
 
 
-def setup_logging(level: int = logging.DEBUG) -> None:
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна JSON-строка: время, уровень, логгер, сообщение, extra-поля, трейсбек."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        if record.stack_info:
+            out["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(QueueHandler):
     """
-    Настраивает детальное логирование для отладки.
+    QueueHandler без форматирования в вызывающем потоке. Стандартный prepare() собирает сообщение
+    и трейсбек до постановки в очередь — то есть в event loop; здесь запись уходит как есть.
+    Аргументы форматируются позже в потоке слушателя: в лог передают строки и числа, а не объекты,
+    которые успеют измениться.
     """
-    # Устанавливаем формат для всех сообщений
-    log_format = "%(asctime)s - %(levelname)-8s - %(name)-20s - %(message)s"
 
-    # Создаем обработчик, который выводит логи в консоль
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_TOTAL.inc()
+
+
+class SampleFilter(logging.Filter):
+    """Пропускает долю rate записей уровня INFO и ниже; WARNING и выше — всегда."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def _parse_levels(spec: str) -> Dict[str, int]:
+    levels: Dict[str, int] = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def setup_logging(level: Optional[int] = None) -> None:
+    """
+    Настраивает корневой логгер: очередь в вызывающем потоке, форматирование и вывод — в потоке
+    слушателя. Повторный вызов перенастраивает всё заново.
+    """
+    global _listener
+    stop_logging()
+
     stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setLevel(level)
-    stream_handler.setFormatter(logging.Formatter(log_format))
+    if settings.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.LOG_QUEUE_MAX)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
 
     # Получаем корневой логгер и настраиваем его
     root_logger = logging.getLogger()
-    root_logger.setLevel(level)
+    root_logger.setLevel(level if level is not None else logging.getLevelName(settings.LOG_LEVEL.upper()))
 
     # Удаляем все предыдущие обработчики, чтобы избежать дублирования
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
+    root_logger.addHandler(_LazyQueueHandler(log_queue))
+
+    # Уровни отдельных логгеров (по умолчанию aiogram и openai менее "шумные")
+    for name, logger_level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    updates = logging.getLogger("updates")
+    for f in [f for f in updates.filters if isinstance(f, SampleFilter)]:
+        updates.removeFilter(f)
+    if settings.LOG_UPDATES_SAMPLE < 1.0:
+        updates.addFilter(SampleFilter(settings.LOG_UPDATES_SAMPLE))
 
-    # Добавляем наш новый, настроенный обработчик
-    root_logger.addHandler(stream_handler)
+    logging.info("Логирование настроено: уровень %s, формат %s", logging.getLevelName(root_logger.level),
+                 settings.LOG_FORMAT)
 
-    # Делаем логгер aiogram менее "шумным", чтобы видеть главное
-    logging.getLogger("aiogram").setLevel(logging.INFO)
-    logging.getLogger("openai").setLevel(logging.INFO)
 
-    logging.info("Логирование настроено на уровень DEBUG.")
\ No newline at end of file
+def stop_logging() -> None:
+    """Дописывает очередь и останавливает поток слушателя (при завершении бота)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
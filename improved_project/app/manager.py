@@ -8,12 +8,16 @@ from aiogram.fsm.context import FSMContext
 
 from . import sheets
 from .ai_logic import route_user_message_registration, generate_assistant_response_registration
+from .tracing import traced
 
 log = logging.getLogger(__name__)
 
 Profile = Dict[str, Optional[str]]
 REG_FIELDS = ("name", "company", "industry", "position", "phone")
 
+# Незавершённые записи профиля в Sheets по user_id (см. _save_profile)
+_pending_saves: Dict[int, "asyncio.Future[bool]"] = {}
+
 
 async def _current_step(state: FSMContext) -> Optional[str]:
     """Определяет текущий шаг регистрации, проверяя данные в FSM."""
@@ -24,6 +28,23 @@ async def _current_step(state: FSMContext) -> Optional[str]:
     return None
 
 
+async def _save_profile(state: FSMContext, user_data: Dict, user_id: int) -> bool:
+    # --- ДИАГНОСТИЧЕСКОЕ ЛОГИРОВАНИЕ ---
+    log.info(f"Попытка записи в Google Sheets для tg_id={user_id}. Данные: {user_data}")
+    ok = False # Изначально считаем, что запись не удалась
+    try:
+        # Запускаем синхронную функцию в отдельном потоке
+        ok = await asyncio.to_thread(sheets.append_user, user_data, tg_id=user_id)
+    except Exception as e:
+        log.critical(f"Критическая ошибка ПРИ ВЫЗОВЕ asyncio.to_thread для sheets.append_user: {e}", exc_info=True)
+
+    if ok:
+        log.info(f"ЗАПИСЬ УСПЕШНА для tg_id={user_id}.")
+        await state.update_data(saved_to_sheet=True)
+    return ok
+
+
+@traced("handle_event")
 async def handle_event(
         user_id: int,
         state_obj: FSMContext,
@@ -72,21 +93,16 @@ async def handle_event(
     if not step:
         log.debug("Все поля регистрации заполнены. Проверяем сохранение в Google Sheets.")
         if not user_data.get("saved_to_sheet"):
-            await state_obj.bot.send_message(user_id, "Спасибо за регистрацию! ✨ Одну минуту, сохраняю ваш профиль...")
-
-            # --- ДИАГНОСТИЧЕСКОЕ ЛОГИРОВАНИЕ ---
-            log.info(f"Попытка записи в Google Sheets для tg_id={user_id}. Данные: {user_data}")
-            ok = False # Изначально считаем, что запись не удалась
-            try:
-                # Запускаем синхронную функцию в отдельном потоке
-                ok = await asyncio.to_thread(sheets.append_user, user_data, tg_id=user_id)
-            except Exception as e:
-                log.critical(f"Критическая ошибка ПРИ ВЫЗОВЕ asyncio.to_thread для sheets.append_user: {e}", exc_info=True)
-
+            # Запись и флаг saved_to_sheet — одна неделимая операция: даже если этот ход отменит
+            # более новое сообщение пользователя, запись доработает, а новый ход дождётся её же
+            saving = _pending_saves.get(user_id)
+            if saving is None:
+                await state_obj.bot.send_message(user_id, "Спасибо за регистрацию! ✨ Одну минуту, сохраняю ваш профиль...")
+                saving = _pending_saves[user_id] = asyncio.ensure_future(_save_profile(state_obj, user_data, user_id))
+                saving.add_done_callback(lambda _: _pending_saves.pop(user_id, None))
+            ok = await asyncio.shield(saving)
 
             if ok:
-                log.info(f"ЗАПИСЬ УСПЕШНА для tg_id={user_id}.")
-                await state_obj.update_data(saved_to_sheet=True)
                 # Важно: возвращаем пустую строку, чтобы бот ничего не писал после "сохраняю ваш профиль"
                 return "", False, "start_selection"
             else:
@@ -1,21 +1,43 @@
 # app/middlewares.py
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Callable, Awaitable, Dict, Optional
 
-from aiogram import BaseMiddleware
+from aiogram import BaseMiddleware, Bot
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message, CallbackQuery, TelegramObject
-from aiogram.utils.chat_action import ChatActionSender
 from aiogram.exceptions import TelegramAPIError
 import logging
 
+from .metrics import Counter
+
+# sent — запрос sendChatAction, avoided — хендлер уложился в порог и запрос не понадобился,
+# failed — Telegram отклонил запрос
+CHAT_ACTIONS = Counter("chat_actions_total", "Индикатор «печатает…»", ["result"])
+
+# Telegram показывает действие около 5 секунд: дольше — повторяем
+_ACTION_INTERVAL = 5.0
+
 
 class TypingMiddleware(BaseMiddleware):
     """
-    Всегда показывает 'печатает…' во время обработки апдейта.
+    Показывает 'печатает…', только если ответ заметно задерживается.
     Работает и для обычных сообщений, и для callback-кнопок.
+
+    По умолчанию sendChatAction уходит, лишь когда хендлер работает дольше delay_ms: быстрые
+    хендлеры (выбор блогера, листание страниц) не тратят на индикатор ни запрос к Bot API, ни задачу —
+    только таймер loop, который отменяется по завершении. Медленные хендлеры помечаются флагом:
+      flags={"chat_action": "typing"}                        — индикатор сразу;
+      flags={"chat_action": {"action": "upload_document"}}   — другое действие, после порога;
+      flags={"chat_action": {"action": "typing", "delay": 0.2}} — своя задержка в секундах;
+      flags={"chat_action": False}                           — никогда.
     """
 
+    def __init__(self, delay_ms: float) -> None:
+        self.delay = delay_ms / 1000
+        self._avoided = CHAT_ACTIONS.labels("avoided")
+
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -30,15 +52,52 @@ class TypingMiddleware(BaseMiddleware):
         elif isinstance(event, CallbackQuery) and event.message:
             chat_id = event.message.chat.id
 
-        if bot and chat_id:
-            try:
-                async with ChatActionSender.typing(bot=bot, chat_id=chat_id):
-                    return await handler(event, data)
-            except TelegramAPIError:
-                # Если action не прошёл (например, слишком часто) — продолжаем без него
-                return await handler(event, data)
-        else:
+        flag = get_flag(data, "chat_action")
+        if not bot or not chat_id or flag is False:
+            return await handler(event, data)
+
+        action, delay = "typing", self.delay
+        if isinstance(flag, str):
+            action, delay = flag, 0.0
+        elif isinstance(flag, dict):
+            action, delay = flag.get("action", action), flag.get("delay", delay)
+
+        done = asyncio.Event()
+        sender: Optional["asyncio.Task[None]"] = None
+
+        def start() -> None:
+            nonlocal sender
+            # Задача создаётся в контексте апдейта: запросы попадают в его трассу и бюджет запросов
+            sender = asyncio.ensure_future(_send_while_running(bot, chat_id, action, done))
+
+        timer = asyncio.get_running_loop().call_later(delay, start) if delay > 0 else None
+        if timer is None:
+            start()
+        try:
             return await handler(event, data)
+        finally:
+            done.set()
+            if sender is None:
+                timer.cancel()
+                self._avoided.inc()
+            else:
+                # sendChatAction, ещё ждущий очереди отправки, после ответа уже не нужен
+                sender.cancel()
+
+
+async def _send_while_running(bot: Bot, chat_id: int, action: str, done: asyncio.Event) -> None:
+    while not done.is_set():
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=action)
+            CHAT_ACTIONS.labels("sent").inc()
+        except TelegramAPIError:
+            # Если action не прошёл (например, слишком часто) — продолжаем без него
+            CHAT_ACTIONS.labels("failed").inc()
+            return
+        try:
+            await asyncio.wait_for(done.wait(), _ACTION_INTERVAL)
+        except asyncio.TimeoutError:
+            continue
 
 
 class LoggingMiddleware(BaseMiddleware):
@@ -56,11 +115,16 @@ class LoggingMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any],
     ) -> Any:
-        try:
-            if isinstance(event, Message):
-                self._log.info("MSG from %s (%s): %s", getattr(event.from_user, "id", None), getattr(event.from_user, "username", None), event.text)
-            elif isinstance(event, CallbackQuery):
-                self._log.info("CB from %s (%s): %s", getattr(event.from_user, "id", None), getattr(event.from_user, "username", None), event.data)
-        except Exception:
-            pass
+        # Уровень ниже INFO — ни записи, ни разбора апдейта; форматирование — в потоке логов (см. logger.py)
+        if self._log.isEnabledFor(logging.INFO):
+            try:
+                user_id = getattr(event.from_user, "id", None)
+                if isinstance(event, Message):
+                    self._log.info("MSG from %s (%s): %s", user_id, getattr(event.from_user, "username", None),
+                                   event.text, extra={"user_id": user_id, "kind": "message"})
+                elif isinstance(event, CallbackQuery):
+                    self._log.info("CB from %s (%s): %s", user_id, getattr(event.from_user, "username", None),
+                                   event.data, extra={"user_id": user_id, "kind": "callback"})
+            except Exception:
+                pass
         return await handler(event, data)
@@ -0,0 +1,204 @@
+# app/outbound.py
+"""
+Единая очередь исходящих запросов к Bot API с учётом flood-лимитов Telegram.
+
+Подключается как request-middleware сессии aiogram (bot.session.middleware), поэтому через неё
+проходят все отправки — message.answer, edit_text, bot.send_message менеджеру, answer_document —
+без правок в роутерах. Лимиты: token bucket на чат (~1 msg/s с небольшим burst) и общий
+(~30 msg/s). Когда глобальных токенов не хватает, первыми их получают интерактивные ответы,
+затем уведомления менеджеру, затем экспорт файлов. Токены чата выдаются строго в порядке прихода
+(FIFO-замок чата), и в общую очередь запросы чата встают в том же порядке: запросы одного приоритета
+не меняются местами, а интерактивный ответ обгоняет ждущий экспорт того же чата. TelegramRetryAfter
+обрабатывается автоматически: на retry_after секунд «штрафуется» лимит этого чата (429 за лимит
+группы не должен останавливать отправки в остальные чаты), и запрос повторяется.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Union
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendChatAction, SendDocument, SendPhoto
+from aiogram.methods.base import TelegramType
+
+from .metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+    from aiogram.methods import Response, TelegramMethod
+
+log = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # ответы пользователю в диалоге
+    NOTIFY = 1       # уведомления менеджеру
+    EXPORT = 2       # файлы экспорта
+    ALERT = 3        # оповещения по сохранённым поискам
+
+
+_priority: ContextVar[Optional[Priority]] = ContextVar("outbound_priority", default=None)
+
+# Приоритет по умолчанию для методов, если он не задан явно через priority()
+_METHOD_PRIORITY = {SendDocument: Priority.EXPORT, SendPhoto: Priority.EXPORT}
+# Методы, которые не считаем в лимиты сообщений
+_UNLIMITED = (SendChatAction,)
+
+WAIT_SECONDS = Histogram("outbound_wait_seconds", "Ожидание токена перед отправкой в Bot API", ["priority"])
+LATENCY_SECONDS = Histogram(
+    "outbound_latency_seconds", "Полное время отправки (очередь + запрос + повторы)", ["priority"]
+)
+QUEUE_DEPTH = Gauge("outbound_queue_depth", "Запросы, ожидающие глобального токена", ["priority"])
+RETRY_AFTER_TOTAL = Counter("outbound_retry_after_total", "Ответы Telegram RetryAfter (flood control)")
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """Задаёт приоритет для всех отправок внутри блока: `with priority(Priority.NOTIFY): ...`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def try_take(self, now: float) -> float:
+        """Берёт токен и возвращает 0 либо возвращает, сколько секунд подождать до следующей попытки."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def penalize(self, seconds: float, now: float) -> None:
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _ChatQueue:
+    """Лимит одного чата и FIFO-замок его отправок (asyncio.Lock будит ожидающих по порядку)."""
+
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.bucket = TokenBucket(rate, capacity)
+        self.lock = asyncio.Lock()
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, max_retries: int) -> None:
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._chats: Dict[Union[int, str], _ChatQueue] = {}
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: "TelegramMethod[TelegramType]",
+    ) -> "Response[TelegramType]":
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or isinstance(method, _UNLIMITED):
+            return await make_request(bot, method)
+
+        level = _priority.get()
+        if level is None:
+            level = _METHOD_PRIORITY.get(type(method), Priority.INTERACTIVE)
+        label = level.name.lower()
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, level)
+            if attempt == 0:
+                WAIT_SECONDS.labels(label).observe(time.monotonic() - started)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                RETRY_AFTER_TOTAL.inc()
+                self._chat(chat_id).bucket.penalize(e.retry_after, time.monotonic())
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+                log.warning("Flood control для чата %s: повтор через %s с", chat_id, e.retry_after)
+                continue
+            LATENCY_SECONDS.labels(label).observe(time.monotonic() - started)
+            return response
+
+    def _chat(self, chat_id: Union[int, str]) -> _ChatQueue:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) > 10_000:
+                self._prune()
+            chat = self._chats[chat_id] = _ChatQueue(self._chat_rate, self._chat_burst)
+        return chat
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, c in self._chats.items() if not c.lock.locked() and c.bucket.is_idle(now)]:
+            del self._chats[key]
+
+    async def _acquire(self, chat_id: Union[int, str], level: Priority) -> None:
+        chat = self._chat(chat_id)
+        # Замок — только на токен чата: ожидание общей очереди под ним задержало бы интерактивные
+        # ответы этого чата за его же экспортом. В общую очередь встаём без await после замка —
+        # в том же порядке, в каком чат выдал токены
+        async with chat.lock:
+            while (delay := chat.bucket.try_take(time.monotonic())) > 0:
+                await asyncio.sleep(delay)
+        await self._acquire_global(level)
+
+    async def _acquire_global(self, level: Priority) -> None:
+        # Ожидающие упорядочены кучей по (приоритет, порядок прихода); токен берёт только голова кучи
+        if not self._heap and self._global.try_take(time.monotonic()) == 0:
+            return
+        label = level.name.lower()
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [int(level), next(self._seq), waiter]
+        heapq.heappush(self._heap, entry)
+        QUEUE_DEPTH.labels(label).inc()
+        self._wake_head()
+        try:
+            await waiter
+            while (delay := self._global.try_take(time.monotonic())) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            QUEUE_DEPTH.labels(label).dec()
+            if self._heap and self._heap[0] is entry:
+                heapq.heappop(self._heap)
+            else:
+                self._heap.remove(entry)
+                heapq.heapify(self._heap)
+            self._wake_head()
+
+    def _wake_head(self) -> None:
+        if self._heap and not self._heap[0][2].done():
+            self._heap[0][2].set_result(None)
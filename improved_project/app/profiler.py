@@ -0,0 +1,267 @@
+# app/profiler.py
+"""
+Профилирование живого процесса по команде администратора (см. routers/admin.py).
+
+Пока профилирование не запущено, ничего не работает и ничего не стоит: профилировщики
+включаются на N секунд и выключаются. Режимы:
+  sample — сэмплирующий профилировщик: поток раз в PROFILE_SAMPLE_INTERVAL_MS снимает стеки всех
+           потоков (sys._current_frames). Почти не мешает боту. Отчёт — горячие функции (свои
+           сэмплы и вместе с вызванными), файл — collapsed stacks («a;b;c N»: flamegraph.pl,
+           speedscope.app, inferno);
+  cpu    — cProfile потока event loop (все хендлеры и задачи). Точнее по числу вызовов, но
+           замедляет бота в разы, пока включён. Файл — .pstats (snakeviz, python -m pstats);
+  mem    — tracemalloc: снимки памяти в начале и в конце, рост по строкам кода; плюс размеры
+           FSM-данных пользователей, снимков каталога и кешей (по метрикам *_cache_*).
+Одновременно идёт только одно профилирование (ProfileBusy).
+"""
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import io
+import marshal
+import pickle
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as Tally
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import FrameType
+from typing import Any, List, Optional, Tuple
+
+from .config import settings
+from .metrics import REGISTRY, Gauge
+
+MODES = ("sample", "cpu", "mem")
+
+_TOP = 25
+
+
+class ProfileBusy(Exception):
+    """Профилирование уже идёт."""
+
+
+@dataclass
+class ProfileReport:
+    text: str
+    files: List[Tuple[str, bytes]] = field(default_factory=list)
+
+
+_active = False
+
+
+async def profile(mode: str, seconds: float, fsm_storage: Any = None) -> ProfileReport:
+    """Профилирует процесс seconds секунд в режиме mode (см. MODES)."""
+    global _active
+    if _active:
+        raise ProfileBusy()
+    _active = True
+    try:
+        if mode == "cpu":
+            return await _profile_cpu(seconds)
+        if mode == "mem":
+            return await _profile_memory(seconds, fsm_storage)
+        return await _profile_samples(seconds)
+    finally:
+        _active = False
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+# --- sample ---
+
+def _sampler(seconds: float, interval: float, stacks: Tally, stop: threading.Event) -> None:
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and not stop.wait(interval):
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if ident not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            stack.append(names.get(ident, str(ident)))
+            stacks[tuple(reversed(stack))] += 1
+        del frame
+
+
+async def _profile_samples(seconds: float) -> ProfileReport:
+    stacks: Tally = Tally()
+    stop = threading.Event()
+    interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+    # Поток сэмплера получает GIL только когда loop его отдаёт: при обычном интервале переключения
+    # (5 мс) короткие всплески CPU в хендлерах не попадали бы в сэмплы — видно было бы только ожидание
+    # в select. На время замера GIL передаётся чаще
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(min(switch, interval / 10))
+    try:
+        await asyncio.to_thread(_sampler, seconds, interval, stacks, stop)
+    finally:
+        stop.set()
+        sys.setswitchinterval(switch)
+
+    own: Tally = Tally()
+    total: Tally = Tally()
+    for stack, n in stacks.items():
+        own[stack[-1]] += n
+        for name in set(stack[1:]):
+            total[name] += n
+    samples = sum(stacks.values())
+    lines = [f"Сэмплов: {samples} за {seconds:.0f} с (раз в {interval * 1000:.0f} мс, все потоки)", "",
+             "Свои сэмплы (функция сама на вершине стека):"]
+    lines += [f"{n * 100 / max(samples, 1):5.1f}%  {name}" for name, n in own.most_common(_TOP)]
+    lines += ["", "Вместе с вызванными:"]
+    lines += [f"{n * 100 / max(samples, 1):5.1f}%  {name}" for name, n in total.most_common(_TOP)]
+    folded = "\n".join(f"{';'.join(stack)} {n}" for stack, n in stacks.most_common()) + "\n"
+    return ProfileReport("\n".join(lines), [(f"profile-{_stamp()}.folded", folded.encode("utf-8"))])
+
+
+# --- cpu ---
+
+async def _profile_cpu(seconds: float) -> ProfileReport:
+    # cProfile включается в потоке loop: попадают все хендлеры и фоновые задачи бота
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        prof.disable()
+    return await asyncio.to_thread(_cpu_report, prof, seconds)
+
+
+def _cpu_report(prof: cProfile.Profile, seconds: float) -> ProfileReport:
+    out = io.StringIO()
+    stats = pstats.Stats(prof, stream=out)
+    stats.strip_dirs().sort_stats("tottime").print_stats(_TOP)
+    text = f"cProfile потока event loop, {seconds:.0f} с, по собственному времени:\n" + _trim_pstats(out.getvalue())
+    prof.create_stats()
+    return ProfileReport(text, [(f"profile-{_stamp()}.pstats", marshal.dumps(prof.stats))])
+
+
+def _trim_pstats(report: str) -> str:
+    # Шапка pstats (дата, «Ordered by») в отчёте лишняя: оставляем итог и таблицу
+    lines = [line for line in report.splitlines() if line.strip()]
+    start = next((i for i, line in enumerate(lines) if "function calls" in line), 0)
+    return "\n".join(line for line in lines[start:] if not line.strip().startswith("Ordered by"))
+
+
+# --- mem ---
+
+async def _profile_memory(seconds: float, fsm_storage: Any) -> ProfileReport:
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+    # Размеры FSM-данных: записи копируем в loop, считаем в потоке
+    records = list(_fsm_records(fsm_storage))
+    return await asyncio.to_thread(_memory_report, before, after, current, peak, records, seconds)
+
+
+def _fsm_records(fsm_storage: Any):
+    # TimedStorage -> MemoryStorage -> словарь записей по ключу
+    storage = getattr(fsm_storage, "storage", None)
+    storage = getattr(storage, "storage", storage)
+    if isinstance(storage, dict):
+        for key, record in list(storage.items()):
+            yield key, getattr(record, "data", None)
+
+
+def _memory_report(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, current: int, peak: int,
+                   records: List[Tuple[Any, Any]], seconds: float) -> ProfileReport:
+    ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+
+    lines = [f"tracemalloc, {seconds:.0f} с: отслежено {current / 2**20:.1f} МБ, пик {peak / 2**20:.1f} МБ", "",
+             "Рост по строкам кода:"]
+    for stat in after.compare_to(before, "lineno")[:_TOP]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+9.1f} КБ {stat.count_diff:+7d} об.  {frame.filename}:{frame.lineno}")
+
+    lines += ["", "Рост по файлам:"]
+    for stat in after.compare_to(before, "filename")[:10]:
+        lines.append(f"{stat.size_diff / 1024:+9.1f} КБ  {stat.traceback[0].filename}")
+
+    lines += ["", _fsm_summary(records), "", _caches_summary()]
+    text = "\n".join(lines)
+
+    full = [text, "", "Крупнейшие выделения (полные стеки):"]
+    for stat in after.statistics("traceback")[:_TOP]:
+        full.append(f"{stat.size / 1024:.1f} КБ в {stat.count} объектах:")
+        full.extend("    " + line for line in stat.traceback.format())
+    return ProfileReport(text, [(f"memory-{_stamp()}.txt", "\n".join(full).encode("utf-8"))])
+
+
+def _fsm_summary(records: List[Tuple[Any, Any]]) -> str:
+    sizes: List[Tuple[int, Any]] = []
+    by_key: Tally = Tally()
+    for key, data in records:
+        if not data:
+            continue
+        try:
+            sizes.append((len(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)), key))
+            for k, v in data.items():
+                by_key[k] += len(pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            # Хендлер поменял данные, пока считали, или в них непиклуемое значение — пропускаем
+            continue
+    total = sum(size for size, _ in sizes)
+    lines = [f"FSM: {len(records)} записей, с данными {len(sizes)}, всего ~{total / 1024:.0f} КБ (pickle)"]
+    if sizes:
+        biggest = max(sizes, key=lambda s: s[0])
+        lines.append(f"  самая большая: {biggest[0] / 1024:.1f} КБ (user {getattr(biggest[1], 'user_id', '?')})")
+        lines.append("  по ключам: " + ", ".join(f"{k} {v / 1024:.0f} КБ" for k, v in by_key.most_common(8)))
+    return "\n".join(lines)
+
+
+def _caches_summary() -> str:
+    from . import catalog
+
+    lines = ["Снимки каталога и кеши:"]
+    for cat in catalog.snapshots():
+        lines.append(f"  каталог {cat.version}: {len(cat)} строк, DataFrame ~{cat.df.memory_usage(index=True).sum() / 2**20:.1f} МБ")
+    for metric in REGISTRY.metrics():
+        if isinstance(metric, Gauge) and ("cache" in metric.name or metric.name == "saved_searches"):
+            for sample_name, labels, value in metric.samples():
+                label = ",".join(f"{k}={v}" for k, v in labels.items())
+                lines.append(f"  {sample_name}{'{' + label + '}' if label else ''}: {value:,.0f}".replace(",", " "))
+    return "\n".join(lines)
+
+
+def parse_args(args: Optional[str]) -> Tuple[str, float]:
+    """«/profile 30 cpu» → ("cpu", 30); порядок и регистр не важны, по умолчанию sample на 30 с."""
+    mode, seconds = "sample", 30.0
+    for part in (args or "").lower().split():
+        if part in MODES:
+            mode = part
+        else:
+            try:
+                seconds = float(part.rstrip("s").rstrip("с"))
+            except ValueError:
+                continue
+    return mode, min(max(seconds, 1.0), settings.PROFILE_MAX_SECONDS)
+
+
+def admin_ids() -> frozenset:
+    return frozenset(int(x) for x in settings.ADMIN_IDS.replace(" ", "").split(",") if x.lstrip("-").isdigit())
+
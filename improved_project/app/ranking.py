@@ -0,0 +1,111 @@
+# app/ranking.py
+"""
+Ранжирование результатов подбора по релевантности.
+
+Очко строки — взвешенная сумма четырёх признаков в [0, 1]:
+  topic     — доля выбранных тематик, которые есть у блогера;
+  er        — engagement rate (колонка er, можно с «%» и десятичной запятой) относительно
+              95-го перцентиля каталога;
+  value     — охват на тенге: лучший из reach_reels / reach_stories / reach_post, делённый на price
+              (в логарифме, относительно 95-го перцентиля);
+  freshness — свежесть данных: exp-затухание по updated_at с полупериодом RANK_FRESHNESS_HALF_LIFE_DAYS,
+              возраст считается на момент запроса (снимок живёт долго, «сейчас» при сборке устаревает).
+Веса — RANK_WEIGHT_* в настройках. ER, охват на тенге и даты обновления разбираются один раз на снимок
+каталога (см. Catalog.ranker); на запрос остаётся посчитать признаки кандидатов и выбрать top-k:
+грубый отбор через np.argpartition, точный порядок лучших — кучей. При равных очках порядок прежний:
+свежие обновления, затем подписчики.
+"""
+from __future__ import annotations
+
+import heapq
+import time
+from typing import TYPE_CHECKING, Optional, Sequence
+
+import numpy as np
+
+from .config import settings
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+
+def _relative(values: np.ndarray) -> np.ndarray:
+    """Значения в [0, 1] относительно 95-го перцентиля; пропуски — 0."""
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return np.zeros(len(values))
+    top = np.percentile(finite, 95) or finite.max() or 1.0
+    return np.clip(np.nan_to_num(values / top, nan=0.0, posinf=0.0, neginf=0.0), 0.0, 1.0)
+
+
+class Ranker:
+    def __init__(self, cat: "Catalog") -> None:
+        import pandas as pd
+
+        self.cat = cat
+        df = cat.df
+        n = self.size = len(df)
+        index = cat.filter_index()
+
+        def number(col: str) -> np.ndarray:
+            if col not in df.columns:
+                return np.full(n, np.nan)
+            return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+
+        if "er" in df.columns:
+            er = df["er"].astype(str).str.replace("%", "", regex=False).str.replace(",", ".", regex=False)
+            self.er = _relative(pd.to_numeric(er.str.strip(), errors="coerce").to_numpy(dtype=float))
+        else:
+            self.er = np.zeros(n)
+
+        # Оценка охвата одной интеграции — лучший из форматов (её же использует campaign.py)
+        self.reach = np.fmax(np.fmax(number("reach_reels"), number("reach_stories")), number("reach_post"))
+        price = index.price
+        with np.errstate(divide="ignore", invalid="ignore"):
+            per_tenge = np.where(price > 0, self.reach / price, np.nan)
+        self.value = _relative(np.log1p(per_tenge))
+
+        # Дата обновления — в сутках Unix-времени (NaN, если не разобралась); свежесть — на запрос
+        if "updated_at" in df.columns:
+            ts = pd.to_datetime(df["updated_at"], errors="coerce")
+            self.updated = ((ts - pd.Timestamp(0)).dt.total_seconds() / 86400).to_numpy(dtype=float)
+        else:
+            self.updated = np.full(n, np.nan)
+        # Позиция строки в порядке «свежие, затем подписчики» — для равных очков
+        self.tiebreak = np.empty(n, dtype=np.int64)
+        self.tiebreak[index.order] = np.arange(n)
+
+    def freshness(self, rows: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        """Свежесть строк rows в [0, 1] на момент now (Unix-время; по умолчанию — сейчас)."""
+        today = (time.time() if now is None else now) / 86400
+        age_days = np.clip(today - self.updated[rows], 0, None)
+        half_life = max(settings.RANK_FRESHNESS_HALF_LIFE_DAYS, 1e-9)
+        return np.nan_to_num(np.exp2(-age_days / half_life), nan=0.0)
+
+    def scores(self, rows: np.ndarray, topic_ids: Sequence[int] = (), now: Optional[float] = None) -> np.ndarray:
+        """Очки строк rows; topic_ids — выбранные тематики (id словаря)."""
+        score = (settings.RANK_WEIGHT_ER * self.er[rows]
+                 + settings.RANK_WEIGHT_VALUE * self.value[rows]
+                 + settings.RANK_WEIGHT_FRESHNESS * self.freshness(rows, now))
+        if topic_ids:
+            # Совпадения тематик — сложением готовых списков строк по id (см. Catalog.rows_for)
+            hits = np.zeros(self.size, dtype=np.int16)
+            for t in topic_ids:
+                hits[self.cat.rows_for("topic", [t])] += 1
+            score += settings.RANK_WEIGHT_TOPIC * hits[rows] / len(topic_ids)
+        return score
+
+    def top(self, mask: np.ndarray, topic_ids: Sequence[int] = (), k: Optional[int] = None) -> np.ndarray:
+        """k лучших строк маски по убыванию очков (k=None — все)."""
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return rows
+        score = self.scores(rows, topic_ids)
+        tiebreak = self.tiebreak[rows]
+        if k is None or k * 4 >= len(rows):
+            order = np.lexsort((tiebreak, -score))
+            return rows[order[:k]]
+        # Тысячи кандидатов: грубо отбираем лучших (с запасом на равные очки), точно сортируем немногих
+        keep = np.argpartition(-score, k * 4)[:k * 4]
+        best = heapq.nsmallest(k, keep.tolist(), key=lambda i: (-score[i], tiebreak[i]))
+        return rows[best]
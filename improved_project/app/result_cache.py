@@ -0,0 +1,120 @@
+# app/result_cache.py
+"""
+Общий кеш результатов подбора: популярные сочетания (Алматы + бьюти + Русский) считаются один раз.
+
+Ключ — версия каталога + sha1 от нормализованных фильтров: города и тематики сведены к отсортированным
+id словаря (поэтому «Almaty» и «Алматы» дают один ключ), строки — к нижнему регистру, пустые
+фильтры отброшены. Значение — номера строк снимка в порядке выдачи, неизменяемый массив int32,
+общий для всех пользователей. Кеш ограничен числом записей и суммарным размером (LRU),
+а записи старых версий каталога удаляются, как только версия уходит из истории (см. catalog.refresh).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Tuple
+
+import numpy as np
+
+from .config import settings
+from .metrics import Counter, Gauge
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+LOOKUPS_TOTAL = Counter("result_cache_lookups_total", "Обращения к кешу результатов подбора", ["result"])
+ENTRIES = Gauge("result_cache_entries", "Записей в кеше результатов подбора")
+SIZE_BYTES = Gauge("result_cache_bytes", "Суммарный размер массивов в кеше результатов подбора")
+EVICTIONS_TOTAL = Counter("result_cache_evictions_total", "Вытесненные записи кеша результатов", ["reason"])
+
+
+def normalize_filters(cat: "Catalog", filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Канонический вид аргументов query_influencers: равные по смыслу фильтры дают равный словарь."""
+    out: Dict[str, Any] = {}
+    for name, value in filters.items():
+        if value is None or value == "" or value == [] or name == "limit":
+            continue
+        if name in ("city", "topic"):
+            value = sorted(cat.resolve(name, value))
+        elif name == "gender":
+            value = str(value).strip().lower()[:1]
+        elif isinstance(value, str):
+            value = value.strip().lower()
+        elif isinstance(value, tuple):
+            value = list(value)
+        out[name] = value
+    return out
+
+
+def cache_key(cat: "Catalog", filters: Dict[str, Any]) -> Tuple[str, str]:
+    payload = json.dumps(normalize_filters(cat, filters), sort_keys=True, ensure_ascii=False, default=str)
+    return cat.version, hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, cat: "Catalog", filters: Dict[str, Any],
+                       compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Номера строк для фильтров; compute() зовётся только при промахе."""
+        key = cache_key(cat, filters)
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is not None:
+                self._entries.move_to_end(key)
+                LOOKUPS_TOTAL.labels("hit").inc()
+                return rows
+        LOOKUPS_TOTAL.labels("miss").inc()
+        # Считаем вне замка: параллельный промах по тому же ключу лишь повторит работу
+        rows = np.asarray(compute(), dtype=np.int32)
+        rows.flags.writeable = False
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = rows
+                self._bytes += rows.nbytes
+                self._evict()
+            self._update_gauges()
+        return rows
+
+    def retain(self, versions: Iterable[str]) -> None:
+        """Удаляет записи версий каталога, которых больше нет в памяти."""
+        keep = set(versions)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] not in keep]:
+                self._bytes -= self._entries.pop(key).nbytes
+                EVICTIONS_TOTAL.labels("version").inc()
+            self._update_gauges()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, rows = self._entries.popitem(last=False)
+            self._bytes -= rows.nbytes
+            EVICTIONS_TOTAL.labels("size").inc()
+
+    def _update_gauges(self) -> None:
+        ENTRIES.set(len(self._entries))
+        SIZE_BYTES.set(self._bytes)
+
+    def hit_ratio(self) -> float:
+        hits = LOOKUPS_TOTAL.labels("hit").value
+        total = hits + LOOKUPS_TOTAL.labels("miss").value
+        return hits / total if total else 0.0
+
+
+results = ResultCache(settings.RESULT_CACHE_MAX_ENTRIES, settings.RESULT_CACHE_MAX_BYTES)
@@ -1,6 +1,7 @@
-from . import common, influencers
+from . import admin, common, influencers
 
 __all__ = [
+    "admin",
     "common",
     "influencers",
 ]
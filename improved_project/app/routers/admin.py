@@ -0,0 +1,53 @@
+# app/routers/admin.py
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+from typing import Any, Set
+
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, Message
+
+from ..profiler import ProfileBusy, admin_ids, parse_args, profile
+
+log = logging.getLogger(__name__)
+
+# Команды администраторов. Роутер подключается первым: команда не должна уйти в диалог регистрации.
+# Для остальных пользователей фильтр не пропускает апдейт, и он идёт дальше как обычный текст.
+router = Router(name="admin")
+router.message.filter(F.from_user.id.in_(admin_ids()))
+
+# Фоновые профилирования (ссылка нужна, чтобы их не собрал GC)
+_running: Set[asyncio.Task] = set()
+
+# Лимит подписи/сообщения Telegram — 4096 символов; отчёт обрезаем с запасом под разметку
+_MAX_REPORT = 3500
+
+
+@router.message(Command("profile"))
+async def on_profile(message: Message, command: CommandObject, fsm_storage: Any = None):
+    """/profile [секунды] [sample|cpu|mem] — профилирование живого бота, отчёт и файл в ответ."""
+    mode, seconds = parse_args(command.args)
+    # Замер идёт в фоне: хендлер не держит очередь чата и слот планировщика всё это время
+    task = asyncio.ensure_future(_profile_and_reply(message, mode, seconds, fsm_storage))
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+
+async def _profile_and_reply(message: Message, mode: str, seconds: float, fsm_storage: Any) -> None:
+    status = await message.answer(f"⏱ Профилирую {seconds:.0f} с (режим {mode})…")
+    try:
+        report = await profile(mode, seconds, fsm_storage)
+    except ProfileBusy:
+        await status.edit_text("Профилирование уже идёт — дождитесь его отчёта.")
+        return
+    except Exception:
+        log.exception("Профилирование не удалось")
+        await status.edit_text("Профилирование не удалось, подробности в логе.")
+        return
+    text = report.text if len(report.text) <= _MAX_REPORT else report.text[:_MAX_REPORT] + "\n…"
+    await status.edit_text(f"<pre>{html.escape(text)}</pre>")
+    for filename, data in report.files:
+        await message.answer_document(BufferedInputFile(data, filename=filename))
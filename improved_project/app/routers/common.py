@@ -21,7 +21,7 @@ async def _start_selection_lazy(message: Message, state: FSMContext):
     await start_selection(message, state)
 
 
-@router.message(F.text)
+@router.message(F.text, flags={"chat_action": "typing"})
 async def on_user_text(message: Message, state: FSMContext):
     # strict: работаем только с авторизованными по URL
     if settings.START_MODE.lower() == "strict" and not tokens.is_authorized(message.from_user.id):
@@ -49,7 +49,7 @@ async def on_user_text(message: Message, state: FSMContext):
         await _start_selection_lazy(message, state)
 
 
-@router.message(F.contact)
+@router.message(F.contact, flags={"chat_action": "typing"})
 async def on_contact(message: Message, state: FSMContext):
     if settings.START_MODE.lower() == "strict" and not tokens.is_authorized(message.from_user.id):
         return
@@ -2,20 +2,39 @@
 from __future__ import annotations
 
 import asyncio
+import logging
+from pathlib import Path
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
 from aiogram.fsm.context import FSMContext
-from typing import Set, List, Optional
+from typing import Any, Dict, Set, List, Optional, Tuple
 import re
-
-from ..states import SelectionBasicStates, SelectionDecisionStates, SelectionAdvancedStates
-from ..keyboards import paginated_multiselect_kb, results_nav_kb, result_item_kb
-from ..influencers import list_cities, list_topics, parse_age_range, query_influencers, paginate
+import numpy as np
+
+from ..states import SelectionBasicStates, SelectionDecisionStates, SelectionAdvancedStates, CampaignStates
+from ..keyboards import (
+    paginated_multiselect_kb, results_page_kb, facet_picker_kb, campaign_kb, similar_kb, export_kb,
+)
+from ..influencers import parse_age_range, parse_followers_range, parse_budget_max, query_influencers, paginate, rank_rows
+from .. import catalog
+from .. import candidates
+from ..result_cache import results
+from .. import callbacks as cbd
+from ..search import SEARCH_LABELS
+from ..brief import parse_brief, complete_brief
+from ..campaign import Campaign, build_campaign
+from .. import saved_searches
 from ..config import settings
-from ..influencers import export_pdf, export_excel
-from aiogram.types import BufferedInputFile
+from ..export_worker import ExportBusy, exporter, snapshot_path
+from ..export_cache import export_cache, export_key
+from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
 from .. import sheets as gs
 from ..formatting import ensure_min_words
+from ..coalesce import coalescer
+from ..outbound import Priority, priority
+
+log = logging.getLogger(__name__)
 
 router = Router(name="influencer_selection")
 
@@ -48,61 +67,151 @@ def _ask_age_clarify(msg: Message):
         reply_markup=kb
     )
 
+_MARITAL_STATUS = {"замужем/женат": "married", "не замужем/не женат": "single", "разведен(а)": "divorced"}
+
+# Все ключи FSM, из которых _query_filters собирает фильтры. Новый подбор и пропущенные шаги
+# обнуляют их явно: иначе фильтр прошлого раунда попал бы в ключ общего кеша результатов
+# и в сохранённый поиск, хотя карта кандидатов его не применяла
+_FILTER_KEYS = dict(sel_cities=0, sel_topics=0, age_text=None, pending_age=None, language=None, gender=None,
+                    marital=None, has_children=None, children_count=None, followers_text=None, formats=None,
+                    budget_text=None)
+_ADVANCED_KEYS = ("marital", "has_children", "children_count", "followers_text", "formats", "budget_text")
+_COUNT_MARK = "👥"
+
+def _with_count(text: str, n: Optional[int]) -> str:
+    # Живой счётчик под вопросом шага: сколько блогеров подходит под уже выбранные фильтры
+    text = ensure_min_words(text)
+    return text if n is None else f"{text}\n\n{_COUNT_MARK} Подходит блогеров: {n}"
+
+def _strip_count(text: str) -> str:
+    return text.split(f"\n\n{_COUNT_MARK}", 1)[0]
+
+def _load_catalog() -> catalog.Catalog:
+    # Колонки фильтров строим здесь же, в потоке, а не на первом шаге подбора в event loop
+    cat = catalog.current()
+    cat.filter_index()
+    return cat
+
+async def _narrow(state: FSMContext, **filters: Any) -> Optional[int]:
+    """Шаг подбора сужает карту кандидатов сессии (см. candidates.py); возвращает, сколько осталось."""
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        # Снимок, на котором начат подбор, вытеснен: итог посчитаем целиком в _show_results_or_pay
+        await state.update_data(cand=None, cand_stale=True)
+        return None
+    bits = cat.filter_index().narrow(data.get("cand"), **filters)
+    await state.update_data(cand=bits)
+    return candidates.count(bits, len(cat))
+
+def _preview_count(data: Dict[str, Any], **filters: Any) -> Optional[int]:
+    """Сколько блогеров останется, если добавить filters, — без записи в сессию."""
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        return None
+    if not any(filters.values()):
+        return candidates.count(data.get("cand"), len(cat))
+    return int(cat.filter_index().evaluate(data.get("cand"), **filters).sum())
+
+def _picker_kb(vocab: catalog.Vocabulary, prefix: str, selected: int, page: int):
+    # Выбранные значения — битовая маска по id словаря (см. callbacks.py)
+    limit = CITIES_LIMIT if prefix == "city" else TOPICS_LIMIT
+    return facet_picker_kb(
+        vocab, prefix, page=page, selected_mask=selected, limit=limit, items_per_page=10,
+        search_query=f"{SEARCH_LABELS[prefix]} ",
+    )
+
+async def _rerender_picker(msg: Message, state: FSMContext, prefix: str, sel_key: str, page_key: str):
+    # Вызывается отложенно (см. coalescer), поэтому читаем состояние на момент отправки
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        # Снимок вытеснен: следующее нажатие перезапустит подбор (см. _restart_expired)
+        return
+    vocab = cat.vocabulary(prefix)
+    selected = int(data.get(sel_key) or 0)
+    page = int(data.get(page_key) or 0)
+    n = _preview_count(data, **{prefix: vocab.decode_mask(selected)})
+    await msg.edit_text(
+        _with_count(_strip_count(msg.html_text), n),
+        reply_markup=_picker_kb(vocab, prefix, selected, page),
+    )
+
 # ===== entrypoint =====
 
 async def start_selection(message: Message, state: FSMContext):
     # города (обязательный мультивыбор)
     await state.set_state(SelectionBasicStates.cities)
-    cities = list_cities(limit=CITIES_LIMIT)
-    await state.update_data(sel_cities=set(), cities_page=0)
+    # Закрепляем версию каталога: id в кнопках пикеров относятся к её словарям
+    cat = await asyncio.to_thread(_load_catalog)
+    await state.update_data(cat_ver=cat.version, cities_page=0, topics_page=0, brief=False, cand=None, cand_stale=False,
+                            **_FILTER_KEYS)
     await message.answer(
-        ensure_min_words("Супер! Начнём с городов. Можно выбрать несколько — галочка появится рядом."),
-        reply_markup=paginated_multiselect_kb(
-            cities, "city", selected_items=set(), page=0, items_per_page=10, show_skip=False, always_show_done=True
+        _with_count(
+            "Супер! Начнём с городов. Можно выбрать несколько — галочка появится рядом. "
+            "Или опишите задачу одним сообщением, например: «Алматы, мамы-блогеры 25–35, "
+            "до 50k подписчиков, бюджет 200k».",
+            len(cat),
         ),
+        reply_markup=_picker_kb(cat.cities, "city", 0, 0),
     )
 
+
+async def _restart_expired(event: Message | CallbackQuery, state: FSMContext):
+    """
+    Снимок каталога, на котором начат подбор, вытеснен новыми версиями: выбор в кнопках по его id
+    не расшифровать, поэтому подбор начинается заново на текущем каталоге.
+    """
+    text = "Каталог блогеров обновился, пока шёл подбор, — начнём выбор заново."
+    if isinstance(event, CallbackQuery):
+        await event.answer(text, show_alert=True)
+        await start_selection(event.message, state)
+    else:
+        await event.answer(text)
+        await start_selection(event, state)
+
 # ===== cities =====
 
 @router.callback_query(SelectionBasicStates.cities, F.data.startswith("city:"))
 async def on_city(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    selected: Set[str] = set(data.get("sel_cities") or [])
-    page = int(data.get("cities_page") or 0)
-    cities = list_cities(limit=CITIES_LIMIT)
-
-    _, action, value = cb.data.split(":", 2)
-    if action == "pick":
-        if value in selected:
-            selected.remove(value)
-        else:
-            selected.add(value)
-        await state.update_data(sel_cities=selected)
-    elif action == "page":
-        page = max(0, int(value))
-        await state.update_data(cities_page=page)
-    elif action == "done":
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        await _restart_expired(cb, state)
+        return
+    selected = int(data.get("sel_cities") or 0)
+
+    _, action, value = cbd.decode(cb.data)
+    if action == cbd.PICK and value is not None:
+        await state.update_data(sel_cities=selected ^ (1 << value))
+    elif action == cbd.PAGE and value is not None:
+        await state.update_data(cities_page=max(0, value))
+    elif action == cbd.DONE:
         if not selected:
             await cb.answer("Нужно выбрать хотя бы один город", show_alert=True)
+        elif data.get("brief") and data.get("sel_topics"):
+            # Бриф уже дал тематики и остальные фильтры — города были единственным пробелом
+            await coalescer.cancel(cb.message)
+            cities = cat.cities.decode_mask(selected)
+            await _narrow(state, city=cities)
+            await _show_results_or_pay(cb, state)
+            await cb.answer()
+            return
         else:
             # Переходим к тематикам
+            await coalescer.cancel(cb.message)
+            cities = cat.cities.decode_mask(selected)
+            n = await _narrow(state, city=cities)
             await state.set_state(SelectionBasicStates.topics)
-            await state.update_data(sel_topics=set(), topics_page=0)
-            topics = list_topics(limit=TOPICS_LIMIT)
+            await state.update_data(sel_topics=0, topics_page=0)
             await cb.message.edit_text(
-                ensure_min_words("Отличный выбор городов! Теперь тематики — тоже можно несколько."),
-                reply_markup=paginated_multiselect_kb(
-                    topics, "topic", selected_items=set(), page=0, items_per_page=10, show_skip=False, always_show_done=True
-                ),
+                _with_count("Отличный выбор городов! Теперь тематики — тоже можно несколько.", n),
+                reply_markup=_picker_kb(cat.topics, "topic", 0, 0),
             )
             await cb.answer()
             return
-    # re-render
-    await cb.message.edit_reply_markup(
-        reply_markup=paginated_multiselect_kb(
-            cities, "city", selected_items=selected, page=page, items_per_page=10, show_skip=False, always_show_done=True
-        )
-    )
+    # re-render: состояние уже обновлено, а правку клавиатуры склеиваем с соседними нажатиями
+    coalescer.schedule(cb.message, lambda: _rerender_picker(cb.message, state, "city", "sel_cities", "cities_page"))
     await cb.answer()
 
 # ===== topics =====
@@ -110,39 +219,137 @@ async def on_city(cb: CallbackQuery, state: FSMContext):
 @router.callback_query(SelectionBasicStates.topics, F.data.startswith("topic:"))
 async def on_topic(cb: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    selected: Set[str] = set(data.get("sel_topics") or [])
-    page = int(data.get("topics_page") or 0)
-    topics = list_topics(limit=TOPICS_LIMIT)
-
-    _, action, value = cb.data.split(":", 2)
-    if action == "pick":
-        if value in selected:
-            selected.remove(value)
-        else:
-            selected.add(value)
-        await state.update_data(sel_topics=selected)
-    elif action == "page":
-        page = max(0, int(value))
-        await state.update_data(topics_page=page)
-    elif action == "done":
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        await _restart_expired(cb, state)
+        return
+    selected = int(data.get("sel_topics") or 0)
+
+    _, action, value = cbd.decode(cb.data)
+    if action == cbd.PICK and value is not None:
+        await state.update_data(sel_topics=selected ^ (1 << value))
+    elif action == cbd.PAGE and value is not None:
+        await state.update_data(topics_page=max(0, value))
+    elif action == cbd.DONE:
         if not selected:
             await cb.answer("Нужно выбрать хотя бы одну тематику", show_alert=True)
+        elif data.get("brief"):
+            # Остальные фильтры пришли в брифе — вопросы про возраст и язык не задаём
+            await coalescer.cancel(cb.message)
+            await _narrow(state, topic=cat.topics.decode_mask(selected))
+            await _show_results_or_pay(cb, state)
+            await cb.answer()
+            return
         else:
             # Переходим к возрасту (optional)
+            await coalescer.cancel(cb.message)
+            n = await _narrow(state, topic=cat.topics.decode_mask(selected))
             await state.set_state(SelectionBasicStates.age)
             await cb.message.edit_text(
-                ensure_min_words("Какой возраст блогеров предпочтителен? Можно написать диапазон (например, 20-24) или оставить пустым."),
+                _with_count("Какой возраст блогеров предпочтителен? Можно написать диапазон (например, 20-24) или оставить пустым.", n),
                 reply_markup=None
             )
             await cb.answer()
             return
 
-    await cb.message.edit_reply_markup(
-        reply_markup=paginated_multiselect_kb(
-            topics, "topic", selected_items=selected, page=page, items_per_page=10, show_skip=False, always_show_done=True
+    coalescer.schedule(cb.message, lambda: _rerender_picker(cb.message, state, "topic", "sel_topics", "topics_page"))
+    await cb.answer()
+
+# ===== search (inline-режим: «@bot город: алм») =====
+
+_FACET_STATE = {
+    SelectionBasicStates.cities.state: ("city", "sel_cities", "cities_page"),
+    SelectionBasicStates.topics.state: ("topic", "sel_topics", "topics_page"),
+}
+
+
+@router.inline_query()
+async def on_inline_search(query: InlineQuery, state: FSMContext):
+    text = query.query or ""
+    facet = next((f for f, label in SEARCH_LABELS.items() if text.lower().startswith(label)), None)
+    if facet is not None:
+        text = text[len(SEARCH_LABELS[facet]):]
+    else:
+        facet = _FACET_STATE.get(await state.get_state(), ("city",))[0]
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver")) or await asyncio.to_thread(catalog.current)
+    vocab = cat.vocabulary(facet)
+    label = SEARCH_LABELS[facet]
+    results = [
+        InlineQueryResultArticle(
+            id=f"{facet}:{item_id}",
+            title=vocab.values[item_id],
+            description=f"Блогеров: {vocab.counts[item_id]}",
+            input_message_content=InputTextMessageContent(message_text=f"{label} {vocab.values[item_id]}"),
         )
+        for item_id in cat.prefix_index(facet).search(text, limit=20)
+    ]
+    # Ответ зависит от закреплённой версии каталога и состояния пользователя (фасет без подписи
+    # берётся из шага подбора): общий кеш Telegram отдал бы чужие значения и id
+    await query.answer(results, cache_time=30, is_personal=True)
+
+
+@router.message(SelectionBasicStates.cities, F.text.startswith(SEARCH_LABELS["city"]))
+@router.message(SelectionBasicStates.topics, F.text.startswith(SEARCH_LABELS["topic"]))
+async def on_search_pick(msg: Message, state: FSMContext):
+    # Сюда приходит сообщение, отправленное выбором из inline-поиска
+    facet, sel_key, page_key = _FACET_STATE[await state.get_state()]
+    value = msg.text[len(SEARCH_LABELS[facet]):].strip()
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        await _restart_expired(msg, state)
+        return
+    vocab = cat.vocabulary(facet)
+    item_id = vocab.id_of(value)
+    if item_id is None:
+        await msg.answer(ensure_min_words(f"Не нашла «{value}» в каталоге. Попробуйте выбрать из подсказок поиска."))
+        return
+    selected = int(data.get(sel_key) or 0) | (1 << item_id)
+    await state.update_data(**{sel_key: selected})
+    chosen = ", ".join(vocab.decode_mask(selected))
+    await msg.answer(
+        ensure_min_words(f"Добавила «{value}». Сейчас выбрано: {chosen}."),
+        reply_markup=_picker_kb(vocab, facet, selected, int(data.get(page_key) or 0)),
     )
-    await cb.answer()
+
+# ===== brief (всё одним сообщением) =====
+
+@router.message(SelectionBasicStates.cities, F.text)
+async def on_brief(msg: Message, state: FSMContext):
+    # Свободный текст вместо кнопок: разбираем сразу все фильтры и спрашиваем только недостающее
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver")) or await asyncio.to_thread(_load_catalog)
+    brief = parse_brief(msg.text or "", cat)
+    await complete_brief(brief, msg.text or "", cat)
+    if brief.is_empty():
+        await msg.answer(ensure_min_words(
+            "Не получилось разобрать запрос. Выберите города кнопками выше или опишите задачу одним "
+            "сообщением, например: «Алматы, мамы-блогеры 25–35, до 50k подписчиков, бюджет 200k»."
+        ))
+        return
+
+    await state.update_data(cat_ver=cat.version, cities_page=0, topics_page=0, cand=None, cand_stale=False,
+                            **brief.state_data())
+    # Всё, что дал бриф, сразу сужает кандидатов; недостающий фасет доберёт пикер
+    n = await _narrow(state, **_query_filters(await state.get_data()))
+    summary = brief.describe(cat)
+    missing = brief.missing()
+    if "city" in missing:
+        await msg.answer(
+            _with_count(f"Поняла: {summary}. Осталось выбрать города.", n),
+            reply_markup=_picker_kb(cat.cities, "city", 0, 0),
+        )
+        return
+    if "topic" in missing:
+        await state.set_state(SelectionBasicStates.topics)
+        await msg.answer(
+            _with_count(f"Поняла: {summary}. Осталось выбрать тематики.", n),
+            reply_markup=_picker_kb(cat.topics, "topic", 0, 0),
+        )
+        return
+    await msg.answer(ensure_min_words(f"Поняла: {summary}. Подбираю блогеров."))
+    await _show_results_or_pay(msg, state)
 
 # ===== age (optional, с уточнением «24») =====
 
@@ -157,6 +364,7 @@ async def on_age_text(msg: Message, state: FSMContext):
             await _ask_age_clarify(msg)
             return
         await state.update_data(age_text=text)
+    n = await _narrow(state, age_range=parse_age_range(text) if text else None)
 
     # Переходим к языку
     await state.set_state(SelectionBasicStates.language)
@@ -166,7 +374,7 @@ async def on_age_text(msg: Message, state: FSMContext):
         items_per_page=4,
         always_show_done=False
     )
-    await msg.answer(ensure_min_words("Какой язык контента желателен? Выберите один вариант или «Пропустить»."), reply_markup=kb)
+    await msg.answer(_with_count("Какой язык контента желателен? Выберите один вариант или «Пропустить».", n), reply_markup=kb)
 
 @router.callback_query(F.data.startswith("ageclar:"))
 async def on_age_clarify(cb: CallbackQuery, state: FSMContext):
@@ -178,7 +386,9 @@ async def on_age_clarify(cb: CallbackQuery, state: FSMContext):
         "От": f">= {base}",
         "Диапазон 20–24": "20-24",
     }
-    await state.update_data(age_text=mapping.get(choice, base), pending_age=None)
+    age_text = mapping.get(choice, base)
+    await state.update_data(age_text=age_text, pending_age=None)
+    n = await _narrow(state, age_range=parse_age_range(age_text))
     await cb.message.edit_reply_markup(None)
     # дальше спросим язык
     await state.set_state(SelectionBasicStates.language)
@@ -188,7 +398,7 @@ async def on_age_clarify(cb: CallbackQuery, state: FSMContext):
         items_per_page=4,
         always_show_done=False
     )
-    await cb.message.answer(ensure_min_words("Понял возраст. Теперь язык контента?"), reply_markup=kb)
+    await cb.message.answer(_with_count("Понял возраст. Теперь язык контента?", n), reply_markup=kb)
     await cb.answer()
 
 # ===== language (buttons) =====
@@ -198,6 +408,7 @@ async def on_language(cb: CallbackQuery, state: FSMContext):
     choice = cb.data.split(":", 2)[2]
     language = None if choice == "Пропустить" else choice
     await state.update_data(language=language)
+    n = await _narrow(state, language=language)
 
     # Пол попытаемся определить из текста пользователя дальше, но сейчас спрашивать не будем.
     await state.update_data(gender=None)
@@ -210,7 +421,7 @@ async def on_language(cb: CallbackQuery, state: FSMContext):
         always_show_done=False
     )
     await cb.message.edit_text(
-        ensure_min_words("Хочешь добавить точные фильтры (семейное положение, подписчики, форматы, бюджет) или сразу показать результат?"),
+        _with_count("Хочешь добавить точные фильтры (семейное положение, подписчики, форматы, бюджет) или сразу показать результат?", n),
         reply_markup=kb
     )
     await cb.answer()
@@ -229,10 +440,11 @@ async def on_decide(cb: CallbackQuery, state: FSMContext):
             always_show_done=False,
         )
         await cb.message.edit_text(
-            ensure_min_words("Можем уточнить семейное положение, если это важно для вашего бренда."),
+            _with_count("Можем уточнить семейное положение, если это важно для вашего бренда.", await _narrow(state)),
             reply_markup=kb,
         )
     else:
+        await state.update_data(**{k: _FILTER_KEYS[k] for k in _ADVANCED_KEYS})
         await _show_results_or_pay(cb, state)
     await cb.answer()
 
@@ -244,6 +456,7 @@ async def on_marital(cb: CallbackQuery, state: FSMContext):
     choice = cb.data.split(":", 2)[2]
     if choice != "Пропустить":
         await state.update_data(marital=choice)
+        n = await _narrow(state, marital_status=_MARITAL_STATUS.get(choice))
         # Доп-вопрос: дети
         await state.set_state(SelectionAdvancedStates.children)
         kb = paginated_multiselect_kb(
@@ -252,13 +465,14 @@ async def on_marital(cb: CallbackQuery, state: FSMContext):
             items_per_page=3,
             always_show_done=False,
         )
-        await cb.message.edit_text(ensure_min_words("Поняла. Есть ли дети у блогера? Это поможет точнее сегментировать аудиторию."), reply_markup=kb)
+        await cb.message.edit_text(_with_count("Поняла. Есть ли дети у блогера? Это поможет точнее сегментировать аудиторию.", n), reply_markup=kb)
     else:
         # Здесь пока просто завершим базовый этап — на следующем шаге подключим оплату и выдачу.
         await cb.message.edit_text("Принято. На следующем шаге подключу оплату и покажу результаты.")
-        # Пропустить — идем дальше
+        # Пропустить — идем дальше; вопрос про детей тоже пропущен
+        await state.update_data(marital=None, has_children=None, children_count=None)
         await state.set_state(SelectionAdvancedStates.followers)
-        await cb.message.edit_text(ensure_min_words("Окей, пропустим. Укажите желаемый диапазон подписчиков, например 10k-50k или 'до 100k'."))
+        await cb.message.edit_text(_with_count("Окей, пропустим. Укажите желаемый диапазон подписчиков, например 10k-50k или 'до 100k'.", await _narrow(state)))
     await cb.answer()
 
 
@@ -267,6 +481,7 @@ async def on_children(cb: CallbackQuery, state: FSMContext):
     choice = cb.data.split(":", 2)[2]
     if choice == "Да":
         await state.update_data(has_children=True)
+        n = await _narrow(state, has_children=True)
         await state.set_state(SelectionAdvancedStates.children_count)
         kb = paginated_multiselect_kb(
             items=["1", "2", "3", "4", "более 4", "Пропустить"],
@@ -274,24 +489,28 @@ async def on_children(cb: CallbackQuery, state: FSMContext):
             items_per_page=6,
             always_show_done=False,
         )
-        await cb.message.edit_text(ensure_min_words("Сколько детей у блогера? Поможет уточнить портрет аудитории."), reply_markup=kb)
+        await cb.message.edit_text(_with_count("Сколько детей у блогера? Поможет уточнить портрет аудитории.", n), reply_markup=kb)
     elif choice == "Нет":
-        await state.update_data(has_children=False)
+        await state.update_data(has_children=False, children_count=None)
+        n = await _narrow(state, has_children=False)
         await state.set_state(SelectionAdvancedStates.followers)
-        await cb.message.edit_text(ensure_min_words("Принято. Теперь желаемый диапазон подписчиков? Напишите форматом 10k-50k или 'от 5k'."))
+        await cb.message.edit_text(_with_count("Принято. Теперь желаемый диапазон подписчиков? Напишите форматом 10k-50k или 'от 5k'.", n))
     else:
         # Пропустить
+        await state.update_data(has_children=None, children_count=None)
         await state.set_state(SelectionAdvancedStates.followers)
-        await cb.message.edit_text(ensure_min_words("Хорошо, пропустим. Укажите желаемый диапазон подписчиков."))
+        await cb.message.edit_text(_with_count("Хорошо, пропустим. Укажите желаемый диапазон подписчиков.", await _narrow(state)))
     await cb.answer()
 
 
 @router.callback_query(SelectionAdvancedStates.children_count, F.data.startswith("chcount:"))
 async def on_children_count(cb: CallbackQuery, state: FSMContext):
     val = cb.data.split(":", 2)[2]
-    await state.update_data(children_count=("more" if val == "более 4" else val if val != "Пропустить" else None))
+    children_count = "more" if val == "более 4" else val if val != "Пропустить" else None
+    await state.update_data(children_count=children_count)
+    n = await _narrow(state, children_count=children_count)
     await state.set_state(SelectionAdvancedStates.followers)
-    await cb.message.edit_text(ensure_min_words("Спасибо! Теперь укажите диапазон подписчиков блогера."))
+    await cb.message.edit_text(_with_count("Спасибо! Теперь укажите диапазон подписчиков блогера.", n))
     await cb.answer()
 
 
@@ -301,8 +520,10 @@ async def on_children_count(cb: CallbackQuery, state: FSMContext):
 async def on_followers(msg: Message, state: FSMContext):
     txt = (msg.text or "").strip()
     await state.update_data(followers_text=txt)
+    fmin, fmax = parse_followers_range(txt)
+    n = await _narrow(state, followers_min=fmin, followers_max=fmax)
     await state.set_state(SelectionAdvancedStates.formats)
-    await msg.answer(ensure_min_words("Какие форматы интеграций вам подходят: stories, reels, post? Можно несколько, перечислите через запятую."))
+    await msg.answer(_with_count("Какие форматы интеграций вам подходят: stories, reels, post? Можно несколько, перечислите через запятую.", n))
 
 
 @router.message(SelectionAdvancedStates.formats, F.text)
@@ -310,95 +531,81 @@ async def on_formats(msg: Message, state: FSMContext):
     txt = (msg.text or "").strip()
     await state.update_data(formats=txt)
     await state.set_state(SelectionAdvancedStates.budget)
-    await msg.answer(ensure_min_words("Какой бюджет комфортен? Можно указать диапазон, например 50-150 тысяч, или 'до 80 тысяч'."))
+    await msg.answer(_with_count("Какой бюджет комфортен? Можно указать диапазон, например 50-150 тысяч, или 'до 80 тысяч'.", await _narrow(state)))
 
 
 @router.message(SelectionAdvancedStates.budget, F.text)
 async def on_budget(msg: Message, state: FSMContext):
     txt = (msg.text or "").strip()
     await state.update_data(budget_text=txt)
+    await _narrow(state, budget_max=parse_budget_max(txt))
     # Завершили advanced — показать оплату/результаты
     await _show_results_or_pay(msg, state)
 
 
 # ===== results and payments (mock) =====
 
-async def _parse_followers_range(text: Optional[str]) -> tuple[Optional[int], Optional[int]]:
-    if not text:
-        return None, None
-    t = text.lower().replace(" ", "").replace("к", "000").replace("k", "000").replace("тыс", "000")
-    import re
-    # форматы: 10k-50k, от 5000, до 20000
-    m = re.match(r"^(\d+)-(\d+)$", t)
-    if m:
-        a, b = int(m.group(1)), int(m.group(2))
-        return (min(a, b), max(a, b))
-    m = re.match(r"^>=?(\d+)$|^от(\d+)$", t)
-    if m:
-        num = int(next(g for g in m.groups() if g))
-        return (num, None)
-    m = re.match(r"^<=?(\d+)$|^до(\d+)$", t)
-    if m:
-        num = int(next(g for g in m.groups() if g))
-        return (None, num)
-    m = re.match(r"^(\d+)$", t)
-    if m:
-        x = int(m.group(1)); return (x, x)
-    return (None, None)
-
-
-async def _parse_budget_max(text: Optional[str]) -> Optional[int]:
-    if not text:
-        return None
-    t = text.lower().replace(" ", "").replace("к", "000").replace("k", "000").replace("тыс", "000")
-    import re
-    # берем верхнюю границу
-    m = re.match(r"^(\d+)-(\d+)$", t)
-    if m:
-        a, b = int(m.group(1)), int(m.group(2))
-        return max(a, b)
-    m = re.match(r"^<=?(\d+)$|^до(\d+)$", t)
-    if m:
-        return int(next(g for g in m.groups() if g))
-    m = re.match(r"^(\d+)$", t)
-    if m:
-        return int(m.group(1))
-    return None
-
-
-async def _show_results_or_pay(event: Message | CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    cities = list(data.get("sel_cities") or [])
-    topics = list(data.get("sel_topics") or [])
+def _query_filters(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Аргументы query_influencers из данных FSM (пошаговый подбор и бриф пишут одни и те же ключи).
+    CatalogExpired, если закреплённый снимок уже вытеснен (см. catalog.vocabulary).
+    """
+    cat_ver = data.get("cat_ver")
+    cities = catalog.vocabulary("city", cat_ver).decode_mask(int(data.get("sel_cities") or 0))
+    topics = catalog.vocabulary("topic", cat_ver).decode_mask(int(data.get("sel_topics") or 0))
     age_text = data.get("age_text")
-    lang = data.get("language")
-    gender = data.get("gender")
-    marital = data.get("marital")
-    has_children = data.get("has_children")
-    children_count = data.get("children_count")
-    followers_text = data.get("followers_text")
-    budget_text = data.get("budget_text")
-
-    age_rng = parse_age_range(age_text) if age_text else None
-    fmin, fmax = await _parse_followers_range(followers_text)
-    bmax = await _parse_budget_max(budget_text)
-
-    df = query_influencers(
+    fmin, fmax = parse_followers_range(data.get("followers_text"))
+    return dict(
         city=cities or None,
         topic=topics or None,
-        age_range=age_rng,
-        gender=gender,
-        language=lang,
-        marital_status=("married" if marital == "замужем/женат" else "single" if marital == "не замужем/не женат" else "divorced" if marital == "разведен(а)" else None),
-        has_children=has_children,
-        children_count=children_count,
+        age_range=parse_age_range(age_text) if age_text else None,
+        gender=data.get("gender"),
+        language=data.get("language"),
+        marital_status=_MARITAL_STATUS.get(data.get("marital")),
+        has_children=data.get("has_children"),
+        children_count=data.get("children_count"),
         followers_min=fmin,
         followers_max=fmax,
-        budget_max=bmax,
-        limit=None,
+        budget_max=parse_budget_max(data.get("budget_text")),
     )
 
-    await state.update_data(results_df=df.to_dict(orient="records"), res_page=1, picked=set())
+
+def _result_mask(data: Dict[str, Any]) -> Tuple[catalog.Catalog, np.ndarray]:
+    """Вся отфильтрованная выборка сессии (а не только top-k выдачи): снимок и маска строк. Зовут из потока."""
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is not None and "cand" in data and not data.get("cand_stale"):
+        return cat, cat.filter_index().evaluate(data.get("cand"))
+    # Снимок подбора вытеснен: фильтры выдачи сохранены значениями, их можно применить к текущему
+    cat = catalog.current()
+    return cat, cat.filter_index().evaluate(**_result_filters(data))
+
+
+def _result_filters(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Фильтры показанной выдачи: сохранены значениями (не id), поэтому переживают смену версии каталога."""
+    return data.get("res_filters") or _query_filters(data)
+
+
+async def _show_results_or_pay(event: Message | CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    cat = catalog.get(data.get("cat_ver"))
+    if cat is None:
+        await _restart_expired(event, state)
+        return
+    filters = _query_filters(data)
+    if "cand" in data and not data.get("cand_stale"):
+        # Каждый шаг уже сузил карту кандидатов — осталось ранжировать её по релевантности.
+        # Та же выборка по тем же фильтрам могла уже посчитаться у другого пользователя
+        mask = cat.filter_index().evaluate(data.get("cand"))
+        rows = results.get_or_compute(cat, filters, lambda: rank_rows(cat, mask, filters["topic"]))
+        df = cat.df.iloc[rows]
+    else:
+        # В отдельном потоке: loop свободен, а более новое действие пользователя может отменить ожидание
+        df = await asyncio.to_thread(query_influencers, **filters, limit=None)
+        cat = catalog.get(None)
+
+    # res_filters — для «Сообщать о новых» (см. saved_searches.py)
+    await state.update_data(results_df=df.to_dict(orient="records"), res_page=1, picked=set(),
+                            res_ver=cat.version if cat is not None else None, res_filters=filters)
 
     # MOCK paywall: если нет флага paid, предложим оплату; иначе сразу показываем
     paid = bool(data.get("paid"))
@@ -415,8 +622,8 @@ async def _show_results_or_pay(event: Message | CallbackQuery, state: FSMContext
     await _render_results(event, state)
 
 
-async def _render_results(evt: Message | CallbackQuery, state: FSMContext):
-    data = await state.get_data()
+def _results_page(data: dict):
+    """Текст и клавиатура текущей страницы результатов из данных FSM."""
     records = data.get("results_df") or []
     page = int(data.get("res_page") or 1)
     per = settings.RESULTS_PER_PAGE
@@ -443,26 +650,26 @@ async def _render_results(evt: Message | CallbackQuery, state: FSMContext):
         msg_text = ensure_min_words("\n".join(text_lines))
 
     selected: set[str] = set(data.get("picked") or [])
-    kb_select = result_item_kb(usernames, selected)
-    kb_nav = results_nav_kb(page, total, allow_select_done=True)
+    return msg_text, results_page_kb(usernames, selected, page, total)
+
 
+async def _render_results(evt: Message | CallbackQuery, state: FSMContext):
+    # Страница результатов — одно сообщение: текст, выбор блогеров и навигация в одной клавиатуре
+    msg_text, kb = _results_page(await state.get_data())
     if isinstance(evt, CallbackQuery):
-        await evt.message.edit_text(msg_text)
-        await evt.message.edit_reply_markup(kb_select)
-        # Отправим навигацию отдельным сообщением один раз на страницу
-        await evt.message.answer("Навигация по результатам:", reply_markup=kb_nav)
-        await evt.answer()
+        await evt.message.edit_text(msg_text, reply_markup=kb)
     else:
-        await evt.answer(msg_text, reply_markup=kb_select)
-        await evt.answer("Навигация по результатам:", reply_markup=kb_nav)
+        await evt.answer(msg_text, reply_markup=kb)
 
 
 @router.callback_query(F.data.startswith("res:"))
 async def on_results_nav(cb: CallbackQuery, state: FSMContext):
-    _, action, value = cb.data.split(":", 2)
+    _, action, value = (cb.data.split(":", 2) + [""])[:3]
     if action == "page":
         await state.update_data(res_page=max(1, int(value)))
-        await _render_results(cb, state)
+        # Несколько быстрых «Вперёд» подряд — одна перерисовка последней выбранной страницы
+        coalescer.schedule(cb.message, lambda: _render_results(cb, state))
+        await cb.answer()
     elif action == "done":
         data = await state.get_data()
         picked = list(set(data.get("picked") or []))
@@ -478,20 +685,45 @@ async def on_results_nav(cb: CallbackQuery, state: FSMContext):
                 await asyncio.to_thread(gs.append_selection, user.id, user.username, picked, None, None)
             except Exception:
                 pass
-            await cb.message.bot.send_message(
-                settings.MANAGER_CONTACT,
-                f"Новый подбор завершен.\n{user_line}\nВыбранные блогеры: {chosen}"
-            )
+            # Уведомление менеджеру уступает очередь ответам пользователям
+            with priority(Priority.NOTIFY):
+                await cb.message.bot.send_message(
+                    settings.MANAGER_CONTACT,
+                    f"Новый подбор завершен.\n{user_line}\nВыбранные блогеры: {chosen}"
+                )
         except Exception:
             pass
+        await coalescer.cancel(cb.message)
         await cb.message.edit_text(ensure_min_words("Спасибо! Я передам менеджеру ваши контакты и выбранных блогеров. Мы свяжемся с вами в ближайшее время. Хотите начать новый подбор? Нажмите 'Новый подбор'."))
         await cb.answer()
     elif action == "export":
-        kb = paginated_multiselect_kb(["PDF", "Excel", "Отмена"], "expfmt", items_per_page=3, always_show_done=False)
-        await cb.message.answer("Выберите формат экспорта:", reply_markup=kb)
+        data = await state.get_data()
+        _, mask = await asyncio.to_thread(_result_mask, data)
+        total = min(int(mask.sum()), settings.EXPORT_MAX_ROWS)
+        kb = export_kb(len(set(data.get("picked") or [])), total)
+        await cb.message.answer("Выберите формат экспорта и что выгрузить:", reply_markup=kb)
+        await cb.answer()
+    elif action == "campaign":
+        # budget_text — потолок цены одного блогера; для кампании нужен общий бюджет
+        await state.update_data(prev_state=await state.get_state())
+        await state.set_state(CampaignStates.budget)
+        await cb.message.answer(ensure_min_words(
+            "Какой общий бюджет кампании? Например, 500 тысяч или 1,5 млн — соберу из выборки набор блогеров "
+            "с максимальным суммарным охватом."
+        ))
         await cb.answer()
+    elif action == "watch":
+        data = await state.get_data()
+        filters = data.get("res_filters")
+        if not filters:
+            await cb.answer("Сначала покажите результаты подбора", show_alert=True)
+            return
+        title = ", ".join((filters.get("city") or []) + (filters.get("topic") or [])) or "все блогеры"
+        await asyncio.to_thread(saved_searches.store.add, cb.from_user.id, cb.message.chat.id, filters, title)
+        await cb.answer("Сообщу, когда в каталоге появятся новые блогеры по этому подбору", show_alert=True)
     elif action == "new":
         # Перезапуск сценария подбора без повторной оплаты
+        await coalescer.cancel(cb.message)
         await start_selection(cb.message, state)
         await cb.answer()
 
@@ -506,27 +738,154 @@ async def on_pick(cb: CallbackQuery, state: FSMContext):
     else:
         picked.add(username)
     await state.update_data(picked=picked)
-    # пере-рендер кнопок выбора под текущей страницей
-    # Вытянем видимых на странице юзернеймов
-    records = data.get("results_df") or []
-    page = int(data.get("res_page") or 1)
-    per = settings.RESULTS_PER_PAGE
-    s, e = (page - 1) * per, (page - 1) * per + per
-    usernames = [(r.get("username") or "").lstrip("@") for r in records[s:e]]
-    await cb.message.edit_reply_markup(result_item_kb(usernames, picked))
+    # пере-рендер кнопок выбора под текущей страницей (отложенно, см. coalescer); если ждёт
+    # перерисовка всей страницы (листание), она и покажет выбор
+    coalescer.schedule(cb.message, lambda: _rerender_picks(cb.message, state), full=False)
     await cb.answer()
 
 
+async def _rerender_picks(msg: Message, state: FSMContext):
+    # Текст страницы не меняется — обновляем только клавиатуру
+    _, kb = _results_page(await state.get_data())
+    await msg.edit_reply_markup(reply_markup=kb)
+
+
+# ===== похожие блогеры =====
+
+def _similar_sync(version: Optional[str], username: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    cat = catalog.get(version) or catalog.current()
+    index = cat.similar_index()
+    row = cat.row_of(username)
+    if row is None:
+        return None, []
+    name = cat.df.iloc[row].get("name")
+    return (str(name) if name else None), cat.df.iloc[index.neighbours(row)].to_dict(orient="records")
+
+
+@router.callback_query(F.data.startswith("sim:"))
+async def on_similar(cb: CallbackQuery, state: FSMContext):
+    username = cb.data.split(":", 1)[1]
+    data = await state.get_data()
+    name, records = await asyncio.to_thread(_similar_sync, data.get("res_ver"), username)
+    if not records:
+        await cb.answer("Похожих блогеров не нашлось", show_alert=True)
+        return
+    lines = [f"Похожие на {name or '@' + username}:"]
+    usernames = []
+    for i, row in enumerate(records, start=1):
+        u = str(row.get("username") or "").lstrip("@")
+        usernames.append(u)
+        lines.append(f"{i}. {row.get('name') or '—'} (@{u}) — {row.get('city') or '—'} | {row.get('topics') or '—'} | "
+                     f"подписчики: {row.get('followers') or '—'} | цена: {row.get('price') or '—'}")
+    await cb.message.answer(ensure_min_words("\n".join(lines)),
+                            reply_markup=similar_kb(usernames, set(data.get("picked") or [])))
+    await cb.answer()
+
+
+@router.callback_query(F.data.startswith("simpick:"))
+async def on_similar_pick(cb: CallbackQuery, state: FSMContext):
+    username = cb.data.split(":", 1)[1]
+    data = await state.get_data()
+    picked: set[str] = set(data.get("picked") or [])
+    picked ^= {username}
+    await state.update_data(picked=picked)
+    # Список соседей берём из кнопок самого сообщения: их может быть несколько открытых
+    usernames = [b.callback_data.split(":", 1)[1] for r in cb.message.reply_markup.inline_keyboard for b in r
+                 if (b.callback_data or "").startswith("simpick:")]
+    await cb.message.edit_reply_markup(reply_markup=similar_kb(usernames, picked))
+    await cb.answer()
+
+
+@router.callback_query(F.data.startswith("watch:off:"))
+async def on_watch_off(cb: CallbackQuery):
+    search_id = cb.data.split(":", 2)[2]
+    removed = await asyncio.to_thread(saved_searches.store.remove, search_id, cb.from_user.id)
+    await cb.message.edit_reply_markup(reply_markup=None)
+    await cb.answer("Больше не буду присылать по этому поиску" if removed else "Этот поиск уже удалён")
+
+
+# ===== campaign (набор под общий бюджет) =====
+
+CAMPAIGN_LINES = 15
+
+
+def _campaign_sync(data: Dict[str, Any], budget: int) -> Tuple[catalog.Catalog, Campaign]:
+    # Кандидаты — вся отфильтрованная выборка сессии, а не только показанные лучшие по релевантности
+    cat, mask = _result_mask(data)
+    return cat, build_campaign(cat, np.flatnonzero(mask), budget)
+
+
+def _num(value: float) -> str:
+    """12 345 678 — разряды через пробел."""
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def _campaign_text(cat: catalog.Catalog, camp: Campaign, budget: int) -> str:
+    cur = settings.PAYMENT_CURRENCY
+    if not len(camp.rows):
+        return ensure_min_words(
+            f"В бюджет {_num(budget)} {cur} не помещается ни один блогер из выборки. Попробуйте увеличить бюджет."
+        )
+    lines = [
+        f"Кампания на {_num(budget)} {cur}: блогеров — {len(camp.rows)}, стоимость {_num(camp.cost)} {cur}, "
+        f"охват ≈ {_num(camp.reach)}.",
+    ]
+    if camp.gap > 0.005:
+        lines.append(f"Это не меньше {100 * (1 - camp.gap):.0f}% от максимально возможного охвата.")
+    lines.append("")
+    reach = cat.ranker().reach
+    records = cat.df.iloc[camp.rows[:CAMPAIGN_LINES]]
+    for i, (row, rec) in enumerate(zip(camp.rows, records.to_dict(orient="records")), start=1):
+        username = str(rec.get("username") or "").lstrip("@")
+        lines.append(f"{i}. {rec.get('name') or '—'} (@{username}) — цена {_num(cat.filter_index().price[row])}, "
+                     f"охват ≈ {_num(reach[row])}")
+    if len(camp.rows) > CAMPAIGN_LINES:
+        lines.append(f"…и ещё {len(camp.rows) - CAMPAIGN_LINES}")
+    return "\n".join(lines)
+
+
+async def _show_campaign(msg: Message, state: FSMContext, budget: int):
+    data = await state.get_data()
+    cat, camp = await asyncio.to_thread(_campaign_sync, data, budget)
+    usernames = [str(u or "").lstrip("@") for u in cat.df["username"].iloc[camp.rows]] if len(camp.rows) else []
+    await state.update_data(campaign=usernames)
+    text = _campaign_text(cat, camp, budget)
+    kb = campaign_kb(int(data.get("res_page") or 1), can_take=bool(usernames))
+    await msg.answer(text, reply_markup=kb)
+
+
+@router.message(CampaignStates.budget, F.text)
+async def on_campaign_budget(msg: Message, state: FSMContext):
+    budget = parse_budget_max(msg.text)
+    if not budget:
+        await msg.answer(ensure_min_words("Не поняла сумму. Напишите общий бюджет числом, например 500000 или 500 тысяч."))
+        return
+    data = await state.get_data()
+    await state.set_state(data.get("prev_state"))
+    await _show_campaign(msg, state, budget)
+
+
+@router.callback_query(F.data.startswith("campaign:"))
+async def on_campaign_take(cb: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    campaign = data.get("campaign") or []
+    picked: set[str] = set(data.get("picked") or []) | set(campaign)
+    await state.update_data(picked=picked)
+    await _render_results(cb, state)
+    await cb.answer(f"Добавила в выбор блогеров: {len(campaign)}")
+
+
 # ===== payments (mock) =====
 
 @router.callback_query(F.data.startswith("pay:"))
 async def on_pay(cb: CallbackQuery, state: FSMContext):
     action = cb.data.split(":", 2)[2]
     if action == "Оплатить":
-        # Mock: просто ставим флаг paid и показываем результаты
+        # Mock: просто ставим флаг paid и сразу показываем результаты в этом же сообщении
         await state.update_data(paid=True)
-        await cb.message.edit_text(ensure_min_words("Оплата прошла успешно. Готовлю результаты подбора."))
         await _render_results(cb, state)
+        await cb.answer("Оплата прошла успешно")
+        return
     else:
         await cb.message.edit_text(ensure_min_words("Отменено. Можем вернуться к фильтрам или начать заново."))
     await cb.answer()
@@ -534,30 +893,132 @@ async def on_pay(cb: CallbackQuery, state: FSMContext):
 
 # ===== export =====
 
-@router.callback_query(F.data.startswith("expfmt:"))
+# Формат -> название для пользователя
+_EXPORT_FORMATS = {"pdf": "PDF", "xlsx": "Excel", "csv": "CSV"}
+
+
+def _export_source(data: Dict[str, Any], scope: str, kind: str) -> Tuple[Optional[tuple], int, str]:
+    """
+    Источник строк для пула экспорта (см. export_render.py), их число и ключ кеша экспорта.
+    Снимок на диск пишется лениво: при попадании в кеш он не нужен. Зовут из потока.
+    """
+    if scope == "all":
+        cat, mask = _result_mask(data)
+        topic_ids = cat.resolve("topic", _result_filters(data)["topic"] or [])
+        rows = cat.ranker().top(mask, topic_ids, k=settings.EXPORT_MAX_ROWS)
+        return ("catalog", cat.version, None, rows), len(rows), export_key(cat.version, kind, rows=rows)
+
+    picked = set(data.get("picked") or [])
+    records = data.get("results_df") or []
+    # Порядок выдачи, затем выбранные вне её (из «Похожих» или кампании)
+    order = [str(r.get("username") or "").lstrip("@") for r in records]
+    usernames = [u for u in order if u in picked] + sorted(picked.difference(order))
+    cat = catalog.get(data.get("res_ver"))
+    if cat is not None:
+        found = [(u, r) for u, r in ((u, cat.row_of(u)) for u in usernames) if r is not None]
+        rows = [r for _, r in found]
+        return ("catalog", cat.version, None, rows), len(rows), export_key(cat.version, kind, usernames=[u for u, _ in found])
+    rows = [r for r in records if str(r.get("username") or "").lstrip("@") in picked]
+    found = [str(r.get("username") or "").lstrip("@") for r in rows]
+    return ("records", rows), len(rows), export_key(str(data.get("res_ver") or ""), kind, usernames=found)
+
+
+def _with_snapshot(source: tuple) -> tuple:
+    """Подставляет путь к снимку каталога в источник ("catalog", версия, None, строки). Зовут из потока."""
+    if source[0] != "catalog":
+        return source
+    cat = catalog.get(source[1])
+    if cat is None:
+        raise LookupError(f"Снимок каталога {source[1]} уже вытеснен")
+    return ("catalog", source[1], str(snapshot_path(cat)), source[3])
+
+
+@router.callback_query(F.data.startswith("expfmt:"), flags={"chat_action": {"action": "upload_document"}})
 async def on_export(cb: CallbackQuery, state: FSMContext):
-    fmt = cb.data.split(":", 1)[1]
-    if fmt == "Отмена":
+    _, kind, scope = (cb.data.split(":", 2) + [""])[:3]
+    if kind not in _EXPORT_FORMATS:
+        await cb.message.edit_reply_markup(reply_markup=None)
         await cb.answer("Отмена")
         return
     data = await state.get_data()
-    records = data.get("results_df") or []
-    picked = set(data.get("picked") or [])
-    if not picked:
+    if scope != "all" and not data.get("picked"):
         await cb.answer("Сначала выберите блогеров для экспорта", show_alert=True)
         return
-    import pandas as pd
-    df = pd.DataFrame(records)
-    df = df[df["username"].astype(str).str.lstrip("@").isin(picked)]
-    if df.empty:
+    source, count, key = await asyncio.to_thread(_export_source, data, scope, kind)
+    if not count:
         await cb.answer("Не удалось сформировать экспорт", show_alert=True)
         return
-    if fmt == "PDF":
-        content = export_pdf(df)
-        file = BufferedInputFile(content, filename="influencers.pdf")
-        await cb.message.answer_document(file, caption="Экспорт выбранных блогеров (PDF)")
-    elif fmt == "Excel":
-        content = export_excel(df)
-        file = BufferedInputFile(content, filename="influencers.xlsx")
-        await cb.message.answer_document(file, caption="Экспорт выбранных блогеров (Excel)")
-    await cb.answer()
+    fmt = _EXPORT_FORMATS[kind]
+    caption = (f"Экспорт всех результатов подбора: {count} ({fmt})" if scope == "all"
+               else f"Экспорт выбранных блогеров ({fmt})")
+    # Такой же выбор уже выгружали на этой версии каталога: по file_id — без рендера и загрузки,
+    # иначе готовый файл с диска — без рендера. Кеш читает диск, поэтому все обращения — из потока
+    file_id, path = await asyncio.to_thread(export_cache.lookup, key)
+    if file_id:
+        try:
+            await cb.message.answer_document(file_id, caption=caption)
+            await cb.answer()
+            return
+        except TelegramBadRequest:
+            await asyncio.to_thread(export_cache.remember_file_id, key, None)
+    if path is None:
+        # Рендер — в пуле процессов (см. export_worker.py); результат дождётся фоновая отправка
+        try:
+            source = await asyncio.to_thread(_with_snapshot, source)
+            job = exporter.submit(cb.from_user.id, kind, source)
+        except LookupError:
+            await cb.answer("Выдача устарела — запустите подбор заново", show_alert=True)
+            return
+        except ExportBusy as e:
+            text = ("Предыдущий файл ещё готовится, пришлю его и тогда можно будет выгрузить снова"
+                    if e.reason == "user" else "Сейчас много выгрузок, попробуйте через минуту")
+            await cb.answer(text, show_alert=True)
+            return
+        await cb.answer()
+        ahead = exporter.pending - 1
+        status = await cb.message.answer(
+            f"⏳ Готовлю {fmt}-файл ({count} блогеров)…" + (f" Перед вами в очереди: {ahead}." if ahead > 0 else "")
+        )
+    else:
+        job = status = None
+        await cb.answer()
+    # Рендер и загрузка файла — в фоне: хендлер не держит очередь чата и слот планировщика всё это время
+    task = asyncio.ensure_future(_send_export(cb.message, kind, caption, key, path, job, status))
+    _exporting.add(task)
+    task.add_done_callback(_exporting.discard)
+
+
+# Фоновые отправки экспорта (ссылка нужна, чтобы их не собрал GC)
+_exporting: Set[asyncio.Task] = set()
+
+
+async def _send_export(message: Message, kind: str, caption: str, key: str, path: Optional[Path],
+                       job: Optional[asyncio.Task], status: Optional[Message]) -> None:
+    if job is not None:
+        try:
+            rendered, _ = await job
+        except Exception:
+            log.exception("Экспорт %s не удался", kind)
+            try:
+                await status.edit_text(ensure_min_words("Не получилось сформировать файл. Попробуйте ещё раз чуть позже."))
+            except TelegramAPIError as e:
+                log.warning("Не удалось сообщить об ошибке экспорта: %s", e)
+            return
+        try:
+            path = await asyncio.to_thread(export_cache.put, key, rendered)
+        except OSError:
+            # Без кеша: отправим файл как есть, в следующий раз отрендерим заново
+            log.exception("Не удалось положить экспорт %s в кеш", kind)
+            path = rendered
+        try:
+            await status.delete()
+        except TelegramAPIError as e:
+            # Например, пользователь уже удалил статус — файл всё равно отправляем
+            log.warning("Не удалось удалить статус экспорта: %s", e)
+    try:
+        sent = await message.answer_document(FSInputFile(path, filename=f"influencers.{kind}"), caption=caption)
+    except Exception:
+        log.exception("Не удалось отправить экспорт %s", kind)
+        return
+    if sent.document is not None:
+        await asyncio.to_thread(export_cache.remember_file_id, key, sent.document.file_id)
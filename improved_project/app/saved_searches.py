@@ -0,0 +1,497 @@
+# app/saved_searches.py
+"""
+Сохранённые поиски: «сообщите, когда появятся новые блогеры по моему подбору».
+
+Фильтры берутся из показанной выдачи (аргументы query_influencers, см. _show_results_or_pay) и
+хранятся в журнале SAVED_SEARCHES_FILE (JSON Lines: добавление/удаление; журнал сжимается, когда
+мёртвых записей становится больше живых).
+
+Когда каталог меняет версию (catalog.refresh), заново подбирать по каждому сохранённому поиску
+не нужно: новых или изменённых строк обычно единицы, а поисков — десятки тысяч. Поэтому
+делается наоборот, как в перколяторе: поиски компилируются в столбцы (SearchTable) и раскладываются
+по обратному индексу — город -> поиски с этим городом, тематика -> поиски с этой тематикой
+(без города), плюс поиски без того и другого. Для изменённой строки кандидаты — объединение
+нескольких списков, остальные фильтры проверяются векторно сразу по всем кандидатам.
+Изменённая строка, которая подходила поиску и до изменения, повторно не сообщается.
+
+Оповещения уходят через AlertQueue: ограниченная очередь, свой темп SAVED_SEARCH_ALERT_RATE
+и самый низкий приоритет в общей очереди отправки (outbound.Priority.ALERT). Сверка тоже идёт
+в её рабочем потоке, а не в потоке, который перечитал каталог.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import BASE_DIR, settings
+from .metrics import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+    from .catalog import Catalog
+
+log = logging.getLogger(__name__)
+
+PERCOLATE_SECONDS = Histogram("saved_search_percolate_seconds", "Сверка изменённых строк каталога с поисками")
+MATCHES_TOTAL = Counter("saved_search_matches_total", "Новые совпадения строк каталога с сохранёнными поисками")
+ALERTS_TOTAL = Counter("saved_search_alerts_total", "Оповещения по сохранённым поискам", ["result"])
+QUEUE_DEPTH = Gauge("saved_search_alert_queue_depth", "Оповещения, ожидающие отправки")
+SEARCHES = Gauge("saved_searches", "Сохранённых поисков")
+
+# Сколько блогеров перечислять в одном оповещении
+_ALERT_LINES = 10
+
+
+def _jsonable(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in filters.items()
+            if v is not None and v != "" and v != []}
+
+
+class SavedSearchStore:
+    """Сохранённые поиски в памяти + журнал на диске. Потокобезопасно."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.revision = 0
+        self._searches: Dict[str, Dict[str, Any]] = {}
+        # id поисков пользователя в порядке сохранения
+        self._by_user: Dict[int, List[str]] = defaultdict(list)
+        self._dead = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        # Под замком: журнал читается один раз при первом обращении
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with self.path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("op") == "add":
+                    search = entry["search"]
+                    self._searches[search["id"]] = search
+                    self._by_user[search["user_id"]].append(search["id"])
+                elif entry.get("op") == "del":
+                    search = self._searches.pop(entry.get("id"), None)
+                    if search is not None:
+                        self._by_user[search["user_id"]].remove(search["id"])
+                    self._dead += 2
+        SEARCHES.set(len(self._searches))
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _compact(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for search in self._searches.values():
+                f.write(json.dumps({"op": "add", "search": search}, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        self._dead = 0
+
+    def add(self, user_id: int, chat_id: int, filters: Dict[str, Any], title: str) -> Dict[str, Any]:
+        """Сохраняет поиск; у пользователя остаются SAVED_SEARCHES_PER_USER последних."""
+        search = {
+            "id": uuid.uuid4().hex[:12], "user_id": user_id, "chat_id": chat_id,
+            "filters": _jsonable(filters), "title": title, "created_at": int(time.time()),
+        }
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            own = self._by_user[user_id]
+            for old_id in own[:max(0, len(own) - settings.SAVED_SEARCHES_PER_USER + 1)]:
+                self._remove(old_id)
+            self._searches[search["id"]] = search
+            own.append(search["id"])
+            self._append({"op": "add", "search": search})
+            self.revision += 1
+            SEARCHES.set(len(self._searches))
+        return search
+
+    def _remove(self, search_id: str) -> bool:
+        search = self._searches.pop(search_id, None)
+        if search is None:
+            return False
+        self._by_user[search["user_id"]].remove(search_id)
+        self._append({"op": "del", "id": search_id})
+        self._dead += 2
+        return True
+
+    def remove(self, search_id: str, user_id: Optional[int] = None) -> bool:
+        """Удаляет поиск (только свой, если указан user_id)."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            search = self._searches.get(search_id)
+            if search is None or (user_id is not None and search["user_id"] != user_id):
+                return False
+            self._remove(search_id)
+            if self._dead > len(self._searches):
+                self._compact()
+            self.revision += 1
+            SEARCHES.set(len(self._searches))
+            return True
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """Ревизия и список поисков на текущий момент."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self.revision, list(self._searches.values())
+
+    def __len__(self) -> int:
+        return len(self.snapshot()[1])
+
+
+class SearchTable:
+    """Поиски, скомпилированные под снимок каталога: обратный индекс по городам/тематикам и столбцы фильтров."""
+
+    def __init__(self, cat: "Catalog", searches: List[Dict[str, Any]]) -> None:
+        from .candidates import MARITAL_VALUES
+
+        self.cat = cat
+        self.searches = searches
+        index = self.index = cat.filter_index()
+        s = len(searches)
+        self.has_topic = np.zeros(s, dtype=bool)
+        by_city: List[List[int]] = [[] for _ in range(len(cat.cities))]
+        by_topic: List[List[int]] = [[] for _ in range(len(cat.topics))]
+        topic_only: List[List[int]] = [[] for _ in range(len(cat.topics))]
+        free: List[int] = []
+        self.followers_min = np.full(s, np.nan)
+        self.followers_max = np.full(s, np.nan)
+        self.budget_max = np.full(s, np.nan)
+        self.has_age = np.zeros(s, dtype=bool)
+        self.age_lo = np.full(s, np.nan)
+        self.age_hi = np.full(s, np.nan)
+        self.has_children = np.full(s, -1, dtype=np.int8)
+        self.children_count = np.full(s, -1, dtype=np.int16)
+        # Допустимые коды категориальных колонок FilterIndex для каждого поиска (по умолчанию — все)
+        self.language = np.ones((s, len(index.language[1])), dtype=bool)
+        self.gender = np.ones((s, len(index.gender[1])), dtype=bool)
+        self.marital = np.ones((s, len(index.marital[1])), dtype=bool)
+
+        resolved: Dict[Tuple[str, Tuple[str, ...]], List[int]] = {}
+        allowed: Dict[Tuple[str, str], np.ndarray] = {}
+
+        def ids(facet: str, names: List[str]) -> List[int]:
+            key = (facet, tuple(names))
+            if key not in resolved:
+                resolved[key] = cat.resolve(facet, names)
+            return resolved[key]
+
+        def codes(column: str, value: str, pred) -> np.ndarray:
+            key = (column, value)
+            if key not in allowed:
+                allowed[key] = np.array([pred(v) for v in getattr(index, column)[1]], dtype=bool)
+            return allowed[key]
+
+        for i, search in enumerate(searches):
+            f = search["filters"]
+            cities = ids("city", f["city"]) if f.get("city") else None
+            topics = ids("topic", f["topic"]) if f.get("topic") else None
+            if topics is not None:
+                self.has_topic[i] = True
+                for t in topics:
+                    by_topic[t].append(i)
+            # Поиск с неизвестным городом/тематикой никуда не попадает — и не должен совпадать
+            if cities is not None:
+                for c in cities:
+                    by_city[c].append(i)
+            elif topics is not None:
+                for t in topics:
+                    topic_only[t].append(i)
+            else:
+                free.append(i)
+
+            for name in ("followers_min", "followers_max", "budget_max"):
+                if f.get(name) is not None:
+                    getattr(self, name)[i] = f[name]
+            if f.get("age_range"):
+                lo, hi = f["age_range"]
+                self.has_age[i] = True
+                self.age_lo[i] = np.nan if lo is None else lo
+                self.age_hi[i] = np.nan if hi is None else hi
+            if f.get("has_children") is not None:
+                self.has_children[i] = int(bool(f["has_children"]))
+            cc = f.get("children_count")
+            if cc == "more":
+                self.children_count[i] = 99
+            elif cc and str(cc).isdigit():
+                self.children_count[i] = int(cc)
+            if f.get("language"):
+                lang = str(f["language"]).strip().lower()
+                self.language[i] = codes("language", lang, lambda v: lang in v)
+            if f.get("gender"):
+                g = str(f["gender"]).strip().lower()[:1]
+                self.gender[i] = codes("gender", g, lambda v: v.startswith(g))
+            if f.get("marital_status") in MARITAL_VALUES:
+                m = f["marital_status"]
+                self.marital[i] = codes("marital", m, lambda v: v in MARITAL_VALUES[m])
+
+        def arrays(lists: List[List[int]]) -> List[np.ndarray]:
+            return [np.asarray(x, dtype=np.int64) for x in lists]
+
+        self.by_city, self.by_topic, self.topic_only = arrays(by_city), arrays(by_topic), arrays(topic_only)
+        # Флаги «кандидат» по всем поискам: поиски без города и тематик — кандидаты для любой строки
+        self.free = np.zeros(s, dtype=bool)
+        self.free[free] = True
+
+    def match(self, row: int) -> np.ndarray:
+        """Номера поисков, которым подходит строка row снимка."""
+        cat, index = self.cat, self.index
+        topics = cat.row_topics[row]
+        # Объединение списков обратного индекса — флагами, а не сортировкой
+        flags = self.free.copy()
+        for t in topics:
+            flags[self.topic_only[t]] = True
+        if cat.city_ids[row] >= 0:
+            flags[self.by_city[cat.city_ids[row]]] = True
+        cand = np.flatnonzero(flags)
+        if not len(cand):
+            return cand
+
+        topic_ok = ~self.has_topic
+        for t in topics:
+            topic_ok[self.by_topic[t]] = True
+        ok = topic_ok[cand]
+        ok &= self.language[cand, index.language[0][row]]
+        ok &= self.gender[cand, index.gender[0][row]]
+        ok &= self.marital[cand, index.marital[0][row]]
+
+        # Те же правила, что у масок FilterIndex: пропуск не проходит ни нижнюю, ни верхнюю границу
+        followers, price, children = index.followers[row], index.price[row], index.children[row]
+        fmin, fmax, budget = self.followers_min[cand], self.followers_max[cand], self.budget_max[cand]
+        ok &= np.isnan(fmin) | ((-1 if np.isnan(followers) else followers) >= fmin)
+        ok &= np.isnan(fmax) | ((10 ** 12 if np.isnan(followers) else followers) <= fmax)
+        ok &= np.isnan(budget) | ((10 ** 12 if np.isnan(price) else price) <= budget)
+        has_children = self.has_children[cand]
+        ok &= (has_children < 0) | (has_children == int(children > 0))
+        cc = self.children_count[cand]
+        ok &= (cc < 0) | ((cc == 99) & (children > 4)) | ((cc != 99) & (cc == children))
+        age = self.has_age[cand]
+        if age.any():
+            lo, hi = self.age_lo[cand], self.age_hi[cand]
+            row_lo, row_hi = index.age_lo[row], index.age_hi[row]
+            age_ok = (bool(index.has_age[row])
+                      & (np.isnan(lo) | ~(row_hi < lo) | np.isnan(row_lo))
+                      & (np.isnan(hi) | ~(row_lo > hi)))
+            ok &= ~age | age_ok
+        return cand[ok]
+
+
+class Percolator:
+    """Кеш SearchTable по (версия каталога, ревизия поисков): старый и новый снимок компилируются один раз."""
+
+    def __init__(self, store: SavedSearchStore) -> None:
+        self.store = store
+        self._tables: Dict[Tuple[str, int], SearchTable] = {}
+        self._lock = threading.Lock()
+
+    def table(self, cat: "Catalog", revision: int, searches: List[Dict[str, Any]]) -> SearchTable:
+        key = (cat.version, revision)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                table = SearchTable(cat, searches)
+                self._tables = {k: v for k, v in self._tables.items() if k[1] == revision}
+                self._tables[key] = table
+            return table
+
+    def percolate(self, previous: "Catalog", cat: "Catalog") -> Dict[str, List[int]]:
+        """id поиска -> строки cat, которые стали ему подходить после обновления каталога."""
+        started = time.perf_counter()
+        revision, searches = self.store.snapshot()
+        if not searches:
+            return {}
+        changed = cat.changed_rows(previous)
+        if not len(changed):
+            return {}
+        table = self.table(cat, revision, searches)
+        old_table: Optional[SearchTable] = None
+        usernames = cat.df["username"] if "username" in cat.df.columns else None
+        hit_searches: List[np.ndarray] = []
+        hit_rows: List[np.ndarray] = []
+        for row in changed.tolist():
+            matched = table.match(row)
+            if not len(matched):
+                continue
+            old_row = previous.row_of(usernames.iat[row]) if usernames is not None and usernames.iat[row] else None
+            if old_row is not None:
+                # Блогер был и раньше: сообщаем только поискам, которым он раньше не подходил
+                if old_table is None:
+                    old_table = self.table(previous, revision, searches)
+                matched = np.setdiff1d(matched, old_table.match(old_row), assume_unique=True)
+            hit_searches.append(matched)
+            hit_rows.append(np.full(len(matched), row, dtype=np.int64))
+        out: Dict[str, List[int]] = {}
+        if hit_searches:
+            # Пары (поиск, строка) группируем по поиску одной сортировкой
+            by_search, rows = np.concatenate(hit_searches), np.concatenate(hit_rows)
+            order = np.argsort(by_search, kind="stable")
+            by_search, rows = by_search[order], rows[order]
+            heads = np.flatnonzero(np.r_[True, by_search[1:] != by_search[:-1]]) if len(by_search) else []
+            for i, chunk in zip(by_search[heads].tolist(), np.split(rows, heads[1:])):
+                out[searches[i]["id"]] = chunk.tolist()
+            MATCHES_TOTAL.inc(len(rows))
+        PERCOLATE_SECONDS.observe(time.perf_counter() - started)
+        log.info("Сохранённые поиски: %d изменённых строк, %d поисков с новыми блогерами (%.0f мс)",
+                 len(changed), len(out), (time.perf_counter() - started) * 1000)
+        return out
+
+
+class AlertQueue:
+    """
+    Ограниченная очередь оповещений со своим темпом отправки и своим рабочим потоком для сверки
+    обновлений каталога: поток, который перечитал каталог (обычно подбор пользователя), её не ждёт.
+    """
+
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Оповещения, найденные до start() (каталог успел обновиться раньше, чем стартовал бот)
+        self._early: List["Alert"] = []
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="saved-search")
+
+    def start(self, bot: "Bot") -> None:
+        self._queue = asyncio.Queue(maxsize=settings.SAVED_SEARCH_QUEUE_MAX)
+        self._tasks = [asyncio.create_task(self._sender(bot)), asyncio.create_task(self._refresher())]
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            early, self._early = self._early, []
+        if early:
+            log.info("Оповещения, найденные до запуска очереди: %d", len(early))
+            self._put(early)
+
+    def submit(self, alerts: List["Alert"]) -> None:
+        """Ставит оповещения в очередь; можно звать из любого потока, в том числе до start()."""
+        with self._lock:
+            if self._loop is None:
+                room = settings.SAVED_SEARCH_QUEUE_MAX - len(self._early)
+                self._early.extend(alerts[:max(room, 0)])
+                if len(alerts) > room:
+                    ALERTS_TOTAL.labels("dropped").inc(len(alerts) - max(room, 0))
+                    log.warning("Очередь оповещений ещё не запущена и переполнена: %d отброшено",
+                                len(alerts) - max(room, 0))
+                return
+            loop = self._loop
+        loop.call_soon_threadsafe(self._put, alerts)
+
+    def percolate(self, previous: "Catalog", cat: "Catalog") -> None:
+        """Сверяет обновление каталога с сохранёнными поисками в рабочем потоке очереди."""
+        self._worker.submit(self._percolate, previous, cat)
+
+    def _percolate(self, previous: "Catalog", cat: "Catalog") -> None:
+        try:
+            _match_update(previous, cat)
+        except Exception:
+            log.exception("Не удалось сверить обновление каталога с сохранёнными поисками")
+
+    def shutdown(self) -> None:
+        self._worker.shutdown(wait=False, cancel_futures=True)
+
+    def _put(self, alerts: List["Alert"]) -> None:
+        for alert in alerts:
+            try:
+                self._queue.put_nowait(alert)
+            except asyncio.QueueFull:
+                ALERTS_TOTAL.labels("dropped").inc()
+        QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _sender(self, bot: "Bot") -> None:
+        from .outbound import Priority, TokenBucket, priority
+
+        bucket = TokenBucket(settings.SAVED_SEARCH_ALERT_RATE, 1.0)
+        while True:
+            alert = await self._queue.get()
+            QUEUE_DEPTH.set(self._queue.qsize())
+            while (delay := bucket.try_take(time.monotonic())) > 0:
+                await asyncio.sleep(delay)
+            chat_id = alert.search["chat_id"]
+            try:
+                text, kb = alert.render()
+                with priority(Priority.ALERT):
+                    await bot.send_message(chat_id, text, reply_markup=kb)
+                ALERTS_TOTAL.labels("sent").inc()
+            except Exception:
+                ALERTS_TOTAL.labels("failed").inc()
+                log.exception("Не удалось отправить оповещение в чат %s", chat_id)
+
+    async def _refresher(self) -> None:
+        # Без активных пользователей каталог никто не перечитывает — а оповещения ждут
+        from . import catalog
+
+        while True:
+            await asyncio.sleep(settings.CATALOG_TTL_SECONDS)
+            if not len(store):
+                continue
+            try:
+                await asyncio.to_thread(catalog.current)
+            except Exception:
+                log.exception("Не удалось перечитать каталог для сохранённых поисков")
+
+
+class Alert:
+    """Оповещение в очереди; текст и клавиатура собираются прямо перед отправкой."""
+
+    __slots__ = ("search", "records", "total")
+
+    def __init__(self, search: Dict[str, Any], records: List[Dict[str, Any]], total: int) -> None:
+        self.search = search
+        self.records = records
+        self.total = total
+
+    def render(self) -> Tuple[str, Any]:
+        from .formatting import ensure_min_words
+        from .keyboards import saved_search_kb
+
+        lines = [f"Появились новые блогеры по вашему поиску «{self.search['title']}»:"]
+        for rec in self.records:
+            username = str(rec.get("username") or "").lstrip("@")
+            lines.append(f"• {rec.get('name') or '—'} (@{username}) — подписчики: {rec.get('followers') or '—'} | "
+                         f"цена: {rec.get('price') or '—'}")
+        if self.total > len(self.records):
+            lines.append(f"…и ещё {self.total - len(self.records)}")
+        return ensure_min_words("\n".join(lines)), saved_search_kb(self.search["id"])
+
+
+def on_catalog_update(previous: "Catalog", cat: "Catalog") -> None:
+    """Зовётся из catalog.refresh после смены версии; сама сверка — в потоке очереди оповещений."""
+    alerts.percolate(previous, cat)
+
+
+def _match_update(previous: "Catalog", cat: "Catalog") -> None:
+    matches = percolator.percolate(previous, cat)
+    if not matches:
+        return
+    _, searches = store.snapshot()
+    by_id = {s["id"]: s for s in searches}
+    # Строки, которые попадут в тексты оповещений, переводим в словари один раз на всех
+    shown = sorted({row for rows in matches.values() for row in rows[:_ALERT_LINES]})
+    records = dict(zip(shown, cat.df.iloc[shown].to_dict(orient="records")))
+    alerts.submit([Alert(by_id[sid], [records[r] for r in rows[:_ALERT_LINES]], len(rows))
+                   for sid, rows in matches.items() if sid in by_id])
+
+
+store = SavedSearchStore(BASE_DIR / settings.SAVED_SEARCHES_FILE)
+percolator = Percolator(store)
+alerts = AlertQueue()
@@ -0,0 +1,135 @@
+# app/scheduler.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+
+from .metrics import Counter, Gauge, Histogram
+
+log = logging.getLogger(__name__)
+
+BUSY_TEXT = "Секунду, ещё обрабатываю ваши предыдущие запросы. Попробуйте ещё раз чуть позже."
+
+# Апдейты этих типов меняют FSM-состояние чата и поэтому выполняются строго по очереди
+SERIAL_EVENT_TYPES = ("message", "callback_query")
+
+QUEUE_DEPTH = Gauge("sched_queue_depth", "Апдейты, ожидающие своей очереди в чате или глобального слота")
+IN_FLIGHT = Gauge("sched_in_flight", "Апдейты, которые сейчас обрабатываются")
+WAIT_SECONDS = Histogram("sched_wait_seconds", "Время ожидания апдейта до начала обработки")
+SHED_TOTAL = Counter("sched_shed_total", "Апдейты, отклонённые из-за переполнения очереди", ["reason"])
+
+
+class _ChatLane:
+    """Очередь одного чата: FIFO-замок asyncio.Lock и счётчик апдейтов в ней."""
+
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class SchedulerMiddleware(BaseMiddleware):
+    """
+    Последовательная обработка апдейтов одного чата + глобальный лимит параллельных хендлеров.
+
+    Два быстрых нажатия в одном чате больше не читают и не пишут FSM-данные одновременно:
+    второй апдейт ждёт завершения первого. Общее число одновременно работающих хендлеров
+    (а значит, запросов к LLM и Sheets) ограничено семафором. Если очередь чата или
+    общая очередь переполнены, апдейт отклоняется с ответом «подождите».
+
+    Регистрируется как outer-middleware на уровне Update, после встроенных middleware aiogram,
+    чтобы в data уже были event_chat / event_from_user. raw_state перечитывается, когда апдейт
+    дождался своей очереди.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_per_chat: int, max_waiting: int) -> None:
+        self._lanes: Dict[int, _ChatLane] = {}
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._max_queue_per_chat = max_queue_per_chat
+        self._max_waiting = max_waiting
+        self._waiting = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update) or event.event_type not in SERIAL_EVENT_TYPES:
+            self._admit(data)
+            return await handler(event, data)
+
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = chat.id if chat else (user.id if user else None)
+        if key is None:
+            self._admit(data)
+            return await handler(event, data)
+
+        if self._waiting >= self._max_waiting:
+            SHED_TOTAL.labels("global").inc()
+            await self._reject(event)
+            return None
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _ChatLane()
+        elif lane.pending >= self._max_queue_per_chat:
+            SHED_TOTAL.labels("chat").inc()
+            await self._reject(event)
+            return None
+
+        # Принят: теперь можно отменить устаревшее действие пользователя (см. supersede.py) — до
+        # очереди чата, где этот апдейт иначе ждал бы завершения того самого действия
+        self._admit(data)
+        lane.pending += 1
+        self._waiting += 1
+        QUEUE_DEPTH.inc()
+        enqueued = time.perf_counter()
+        waiting = True
+        try:
+            async with lane.lock:
+                async with self._slots:
+                    waiting = False
+                    self._waiting -= 1
+                    QUEUE_DEPTH.dec()
+                    WAIT_SECONDS.observe(time.perf_counter() - enqueued)
+                    IN_FLIGHT.inc()
+                    try:
+                        # Состояние FSM встроенная middleware прочитала до очереди; пока апдейт ждал,
+                        # предыдущий мог его сменить — фильтры по состоянию должны видеть текущее
+                        if data.get("state") is not None:
+                            data["raw_state"] = await data["state"].get_state()
+                        return await handler(event, data)
+                    finally:
+                        IN_FLIGHT.dec()
+        finally:
+            if waiting:
+                self._waiting -= 1
+                QUEUE_DEPTH.dec()
+            lane.pending -= 1
+            if lane.pending == 0:
+                self._lanes.pop(key, None)
+
+    @staticmethod
+    def _admit(data: Dict[str, Any]) -> None:
+        admitted = data.pop("on_admitted", None)
+        if admitted is not None:
+            admitted()
+
+    @staticmethod
+    async def _reject(update: Update) -> None:
+        log.warning("Апдейт %s отклонён: очередь переполнена", update.update_id)
+        try:
+            if update.callback_query is not None:
+                await update.callback_query.answer(BUSY_TEXT)
+            elif update.message is not None:
+                await update.message.answer(BUSY_TEXT)
+        except TelegramAPIError:
+            pass
@@ -0,0 +1,64 @@
+# app/search.py
+"""
+Префиксный поиск по словарям городов и тематик для inline-режима пикеров.
+
+Индекс строится один раз на версию каталога (см. Catalog.prefix_index): отсортированный массив
+ключей «суффикс от начала каждого слова -> id значения». Поиск — два bisect по массиву и выбор
+лучших по числу блогеров через np.argpartition по найденному диапазону, без прохода по всему словарю.
+"""
+from __future__ import annotations
+
+import heapq
+import re
+from bisect import bisect_left
+from typing import TYPE_CHECKING, List, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .catalog import Vocabulary
+
+_SEP_RE = re.compile(r"[\s\-‐–—_/.]+")
+
+# Как пользователь помечает, что ищет, в строке inline-запроса: «@bot город: алм»
+SEARCH_LABELS = {"city": "город:", "topic": "тема:"}
+
+
+def normalize(text: str) -> str:
+    return _SEP_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+class PrefixIndex:
+    __slots__ = ("vocab", "counts", "_keys", "_ids", "_top")
+
+    def __init__(self, vocab: "Vocabulary", counts: Sequence[int]) -> None:
+        self.vocab = vocab
+        self.counts = counts
+        pairs = []
+        for item_id, value in enumerate(vocab.values):
+            norm = normalize(value)
+            # «Усть-Каменогорск» находится и по «усть», и по «камен»
+            starts = [0] + [m.end() for m in re.finditer(" ", norm)]
+            for pos in starts:
+                pairs.append((norm[pos:], item_id))
+        pairs.sort()
+        self._keys = [k for k, _ in pairs]
+        self._ids = np.fromiter((i for _, i in pairs), dtype=np.int64, count=len(pairs))
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self._top = sorted(range(len(vocab)), key=lambda i: (-counts[i], i))
+
+    def search(self, prefix: str, limit: int = 20) -> List[int]:
+        """id значений, начинающихся с prefix (с начала любого слова), по убыванию числа блогеров."""
+        p = normalize(prefix)
+        if not p:
+            return self._top[:limit]
+        lo = bisect_left(self._keys, p)
+        hi = bisect_left(self._keys, p + "\uffff", lo)
+        ids = self._ids[lo:hi]
+        # Короткий префикс может совпасть с тысячами значений: сначала грубо отбираем лучших
+        # (с запасом на повторы одного id с разных слов), затем точно сортируем немногих
+        keep = limit * 4
+        if len(ids) > keep:
+            ids = ids[np.argpartition(-self.counts[ids], keep)[:keep]]
+        counts = self.counts
+        return heapq.nsmallest(limit, set(ids.tolist()), key=lambda i: (-counts[i], i))
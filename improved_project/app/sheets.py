@@ -1,17 +1,24 @@
 # app/sheets.py
 from __future__ import annotations
+import functools
 import json
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, TypeVar
 
-import gspread
 import pytz
-from gspread.exceptions import APIError, WorksheetNotFound, SpreadsheetNotFound
-from gspread import Spreadsheet
-from google.oauth2.service_account import Credentials
 
 from .config import settings
+from .metrics import Counter, Histogram
+from .tracing import span
+
+# gspread и google-auth импортируются при первом обращении к таблице, а не при старте бота
+# (см. startup.py: сессия Sheets прогревается в фоне)
+if TYPE_CHECKING:
+    import gspread
+    from gspread import Spreadsheet
+    from google.oauth2.service_account import Credentials
 
 _LOG = logging.getLogger(__name__)
 
@@ -22,8 +29,43 @@ _SCOPES = [
 
 _client: Optional[gspread.Client] = None
 
+CALL_SECONDS = Histogram("sheets_call_seconds", "Вызовы Google Sheets", ["op"])
+ERRORS_TOTAL = Counter("sheets_errors_total", "Ошибки вызовов Google Sheets", ["op"])
+
+_F = TypeVar("_F", bound=Callable[..., Any])
+
+
+def instrumented(op: str) -> Callable[[_F], _F]:
+    """
+    Время и ошибки операции с таблицей (метки op), в трассе — спан "sheets.<op>".
+    append_* сами ловят исключения и возвращают False — это тоже считается ошибкой.
+    """
+    def decorate(fn: _F) -> _F:
+        seconds, errors = CALL_SECONDS.labels(op), ERRORS_TOTAL.labels(op)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                with span("sheets." + op):
+                    result = fn(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started)
+            if result is False:
+                errors.inc()
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
 
 def _get_credentials() -> Credentials:
+    from google.oauth2.service_account import Credentials
+
     _LOG.debug("Попытка создания учетных данных Google...")
     sa_json = settings.GOOGLE_SHEETS_CREDENTIALS_JSON
 
@@ -57,19 +99,36 @@ def _get_credentials() -> Credentials:
         "Не удалось создать учетные данные Google. Проверьте GOOGLE_SHEETS_CREDENTIALS_JSON или GOOGLE_SHEETS_CREDENTIALS_FILE в .env")
 
 
+def _traced_http_client() -> type:
+    """HTTP-клиент gspread, который оборачивает каждый запрос к Google API в спан трассы."""
+    from gspread.http_client import HTTPClient
+
+    class TracedHTTPClient(HTTPClient):
+        def request(self, method: str, endpoint: str, *args: Any, **kwargs: Any):
+            with span("gspread.request", method=method, endpoint=endpoint.split("?", 1)[0]):
+                return super().request(method, endpoint, *args, **kwargs)
+
+    return TracedHTTPClient
+
+
 def get_client() -> gspread.Client:
     # ... (эта функция без изменений)
     global _client
     if _client is None:
+        import gspread
+
         _LOG.debug("Клиент gspread не инициализирован. Авторизуемся...")
         creds = _get_credentials()
-        _client = gspread.authorize(creds)
+        _client = gspread.authorize(creds, http_client=_traced_http_client())
         _LOG.info("Клиент gspread успешно авторизован.")
     return _client
 
 
+@instrumented("open")
 def get_spreadsheet(client: gspread.Client) -> Spreadsheet:
     # ... (эта функция без изменений)
+    from gspread.exceptions import APIError, SpreadsheetNotFound
+
     try:
         sh = client.open_by_key(settings.GOOGLE_SHEET_ID)
         _LOG.info("Таблица '%s' успешно открыта.", sh.title)
@@ -83,8 +142,11 @@ def get_spreadsheet(client: gspread.Client) -> Spreadsheet:
         raise
 
 
+@instrumented("append_user")
 def append_user(profile: Dict[str, Optional[str]], tg_id: int) -> bool:
     # ... (эта функция без изменений)
+    from gspread.exceptions import WorksheetNotFound
+
     try:
         _LOG.info(f"Начинаю синхронную запись пользователя {tg_id} в Google Sheets...")
         client = get_client()
@@ -128,6 +190,8 @@ def append_user(profile: Dict[str, Optional[str]], tg_id: int) -> bool:
 
 
 def _ensure_worksheet(sh: Spreadsheet, title: str, header: List[str]):
+    from gspread.exceptions import WorksheetNotFound
+
     try:
         ws = sh.worksheet(title)
     except WorksheetNotFound:
@@ -148,6 +212,7 @@ def _ensure_worksheet(sh: Spreadsheet, title: str, header: List[str]):
     return ws
 
 
+@instrumented("append_payment")
 def append_payment(user_id: int, tg_username: str | None, amount: int, currency: str, method: str, status: str, payload: str | None = None) -> bool:
     try:
         _LOG.info("Запись платежа в 'payments' для %s", user_id)
@@ -165,6 +230,7 @@ def append_payment(user_id: int, tg_username: str | None, amount: int, currency:
         return False
 
 
+@instrumented("append_selection")
 def append_selection(user_id: int, tg_username: str | None, selected_usernames: List[str], export_format: str | None = None, export_url: str | None = None) -> bool:
     try:
         _LOG.info("Запись выбора в 'selections' для %s (%d шт.)", user_id, len(selected_usernames))
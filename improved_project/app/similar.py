@@ -0,0 +1,101 @@
+# app/similar.py
+"""
+«Похожие» блогеры: ближайшие соседи строки каталога по тематикам, городу, языку, подписчикам и цене.
+
+Сходство двух строк — взвешенная сумма (веса SIMILAR_WEIGHT_*):
+  topic     — Жаккар наборов тематик;
+  city      — тот же город;
+  language  — тот же язык;
+  followers — близость по порядку величины: 1 - |lg f1 - lg f2| (одна декада разницы — 0);
+  price     — то же для цены.
+Векторы признаков строятся один раз на снимок, вместе с его остальными индексами (см. Catalog.prepare).
+Соседи одной строки — один векторный проход по всему каталогу (единицы мс на 100k строк) при нажатии
+«Похожие»: пересечения тематик складываются из готовых списков строк (Catalog.rows_for), остальное —
+сравнение массивов. Готовые top-N запоминаются (LRU), повторное нажатие отвечает из памяти.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .config import settings
+from .metrics import Counter
+
+if TYPE_CHECKING:
+    from .catalog import Catalog
+
+LOOKUPS_TOTAL = Counter("similar_lookups_total", "Запросы похожих блогеров", ["result"])
+
+
+def _log_band(values: np.ndarray) -> np.ndarray:
+    """lg значения; пропуски и неположительные — NaN (признак для такой пары не учитывается)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(values > 0, np.log10(values), np.nan)
+
+
+class SimilarIndex:
+    def __init__(self, cat: "Catalog") -> None:
+        self.cat = cat
+        index = cat.filter_index()
+        self.size = len(cat)
+        self.city = cat.city_ids
+        self.language = index.language[0]
+        self.topic_count = np.fromiter((len(t) for t in cat.row_topics), dtype=np.int16, count=self.size)
+        self.followers = _log_band(index.followers)
+        self.price = _log_band(index.price)
+        self._neighbours: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def scores(self, row: int) -> np.ndarray:
+        """Сходство строки row со всеми строками каталога."""
+        score = np.zeros(self.size)
+        topics = self.cat.row_topics[row]
+        if topics:
+            inter = np.zeros(self.size, dtype=np.int16)
+            for t in topics:
+                inter[self.cat.rows_for("topic", [t])] += 1
+            union = self.topic_count + len(topics) - inter
+            score += settings.SIMILAR_WEIGHT_TOPIC * inter / np.maximum(union, 1)
+        if self.city[row] >= 0:
+            score += settings.SIMILAR_WEIGHT_CITY * (self.city == self.city[row])
+        score += settings.SIMILAR_WEIGHT_LANGUAGE * (self.language == self.language[row])
+        for weight, band in ((settings.SIMILAR_WEIGHT_FOLLOWERS, self.followers),
+                             (settings.SIMILAR_WEIGHT_PRICE, self.price)):
+            if not np.isnan(band[row]):
+                score += weight * np.nan_to_num(np.clip(1.0 - np.abs(band - band[row]), 0.0, 1.0), nan=0.0)
+        score[row] = -1.0
+        return score
+
+    def _compute(self, row: int) -> np.ndarray:
+        k = settings.SIMILAR_TOP_N
+        score = self.scores(row)
+        if k < self.size:
+            top = np.argpartition(-score, k)[:k]
+        else:
+            top = np.arange(self.size)
+        top = top[np.argsort(-score[top], kind="stable")]
+        top = top[score[top] > 0]
+        top.flags.writeable = False
+        return top
+
+    def neighbours(self, row: int) -> np.ndarray:
+        """Номера строк SIMILAR_TOP_N самых похожих на row, по убыванию сходства."""
+        with self._lock:
+            top = self._neighbours.get(row)
+            if top is not None:
+                self._neighbours.move_to_end(row)
+                LOOKUPS_TOTAL.labels("hit").inc()
+                return top
+        LOOKUPS_TOTAL.labels("miss").inc()
+        top = self._compute(row)
+        self._remember(row, top)
+        return top
+
+    def _remember(self, row: int, top: np.ndarray) -> None:
+        with self._lock:
+            self._neighbours[row] = top
+            while len(self._neighbours) > settings.SIMILAR_CACHE_SIZE:
+                self._neighbours.popitem(last=False)
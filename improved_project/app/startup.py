@@ -0,0 +1,102 @@
+# app/startup.py
+"""
+Быстрый холодный старт.
+
+Раньше до первого апдейта бот успевал импортировать pandas, gspread и openai (вместе — порядка секунды)
+и лишь затем начинал polling, а первый пользователь вдобавок ждал чтения каталога, авторизацию в Google
+и TLS-рукопожатие с OpenAI. Теперь тяжёлые пакеты импортируются при первом использовании
+(catalog/ranking/candidates — pandas, sheets/influencers — gspread, ai_logic — openai), polling
+стартует сразу, а warmup() в фоне догружает то, что понадобится первому пользователю:
+  sheets  — авторизация сервисного аккаунта и открытие таблицы;
+  catalog — снимок каталога и его индексы (фильтры, ранжирование, «Похожие»); это и импорт pandas;
+  openai  — клиент и соединение с API.
+Ошибка прогрева не мешает работе: то же самое выполнится при первом обращении.
+
+Время каждой части — в метрике startup_warmup_seconds, время от запуска процесса до первого
+апдейта — startup_first_update_seconds (см. FirstUpdateMiddleware). Разбор импортов —
+python nonna_bench.py startup.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from .metrics import Gauge
+
+log = logging.getLogger(__name__)
+
+WARMUP_SECONDS = Gauge("startup_warmup_seconds", "Длительность фонового прогрева после старта", ["part"])
+FIRST_UPDATE_SECONDS = Gauge("startup_first_update_seconds", "От запуска процесса до первого апдейта")
+
+# Фоновые задачи прогрева (ссылка нужна, чтобы их не собрал GC)
+_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _warm_sheets() -> None:
+    from .sheets import get_client, get_spreadsheet
+
+    get_spreadsheet(get_client())
+
+
+def _warm_catalog() -> None:
+    from . import catalog
+
+    catalog.current().prepare()
+
+
+async def _timed(part: str, fn: Callable[[], Awaitable[Any]]) -> None:
+    started = time.perf_counter()
+    try:
+        await fn()
+    except Exception:
+        log.warning("Прогрев %s не удался, выполнится при первом обращении", part, exc_info=True)
+        return
+    seconds = time.perf_counter() - started
+    WARMUP_SECONDS.labels(part).set(seconds)
+    log.info("Прогрев %s: %.0f мс", part, seconds * 1000)
+
+
+async def _warm_sheets_then_catalog() -> None:
+    # Каталог читается через ту же сессию Sheets: сначала авторизация, потом лист
+    await _timed("sheets", lambda: asyncio.to_thread(_warm_sheets))
+    await _timed("catalog", lambda: asyncio.to_thread(_warm_catalog))
+
+
+async def _warm_openai() -> None:
+    from . import ai_logic
+
+    await _timed("openai", ai_logic.warmup)
+
+
+def warmup() -> None:
+    """Запускает прогрев в фоне; зовут из main() до старта polling."""
+    for coro in (_warm_sheets_then_catalog(), _warm_openai()):
+        task = asyncio.ensure_future(coro)
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Замеряет время от запуска процесса до первого апдейта; дальше — одна проверка флага."""
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self._seen = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self._seen:
+            self._seen = True
+            seconds = time.monotonic() - self.started
+            FIRST_UPDATE_SECONDS.set(seconds)
+            log.info("Первый апдейт через %.2f с после запуска", seconds)
+        return await handler(event, data)
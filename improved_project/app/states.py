@@ -21,6 +21,9 @@ class SelectionBasicStates(StatesGroup):
 class SelectionDecisionStates(StatesGroup):
     decide = State()     # показать кнопки: Advanced / Показать результат
 
+class CampaignStates(StatesGroup):
+    budget = State()     # общий бюджет кампании, если его не было в фильтрах
+
 class SelectionAdvancedStates(StatesGroup):
     marital = State()
     children = State()
@@ -0,0 +1,107 @@
+# app/supersede.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from .metrics import Counter
+from .states import CommonStates, RegistrationStates
+
+log = logging.getLogger(__name__)
+
+SUPERSEDED_TOTAL = Counter(
+    "supersede_cancelled_total", "Хендлеры, отменённые более новым действием пользователя", ["interaction"]
+)
+
+# callback-префикс -> (взаимодействие, действия, которые НЕ отменяются)
+# Одиночные переключатели (pick) должны примениться все, а «Готово» в результатах пишет в Sheets
+# и уведомляет менеджера — их не прерываем. «Готово» в пикерах, decide и pay меняют состояние FSM
+# до правки сообщения: отмена посередине оставила бы новое состояние под старой клавиатурой, поэтому
+# decide и pay здесь вовсе нет — они не отменяются.
+_CALLBACK_INTERACTIONS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "city": ("picker", ("p", "d")),
+    "topic": ("picker", ("p", "d")),
+    "res": ("results", ("done", "export", "watch")),
+    "campaign": ("results", ("take",)),
+    "sim": ("results", ()),
+}
+
+# Ход диалога регистрации (LLM-роутер/респондер) — только вне сценария подбора. В шагах подбора
+# текст — это ответ на вопрос (возраст, подписчики, бюджет, бриф): его хендлер меняет состояние
+# и сообщение, и прерывать его на середине нельзя
+_DIALOG_STATES = frozenset((None, *RegistrationStates.__all_states_names__, *CommonStates.__all_states_names__))
+
+
+def interaction_key(update: Update, raw_state: Optional[str] = None) -> Optional[str]:
+    """К какому взаимодействию относится апдейт; None — апдейт никогда не отменяется."""
+    if update.callback_query is not None:
+        prefix, _, rest = (update.callback_query.data or "").partition(":")
+        spec = _CALLBACK_INTERACTIONS.get(prefix)
+        if spec is None:
+            return None
+        interaction, keep = spec
+        if rest.partition(":")[0] in keep:
+            return None
+        return interaction
+    if update.inline_query is not None:
+        # Пользователь допечатал ещё букву — ответ на прежний префикс уже не нужен
+        return "search"
+    if update.message is not None and (update.message.text or update.message.contact) and raw_state in _DIALOG_STATES:
+        # Новое сообщение пользователя делает предыдущий ход диалога (LLM-роутер/респондер) ненужным
+        return "dialog"
+    return None
+
+
+class SupersedeMiddleware(BaseMiddleware):
+    """
+    Последнее действие пользователя отменяет его же предыдущее, ещё не завершённое.
+
+    Например, три «Вперёд» подряд или «Новый подбор» посреди поиска: старые задачи получают
+    CancelledError в ближайшей точке await (запрос к OpenAI закрывается httpx, ожидание
+    потока с Sheets/pandas бросается), и ресурсы достаются тем, чья работа ещё нужна.
+
+    Регистрируется outer-middleware на уровне Update ПЕРЕД SchedulerMiddleware, но сама отмена
+    откладывается до решения планировщика: он вызывает data["on_admitted"], когда апдейт принят
+    (не отклонён из-за переполнения), и до того, как тот встанет в очередь чата. Отклонённый апдейт
+    ничего не отменяет — иначе пропали бы оба действия. Без SchedulerMiddleware отмен нет.
+    Рассчитано на режим, где каждый апдейт обрабатывается в своей задаче
+    (start_polling по умолчанию, handle_as_tasks=True).
+    """
+
+    def __init__(self) -> None:
+        self._running: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat") or data.get("event_from_user")
+        interaction = interaction_key(event, data.get("raw_state")) if isinstance(event, Update) and chat else None
+        if interaction is None:
+            return await handler(event, data)
+
+        key = (chat.id, interaction)
+        task = asyncio.current_task()
+
+        def admitted() -> None:
+            prev = self._running.get(key)
+            if prev is not None and prev is not task and not prev.done():
+                prev.cancel()
+                SUPERSEDED_TOTAL.labels(interaction).inc()
+            self._running[key] = task
+
+        data["on_admitted"] = admitted
+        try:
+            return await handler(event, data)
+        except asyncio.CancelledError:
+            log.debug("Апдейт %s (%s) отменён более новым действием", event.update_id, interaction)
+            raise
+        finally:
+            if self._running.get(key) is task:
+                del self._running[key]
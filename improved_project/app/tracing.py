@@ -0,0 +1,282 @@
+# app/tracing.py
+"""
+Трассировка апдейтов: дерево спанов на каждый апдейт, выгрузка для офлайн-просмотра.
+
+TracingMiddleware (outer, уровень Update, самый первый) с вероятностью TRACE_SAMPLE_RATE заводит
+трассу и корневой спан "update"; текущий спан лежит в contextvar, поэтому всё, что выполняется
+внутри апдейта — хендлер, asyncio.to_thread, отложенные правки, — вкладывает свои спаны в него:
+  handler         — хендлер aiogram (instrumentation.HandlerMetricsMiddleware);
+  handle_event    — шаг регистрации (manager.handle_event);
+  openai.chat     — каждый chat.completions.create (ai_logic._chat);
+  sheets.<op>     — операция с таблицей, внутри — gspread.request на каждый HTTP-запрос gspread;
+  fsm.<op>        — get_data / update_data / ... FSM-хранилища (instrumentation.TimedStorage);
+  bot.<метод>     — каждый запрос к Bot API, включая ожидание в очереди отправки (TracingRequestMiddleware).
+Без трассы span() возвращает общий пустой объект: одна проверка contextvar.
+
+Завершённые трассы короче TRACE_MIN_MS отбрасываются, остальные копятся в кольцевом буфере
+(TRACE_BUFFER) и раз в TRACE_FLUSH_SECONDS пишутся в TRACE_DIR двумя файлами:
+  traces-<время>.json      — Chrome trace-event JSON (chrome://tracing, ui.perfetto.dev);
+  traces-<время>.otlp.json — OTLP/JSON (resourceSpans), для Jaeger/Tempo и otel-cli.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject, Update
+
+from .config import BASE_DIR, settings
+from .metrics import Counter
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+    from aiogram.methods import Response, TelegramMethod
+
+log = logging.getLogger(__name__)
+
+TRACES_TOTAL = Counter("traces_total", "Трассы апдейтов", ["result"])
+
+# perf_counter_ns — для длительностей, смещение — чтобы перевести его во время эпохи для OTLP
+_EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+_F = TypeVar("_F", bound=Callable[..., Awaitable[Any]])
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_id", "attrs", "start", "end", "tid", "_token")
+
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], attrs: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = self.end = 0
+        self.tid = 0
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        self.tid = threading.get_ident()
+        self._token = _current.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter_ns()
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            tracer.finish(self)
+
+
+class _NullSpan:
+    """Спан вне трассы: ничего не делает."""
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NULL = _NullSpan()
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def span(name: str, **attrs: Any) -> "Span | _NullSpan":
+    """Дочерний спан текущего; вне трассы — пустой объект."""
+    parent = _current.get()
+    if parent is None:
+        return _NULL
+    return Span(name, parent.trace, parent.span_id, attrs)
+
+
+def traced(name: str) -> Callable[[_F], _F]:
+    """Декоратор корутины: вызов — спан name."""
+    def decorate(fn: _F) -> _F:
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return decorate
+
+
+def start_trace(name: str, **attrs: Any) -> "Span | _NullSpan":
+    """Корневой спан новой трассы — с вероятностью TRACE_SAMPLE_RATE; иначе пустой объект."""
+    if settings.TRACE_SAMPLE_RATE <= 0 or random.random() >= settings.TRACE_SAMPLE_RATE:
+        return _NULL
+    return Span(name, Trace(), None, attrs)
+
+
+class Tracer:
+    def __init__(self, buffer: int, min_ms: float) -> None:
+        self.min_ns = int(min_ms * 1e6)
+        self._done: Deque[Trace] = deque(maxlen=buffer)
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def finish(self, root: Span) -> None:
+        if root.end - root.start < self.min_ns:
+            TRACES_TOTAL.labels("short").inc()
+            return
+        TRACES_TOTAL.labels("kept").inc()
+        self._done.append(root.trace)
+
+    def drain(self) -> List[Trace]:
+        traces = list(self._done)
+        self._done.clear()
+        return traces
+
+    def start(self) -> None:
+        if self._task is None and settings.TRACE_SAMPLE_RATE > 0:
+            self._task = asyncio.ensure_future(self._flusher())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        traces = self.drain()
+        if traces:
+            await asyncio.to_thread(write_files, traces, _trace_dir())
+
+    async def _flusher(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRACE_FLUSH_SECONDS)
+            traces = self.drain()
+            if not traces:
+                continue
+            try:
+                await asyncio.to_thread(write_files, traces, _trace_dir())
+            except Exception:
+                log.exception("Не удалось записать трассы")
+
+
+def _trace_dir() -> Path:
+    return BASE_DIR / settings.TRACE_DIR
+
+
+def chrome_events(traces: List[Trace]) -> Dict[str, Any]:
+    """Chrome trace-event JSON: по процессу на трассу, по потоку на поток ОС; спаны — события "X"."""
+    events: List[Dict[str, Any]] = []
+    for pid, trace in enumerate(traces, 1):
+        root = next((s for s in trace.spans if s.parent_id is None), None)
+        events.append({"name": "process_name", "ph": "M", "pid": pid,
+                       "args": {"name": f"{root.name if root else 'trace'} {trace.trace_id[:8]}"}})
+        for s in trace.spans:
+            events.append({
+                "name": s.name, "ph": "X", "pid": pid, "tid": s.tid,
+                "ts": (s.start + _EPOCH_OFFSET_NS) / 1000, "dur": (s.end - s.start) / 1000,
+                "args": {k: _plain(v) for k, v in s.attrs.items()},
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def otlp_json(traces: List[Trace]) -> Dict[str, Any]:
+    """OTLP/JSON (ExportTraceServiceRequest): то, что принимает коллектор OpenTelemetry по HTTP."""
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            spans.append({
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": 2 if s.parent_id is None else 1,  # SERVER для апдейта, INTERNAL для остального
+                "startTimeUnixNano": str(s.start + _EPOCH_OFFSET_NS),
+                "endTimeUnixNano": str(s.end + _EPOCH_OFFSET_NS),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attrs.items()],
+                **({"status": {"code": 2, "message": s.attrs["error"]}} if "error" in s.attrs else {}),
+            })
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "influencer-bot"}}]},
+        "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+    }]}
+
+
+def write_files(traces: List[Trace], directory: Path) -> Path:
+    """Пишет обе выгрузки; возвращает путь к Chrome-файлу. Зовут из потока."""
+    directory.mkdir(parents=True, exist_ok=True)
+    stem = directory / f"traces-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    chrome = stem.with_suffix(".json")
+    chrome.write_text(json.dumps(chrome_events(traces), ensure_ascii=False), encoding="utf-8")
+    stem.with_suffix(".otlp.json").write_text(json.dumps(otlp_json(traces), ensure_ascii=False), encoding="utf-8")
+    return chrome
+
+
+def _plain(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Корневой спан апдейта (outer, уровень Update); регистрируется первым, чтобы видеть и очереди."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        root = start_trace("update")
+        if root is _NULL:
+            return await handler(event, data)
+        if isinstance(event, Update):
+            root.set("update_id", event.update_id)
+            root.set("event_type", event.event_type)
+        with root:
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Спан на каждый запрос к Bot API (на сессии бота, первым — вместе с ожиданием в очереди)."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: "TelegramMethod[TelegramType]",
+    ) -> "Response[TelegramType]":
+        with span("bot." + method.__api_method__):
+            return await make_request(bot, method)
+
+
+tracer = Tracer(settings.TRACE_BUFFER, settings.TRACE_MIN_MS)
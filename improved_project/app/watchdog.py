@@ -0,0 +1,155 @@
+# app/watchdog.py
+"""
+Сторож event loop: задержка loop и поиск блокирующего кода.
+
+Пульс — корутина в loop: каждые LOOP_WATCHDOG_INTERVAL_MS засыпает и меряет, насколько позже
+проснулась (loop_lag_seconds). Сторож — отдельный поток: если пульса нет дольше интервала плюс
+LOOP_LAG_THRESHOLD_MS, loop кем-то занят прямо сейчас, и поток снимает стек потока loop
+(sys._current_frames). Когда loop оживает, пульс видит большую задержку и пишет отчёт:
+сколько длилась блокировка, какой хендлер (внешний кадр из app.routers, иначе внутренний кадр кода бота)
+и стек в момент блокировки; счётчик — loop_stalls_total по хендлеру.
+
+В тестах то же самое ловит блокировки и роняет тест (LoopBlocked — AssertionError):
+
+    async with detect_blocking(threshold_ms=50):
+        await on_city(cb, state)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from types import FrameType
+from typing import List, Optional, Tuple
+
+from .config import settings
+from .metrics import Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+LAG_SECONDS = Histogram(
+    "loop_lag_seconds", "Задержка event loop (насколько позже срока проснулся пульс)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+STALLS_TOTAL = Counter("loop_stalls_total", "Блокировки event loop дольше порога", ["handler"])
+
+
+class LoopBlocked(AssertionError):
+    pass
+
+
+@dataclass
+class Stall:
+    seconds: float
+    handler: str
+    stack: str
+
+
+def _handler_name(frame: Optional[FrameType]) -> str:
+    """Внешний кадр из app.routers — это хендлер; иначе самый внутренний кадр кода бота (или вообще)."""
+    handler = inner = None
+    top = f"{frame.f_globals.get('__name__', '')}.{frame.f_code.co_name}" if frame is not None else "-"
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.routers."):
+            handler = f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        elif inner is None and module.startswith("app."):
+            inner = f"{module[4:]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return handler or inner or top
+
+
+class LoopWatchdog:
+    def __init__(self, threshold_ms: float, interval_ms: float) -> None:
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.stalls: Optional[List[Stall]] = None  # detect_blocking копит блокировки сюда
+        self._beat = 0.0
+        self._captured: Optional[Tuple[float, str, str]] = None
+        self._loop_thread = 0
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Зовут из работающего loop."""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        # Своё событие на каждый запуск: поток прошлого запуска мог ещё не заметить stop()
+        self._stop = threading.Event()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        threading.Thread(target=self._monitor, args=(self._stop,), name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            self._beat = before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - before - self.interval, 0.0)
+            LAG_SECONDS.observe(lag)
+            if lag >= self.threshold:
+                self._report(before, lag)
+
+    def _monitor(self, stop: threading.Event) -> None:
+        # Поток стоит в стороне от loop: видит, что пульса нет, пока блокировка ещё идёт
+        while not stop.wait(self.interval / 2):
+            beat = self._beat
+            captured = self._captured
+            if time.monotonic() - beat < self.interval + self.threshold or (captured and captured[0] == beat):
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._captured = (beat, _handler_name(frame), "".join(traceback.format_stack(frame)))
+            del frame
+
+    def _report(self, beat: float, lag: float) -> None:
+        captured, self._captured = self._captured, None
+        if captured is not None and captured[0] == beat:
+            handler, stack = captured[1], captured[2]
+        else:
+            # Блокировка короче периода опроса сторожа — стек не успели снять
+            handler, stack = "-", ""
+        STALLS_TOTAL.labels(handler).inc()
+        log.warning("Event loop заблокирован на %.0f мс, хендлер %s\n%s", lag * 1000, handler, stack,
+                    extra={"stall_ms": round(lag * 1000), "handler": handler})
+        if self.stalls is not None:
+            self.stalls.append(Stall(lag, handler, stack))
+
+
+class detect_blocking:
+    """
+    Для тестов: блокировки loop дольше threshold_ms внутри блока — LoopBlocked на выходе.
+    Запускает свой сторож, поэтому работает и без watchdog.start().
+    """
+
+    def __init__(self, threshold_ms: float = 50, interval_ms: float = 10) -> None:
+        self._dog = LoopWatchdog(threshold_ms, interval_ms)
+        self._dog.stalls = []
+
+    async def __aenter__(self) -> List[Stall]:
+        self._dog.start()
+        await asyncio.sleep(0)  # пульс должен успеть запуститься до кода под проверкой
+        return self._dog.stalls
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # Даём пульсу проснуться после последней возможной блокировки
+        await asyncio.sleep(self._dog.interval * 2)
+        self._dog.stop()
+        stalls = self._dog.stalls
+        if exc_type is None and stalls:
+            worst = max(stalls, key=lambda s: s.seconds)
+            raise LoopBlocked(f"Event loop заблокирован {len(stalls)} раз(а), дольше всего "
+                              f"{worst.seconds * 1000:.0f} мс в {worst.handler}:\n{worst.stack}")
+
+
+watchdog = LoopWatchdog(settings.LOOP_LAG_THRESHOLD_MS, settings.LOOP_WATCHDOG_INTERVAL_MS)
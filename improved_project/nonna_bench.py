@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+nonna_bench.py — микробенчмарки горячих путей бота на синтетическом каталоге.
+Google Sheets, OpenAI и Telegram не используются.
+
+USAGE:
+  python nonna_bench.py            # все бенчмарки
+  python nonna_bench.py codec      # только выбранные
+"""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict
+
+# Settings() требует эти переменные; для бенчмарков подойдут заглушки
+for _k, _v in (("BOT_TOKEN", "0:bench"), ("GOOGLE_SHEET_ID", "bench"), ("OPENAI_API_KEY", "sk-bench")):
+    os.environ.setdefault(_k, _v)
+
+CITIES = ["Алматы", "Астана", "Шымкент", "Караганда", "Актобе", "Тараз", "Павлодар", "Усть-Каменогорск",
+          "Семей", "Атырау", "Костанай", "Кызылорда", "Уральск", "Петропавловск", "Актау", "Талдыкорган"]
+TOPICS = ["бьюти", "мода", "мамы", "спорт", "еда", "путешествия", "авто", "юмор", "финансы", "IT",
+          "образование", "здоровье", "дизайн интерьера", "музыка", "кино", "игры", "животные", "бизнес"]
+
+
+def synthetic_df(n: int, seed: int = 42):
+    import pandas as pd
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        followers = int(10 ** rnd.uniform(3, 6.5))
+        rows.append({
+            "name": f"Блогер {i}",
+            "username": f"@blogger_{i}",
+            "profile_url": f"https://instagram.com/blogger_{i}",
+            "city": rnd.choice(CITIES),
+            "topics": ", ".join(rnd.sample(TOPICS, rnd.randint(1, 3))),
+            "language": rnd.choice(["Казахский", "Русский", "Двуязычный"]),
+            "followers": followers,
+            "reach_stories": int(followers * rnd.uniform(0.03, 0.15)),
+            "reach_reels": int(followers * rnd.uniform(0.1, 0.6)),
+            "reach_post": int(followers * rnd.uniform(0.05, 0.3)),
+            "er": round(rnd.uniform(0.5, 12.0), 2),
+            "price": int(followers * rnd.uniform(0.5, 3.0)),
+            "updated_at": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "gender": rnd.choice(["ж", "м"]),
+            "age": str(rnd.randint(18, 45)),
+            "marital_status": rnd.choice(["замужем", "женат", "не замужем", "не женат", "разведена", ""]),
+            "children_count": rnd.choice([0, 0, 1, 2, 3, 5]),
+        })
+    return pd.DataFrame(rows)
+
+
+def timeit(label: str, fn: Callable[[], object], repeat: int) -> float:
+    fn()  # прогрев
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    per_call = (time.perf_counter() - started) / repeat
+    print(f"  {label:<48} {per_call * 1e6:>10.2f} мкс/вызов")
+    return per_call
+
+
+def bench_codec() -> None:
+    """Кодек callback_data и кеш страниц пикера."""
+    from app import callbacks as cbd
+    from app.catalog import Vocabulary
+    from app.keyboards import facet_picker_kb, paginated_multiselect_kb
+
+    print("codec:")
+    values = [f"{t} {i}" for i in range(40) for t in TOPICS]
+    vocab = Vocabulary("topic", "bench", values)
+    ids = list(range(len(vocab)))
+
+    def roundtrip():
+        for item_id in ids:
+            cbd.decode(cbd.encode("topic", cbd.PICK, item_id))
+
+    per_call = timeit(f"encode+decode x{len(ids)}", roundtrip, 200)
+    print(f"  {'  -> на одну пару':<48} {per_call / len(ids) * 1e9:>10.0f} нс")
+    longest = max(len(cbd.encode("topic", cbd.PICK, i).encode()) for i in ids)
+    print(f"  {'максимальная длина callback_data':<48} {longest:>10d} байт (лимит 64)")
+
+    mask = (1 << 3) | (1 << 7)
+    timeit("facet_picker_kb (кеш)", lambda: facet_picker_kb(vocab, "topic", 0, mask, limit=len(vocab)), 20000)
+    items = list(vocab.values)
+    selected = {items[3], items[7]}
+    timeit("paginated_multiselect_kb (сборка заново)",
+           lambda: paginated_multiselect_kb(items, "topic", selected_items=selected, page=0, items_per_page=10), 2000)
+
+
+def bench_prefix() -> None:
+    """Префиксный поиск inline-пикера по словарю."""
+    from app.catalog import Vocabulary
+    from app.search import PrefixIndex
+
+    print("prefix:")
+    rnd = random.Random(1)
+    values = {f"{rnd.choice(CITIES)}-{i}" if i % 3 else f"Город {i}": rnd.randint(1, 500) for i in range(20000)}
+    vocab = Vocabulary("city", "bench", values)
+    started = time.perf_counter()
+    index = PrefixIndex(vocab, vocab.counts)
+    print(f"  {'построение индекса (20k значений)':<48} {(time.perf_counter() - started) * 1000:>10.1f} мс")
+    for prefix in ("а", "ал", "алма", "каменог", "город 1"):
+        timeit(f"search({prefix!r})", lambda: index.search(prefix, limit=20), 2000)
+
+
+def bench_trigram() -> None:
+    """Канонизация ввода и выборка строк по спискам id против полного прохода по каталогу."""
+    import numpy as np
+    from app.catalog import Catalog
+
+    print("trigram:")
+    cat = Catalog(synthetic_df(100_000))
+    canon = cat.canonicalizer("city")
+    for text in ("Алматы", "almaty", "Нур-Султан", "Шымкнт"):
+        timeit(f"resolve({text!r})", lambda: canon.resolve(text), 2000)
+
+    df = cat.df
+
+    def full_scan():
+        mask = df["city"].str.lower().isin(["алматы", "астана"])
+        mask &= df["topics"].str.lower().str.contains("бьюти|спорт")
+        return df.loc[mask]
+
+    def postings():
+        rows = cat.rows_for("city", cat.resolve("city", ["алматы", "astana"]))
+        rows = np.intersect1d(rows, cat.rows_for("topic", cat.resolve("topic", ["beauty", "спорт"])),
+                              assume_unique=True)
+        return df.iloc[rows]
+
+    timeit("города+тематики: проход по 100k строк", full_scan, 20)
+    timeit("города+тематики: списки строк по id", postings, 200)
+
+
+def bench_brief() -> None:
+    """Разбор брифа одним сообщением (без ИИ-роутера)."""
+    from app.brief import parse_brief
+    from app.catalog import Catalog
+
+    print("brief:")
+    cat = Catalog(synthetic_df(20_000))
+    for text in ("Алматы, мамы-блогеры 25–35, до 50k подписчиков, бюджет 200k",
+                 "Нужны бьюти блогеры из Алматы и Астаны, девушки 20-30 лет, сторис и рилс, от 10 000 подписчиков"):
+        timeit(f"parse_brief({text[:30]!r}…)", lambda: parse_brief(text, cat), 2000)
+
+
+def bench_candidates() -> None:
+    """Шаг подбора по карте кандидатов сессии против полного пересчёта query_influencers."""
+    import time as _time
+    from app import candidates, catalog
+    from app.catalog import Catalog
+    from app.influencers import query_influencers
+
+    print("candidates:")
+    cat = Catalog(synthetic_df(100_000))
+    catalog._current, catalog._loaded_at = cat, _time.monotonic() + 1e9
+    index = cat.filter_index()
+    filters = dict(city=["Алматы", "Астана"], topic=["бьюти", "мамы"], age_range=(25, 35), language="Русский",
+                   marital_status="married", followers_min=10_000, budget_max=300_000)
+    bits = index.narrow(None, **{k: v for k, v in filters.items() if k != "budget_max"})
+    timeit("шаг: карта сессии & бюджет", lambda: index.narrow(bits, budget_max=300_000), 2000)
+    timeit("счётчик «подходит N»", lambda: candidates.count(bits, len(cat)), 20000)
+    from app.result_cache import results
+
+    def miss():
+        results.clear()
+        return query_influencers(**filters)
+
+    timeit("query_influencers: промах кеша результатов", miss, 200)
+    timeit("query_influencers: попадание в кеш", lambda: query_influencers(**filters), 2000)
+
+
+def bench_ranking() -> None:
+    """Очки релевантности и top-k по кандидатам на 100k и 500k строк."""
+    import numpy as np
+    from app.catalog import Catalog
+
+    print("ranking:")
+    for n in (100_000, 500_000):
+        cat = Catalog(synthetic_df(n))
+        started = time.perf_counter()
+        ranker = cat.ranker()
+        print(f"  {f'признаки на снимок ({n // 1000}k строк)':<48} {(time.perf_counter() - started) * 1000:>10.1f} мс")
+        topic_ids = cat.resolve("topic", ["бьюти", "мамы", "еда"])
+        everyone = np.ones(n, dtype=bool)
+        some = np.zeros(n, dtype=bool)
+        some[::10] = True
+        timeit(f"top-200 из всех {n // 1000}k, 3 тематики", lambda: ranker.top(everyone, topic_ids, k=200), 50)
+        timeit(f"top-200 из {n // 10000}k кандидатов", lambda: ranker.top(some, topic_ids, k=200), 200)
+        timeit(f"полная сортировка {n // 10000}k кандидатов", lambda: ranker.top(some, topic_ids), 50)
+
+
+def bench_campaign() -> None:
+    """Сборка кампании под общий бюджет: время и зазор до LP-границы."""
+    import numpy as np
+    from app.campaign import build_campaign
+    from app.catalog import Catalog
+
+    print("campaign:")
+    cat = Catalog(synthetic_df(100_000))
+    for n, budget in ((500, 2_000_000), (5_000, 10_000_000), (20_000, 50_000_000)):
+        rows = np.arange(n)
+        camp = build_campaign(cat, rows, budget)
+        timeit(f"{n} кандидатов, бюджет {budget // 1_000_000} млн ({camp.method}, зазор {camp.gap:.2%})",
+               lambda: build_campaign(cat, rows, budget), 20)
+
+
+def bench_similar() -> None:
+    """«Похожие»: построение признаков, соседи одной строки и ответ из памяти."""
+    from app.catalog import Catalog
+
+    print("similar:")
+    cat = Catalog(synthetic_df(100_000))
+    cat.filter_index()
+    started = time.perf_counter()
+    index = cat.similar_index()
+    print(f"  {'признаки на снимок (100k строк)':<48} {(time.perf_counter() - started) * 1000:>10.1f} мс")
+    timeit("соседи одной строки (проход по каталогу)", lambda: index._compute(12345), 200)
+    index.neighbours(42)
+    timeit("повторное нажатие «Похожие» (из памяти)", lambda: index.neighbours(42), 20000)
+
+
+def bench_percolate() -> None:
+    """Сохранённые поиски: сверка изменённых строк каталога с 20k поисков через обратный индекс."""
+    import tempfile
+    from pathlib import Path
+    from app.catalog import Catalog
+    from app.saved_searches import Percolator, SavedSearchStore
+
+    print("percolate:")
+    rnd = random.Random(3)
+    old_df = synthetic_df(100_000)
+    new_df = old_df.copy()
+    for i in rnd.sample(range(len(new_df)), 200):
+        new_df.loc[i, "price"] = int(new_df.loc[i, "price"] * rnd.uniform(0.3, 1.5))
+    old, new = Catalog(old_df), Catalog(new_df)
+    store = SavedSearchStore(Path(tempfile.mkdtemp()) / "saved_searches.jsonl")
+    for user in range(20_000):
+        filters = {"city": rnd.sample(CITIES, rnd.randint(1, 2))}
+        if rnd.random() < 0.7:
+            filters["topic"] = rnd.sample(TOPICS, rnd.randint(1, 3))
+        if rnd.random() < 0.5:
+            filters["budget_max"] = rnd.choice([20_000, 100_000, 1_000_000])
+        store.add(user, user, filters, "bench")
+    percolator = Percolator(store)
+    started = time.perf_counter()
+    matches = percolator.percolate(old, new)
+    print(f"  {'200 изменённых строк, 20k поисков (со сборкой)':<48} {(time.perf_counter() - started) * 1000:>10.1f} мс"
+          f"  ({len(matches)} поисков с новыми блогерами)")
+    timeit("то же, поиски уже скомпилированы", lambda: percolator.percolate(old, new), 5)
+
+
+def _export_in_child(fmt: str, source, path: str, legacy: bool):
+    """Выполняется в отдельном процессе: (строк, пиковый RSS до рендера, после, секунд)."""
+    import resource
+    from app.export_render import _catalog_df, render_export
+
+    if source[0] == "catalog":
+        _catalog_df(source[1], source[2])  # снимок процесс пула читает один раз, в замер не входит
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if legacy:
+        # Как было: DataFrame из записей выдачи + ExcelWriter в BytesIO
+        import io
+        import warnings
+        import pandas as pd
+        df = _catalog_df(source[1], source[2]).iloc[source[3]]
+        records = df.to_dict(orient="records")
+        output = io.BytesIO()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # xlsxwriter предупреждает о лимите ссылок на лист
+            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
+                pd.DataFrame(records).to_excel(writer, index=False, sheet_name="Influencers")
+        n = len(records)
+    else:
+        n = render_export(fmt, source, path)
+    return n, before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, time.perf_counter() - started
+
+
+def bench_export() -> None:
+    """Экспорт всех результатов (100k строк): время и прирост пикового RSS процесса пула."""
+    import multiprocessing
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+    from pathlib import Path
+    import numpy as np
+    from app.catalog import Catalog
+
+    print("export:")
+    cat = Catalog(synthetic_df(100_000))
+    tmp = Path(tempfile.mkdtemp())
+    snapshot = tmp / f"catalog-{cat.version}.pkl"
+    cat.df.to_pickle(snapshot)
+    rows = np.arange(len(cat))
+    source = ("catalog", cat.version, str(snapshot), rows)
+    cases = [("xlsx", True, "xlsx: DataFrame + BytesIO (как было)"), ("xlsx", False, "xlsx: constant_memory"),
+             ("csv", False, "csv: пачками"), ("pdf", False, "pdf: постранично")]
+    ctx = multiprocessing.get_context("spawn")
+    for fmt, legacy, label in cases:
+        # Свежий процесс на каждый замер: ru_maxrss не сбрасывается
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            n, before, after, seconds = pool.submit(
+                _export_in_child, fmt, source, str(tmp / f"out.{fmt}"), legacy).result()
+        print(f"  {label + f' ({n // 1000}k строк)':<48} {seconds * 1000:>10.0f} мс"
+              f"  пиковый RSS {after / 1024:.0f} МБ (+{(after - before) / 1024:.0f} к прочитанному снимку)")
+
+
+def bench_logging() -> None:
+    """Логирование апдейта (LoggingMiddleware): время в event loop — прежний StreamHandler против очереди."""
+    import asyncio
+    import logging
+    from types import SimpleNamespace
+    from aiogram.types import Message
+    from app import logger
+    from app.config import settings
+    from app.middlewares import LoggingMiddleware
+
+    print("logging:")
+    user = SimpleNamespace(id=123456789, username="bench_user")
+    event = Message.model_construct(text="Хочу блогеров из Алматы про бьюти, бюджет до 500 000", from_user=user)
+    middleware = LoggingMiddleware()
+
+    async def handler(_event, _data):
+        return None
+
+    loop = asyncio.new_event_loop()
+    root = logging.getLogger()
+    devnull = open(os.devnull, "w")
+    n = 20_000
+
+    def per_update() -> float:
+        loop.run_until_complete(_bench_updates(middleware, handler, event, 1000))  # прогрев
+        started = time.perf_counter()
+        loop.run_until_complete(_bench_updates(middleware, handler, event, n))
+        return (time.perf_counter() - started) / n
+
+    try:
+        # Как было: синхронный StreamHandler, DEBUG, запись и форматирование прямо в вызывающем потоке
+        root.handlers.clear()
+        legacy = logging.StreamHandler(devnull)
+        legacy.setFormatter(logging.Formatter(logger.TEXT_FORMAT))
+        root.addHandler(legacy)
+        root.setLevel(logging.DEBUG)
+        print(f"  {'StreamHandler в loop (как было)':<48} {per_update() * 1e6:>10.2f} мкс/апдейт")
+
+        saved = sys.stdout, settings.LOG_UPDATES_SAMPLE
+        sys.stdout = devnull
+        try:
+            for sample in (1.0, 0.1):
+                settings.LOG_UPDATES_SAMPLE = sample
+                logger.setup_logging()
+                seconds = per_update()
+                logger.stop_logging()
+                print(f"  {f'очередь + JSON, выборка {sample:.0%}':<48} {seconds * 1e6:>10.2f} мкс/апдейт",
+                      file=saved[0])
+        finally:
+            sys.stdout, settings.LOG_UPDATES_SAMPLE = saved
+    finally:
+        root.handlers.clear()
+        loop.close()
+        devnull.close()
+
+
+async def _bench_updates(middleware, handler, event, n: int) -> None:
+    for _ in range(n):
+        await middleware(handler, event, {})
+
+
+def _importtime(code: str):
+    """Свежий интерпретатор с -X importtime: (время процесса, {модуль: накопленное время импорта в мкс})."""
+    import subprocess
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - started
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            cumulative[parts[2].strip()] = int(parts[1])
+    return seconds, cumulative
+
+
+def bench_startup() -> None:
+    """Холодный старт: импорт app.bot сейчас и с прежними жёсткими импортами; разбор python -X importtime."""
+    print("startup:")
+    heavy = ["pandas", "openai", "gspread", "gspread_dataframe", "google.oauth2.service_account"]
+    cases = [("import app.bot", "ленивые импорты"),
+             ("import app.bot; " + "; ".join(f"import {m}" for m in heavy), "все импорты при старте (как было)")]
+    for code, label in cases:
+        runs = [_importtime(code) for _ in range(3)]
+        seconds, cumulative = min(runs, key=lambda r: r[0])
+        print(f"  {label:<48} процесс {seconds * 1000:>8.0f} мс, импорт app.bot {cumulative.get('app.bot', 0) / 1000:.0f} мс")
+    print("  самые тяжёлые импорты верхнего уровня при старте (мс):")
+    _, cumulative = _importtime("import app.bot")
+    for name in ("aiogram", "app.routers", "app.middlewares", "app.config", "numpy") + tuple(heavy):
+        if name in cumulative:
+            print(f"    {name:<44} {cumulative[name] / 1000:>8.0f}")
+        else:
+            print(f"    {name:<44} {'—':>8} (не импортируется)")
+
+
+BENCHES: Dict[str, Callable[[], None]] = {
+    "codec": bench_codec,
+    "prefix": bench_prefix,
+    "trigram": bench_trigram,
+    "brief": bench_brief,
+    "candidates": bench_candidates,
+    "ranking": bench_ranking,
+    "campaign": bench_campaign,
+    "similar": bench_similar,
+    "percolate": bench_percolate,
+    "export": bench_export,
+    "startup": bench_startup,
+    "logging": bench_logging,
+}
+
+
+def main(argv) -> int:
+    names = argv or list(BENCHES)
+    unknown = [n for n in names if n not in BENCHES]
+    if unknown:
+        print(f"Неизвестные бенчмарки: {', '.join(unknown)}. Доступны: {', '.join(BENCHES)}")
+        return 2
+    for name in names:
+        BENCHES[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
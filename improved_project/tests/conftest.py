@@ -0,0 +1,181 @@
+# tests/conftest.py
+"""
+Общие фикстуры: бот с поддельной сессией (запросы к Bot API не уходят в сеть, а записываются),
+FSM-контекст в памяти и маленький синтетический каталог вместо листа Google Sheets.
+
+Асинхронные тесты (async def test_...) запускаются в своём event loop через asyncio.run —
+без pytest-asyncio.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, List
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Settings() требует эти переменные; для тестов подойдут заглушки
+for _k, _v in (("BOT_TOKEN", "42:test"), ("GOOGLE_SHEET_ID", "test"), ("OPENAI_API_KEY", "sk-test")):
+    os.environ.setdefault(_k, _v)
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import SendDocument, SendMessage
+from aiogram.types import CallbackQuery, Message, Update
+
+from app import catalog
+from app.api_budget import CountingRequestMiddleware
+
+CHAT_ID = USER_ID = 1001
+
+CITIES = ["Алматы", "Астана", "Шымкент", "Караганда", "Актобе", "Тараз"]
+TOPICS = ["бьюти", "мода", "мамы", "спорт", "еда", "путешествия", "авто", "юмор"]
+
+
+def pytest_pyfunc_call(pyfuncitem: pytest.Function):
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**kwargs))
+        return True
+    return None
+
+
+class FakeSession(BaseSession):
+    """Сессия без сети: запоминает методы; sendMessage/sendDocument возвращают сообщение, прочие — True."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests: List[Any] = []
+        self._ids = itertools.count(100)
+
+    async def make_request(self, bot: Bot, method: Any, timeout: Any = None) -> Any:
+        self.requests.append(method)
+        if isinstance(method, (SendMessage, SendDocument)):
+            return Message.model_validate(
+                {"message_id": next(self._ids), "date": datetime.now(), "text": getattr(method, "text", None),
+                 "chat": {"id": method.chat_id, "type": "private"}},
+                context={"bot": bot},
+            )
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any):  # pragma: no cover - тестам не нужен
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def methods(self) -> List[str]:
+        return [type(m).__name__ for m in self.requests]
+
+
+@pytest.fixture
+def bot() -> Bot:
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FakeSession())
+    bot.session.middleware(CountingRequestMiddleware())
+    return bot
+
+
+@pytest.fixture
+def state(bot: Bot) -> FSMContext:
+    return FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=bot.id, chat_id=CHAT_ID, user_id=USER_ID))
+
+
+@pytest.fixture
+def dispatcher(monkeypatch: pytest.MonkeyPatch) -> Dispatcher:
+    """Dispatcher с отменой устаревших действий и очередью чатов, как в bot.py, и роутером подбора."""
+    from app.routers import influencers
+    from app.scheduler import SchedulerMiddleware
+    from app.supersede import SupersedeMiddleware
+
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.update.outer_middleware(SupersedeMiddleware())
+    dp.update.outer_middleware(SchedulerMiddleware(max_concurrency=4, max_queue_per_chat=8, max_waiting=32))
+    # Роутер — синглтон модуля: после теста отвязываем его от этого Dispatcher
+    monkeypatch.setattr(influencers.router, "_parent_router", None)
+    dp.include_router(influencers.router)
+    return dp
+
+
+def dp_state(dp: Dispatcher, bot: Bot) -> FSMContext:
+    return dp.fsm.get_context(bot, chat_id=CHAT_ID, user_id=USER_ID)
+
+
+_update_ids = itertools.count(1)
+
+
+def update(event: Any) -> Update:
+    field = "callback_query" if isinstance(event, CallbackQuery) else "message"
+    return Update(update_id=next(_update_ids), **{field: event})
+
+
+def _user() -> dict:
+    return {"id": USER_ID, "is_bot": False, "first_name": "Тест", "username": "tester"}
+
+
+def message(bot: Bot, text: str = "", message_id: int = 10) -> Message:
+    return Message.model_validate(
+        {"message_id": message_id, "date": datetime.now(), "text": text, "from": _user(),
+         "chat": {"id": CHAT_ID, "type": "private"}},
+        context={"bot": bot},
+    )
+
+
+def callback(bot: Bot, data: str, text: str = "…", message_id: int = 10) -> CallbackQuery:
+    return CallbackQuery.model_validate(
+        {"id": "1", "from": _user(), "chat_instance": "1", "data": data,
+         "message": {"message_id": message_id, "date": datetime.now(), "text": text,
+                     "chat": {"id": CHAT_ID, "type": "private"}}},
+        context={"bot": bot},
+    )
+
+
+def synthetic_df(n: int = 300, seed: int = 7):
+    import pandas as pd
+
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        followers = int(10 ** rnd.uniform(3, 6))
+        rows.append({
+            "name": f"Блогер {i}",
+            "username": f"@blogger_{i}",
+            "city": rnd.choice(CITIES),
+            "topics": ", ".join(rnd.sample(TOPICS, rnd.randint(1, 3))),
+            "language": rnd.choice(["Казахский", "Русский", "Двуязычный"]),
+            "followers": followers,
+            "reach_stories": int(followers * rnd.uniform(0.03, 0.15)),
+            "reach_reels": int(followers * rnd.uniform(0.1, 0.6)),
+            "reach_post": int(followers * rnd.uniform(0.05, 0.3)),
+            "er": f"{rnd.uniform(0.5, 8.0):.1f}%".replace(".", ","),
+            "price": int(followers * rnd.uniform(0.5, 3.0)),
+            "updated_at": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+            "gender": rnd.choice(["ж", "м"]),
+            "age": str(rnd.randint(18, 45)),
+            "marital_status": rnd.choice(["замужем", "женат", "не замужем", "не женат", "разведена", ""]),
+            "children_count": rnd.choice([0, 0, 1, 2, 3, 5]),
+        })
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def cat(monkeypatch: pytest.MonkeyPatch) -> catalog.Catalog:
+    """Синтетический снимок — текущий каталог; лист не читается."""
+    snapshot = catalog.Catalog(synthetic_df())
+    history = type(catalog._history)({snapshot.version: snapshot})
+    monkeypatch.setattr(catalog, "_history", history)
+    monkeypatch.setattr(catalog, "_current", snapshot)
+    monkeypatch.setattr(catalog, "_loaded_at", time.monotonic())
+    monkeypatch.setattr(catalog.settings, "CATALOG_TTL_SECONDS", 10 ** 9)
+    return snapshot
@@ -0,0 +1,65 @@
+# tests/test_api_budget.py
+"""Бюджет запросов к Bot API у горячих хендлеров результатов (вместе с отложенными правками)."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.api_budget import ApiBudgetExceeded, count_api_calls
+from app.routers.influencers import on_pick, on_results_nav
+
+from conftest import callback
+
+RECORDS = [{"name": f"Блогер {i}", "username": f"blogger_{i}", "city": "Алматы"} for i in range(10)]
+
+
+async def test_pick_counts_deferred_edit(bot, state):
+    await state.update_data(results_df=RECORDS, res_page=1, picked=set())
+    async with count_api_calls(budget=2) as calls:
+        await on_pick(callback(bot, "pick:blogger_1"), state)
+    # answerCallbackQuery сразу и перерисовка клавиатуры после окна склейки
+    assert calls.methods == ["AnswerCallbackQuery", "EditMessageReplyMarkup"]
+
+
+async def test_page_turn_within_budget(bot, state):
+    await state.update_data(results_df=RECORDS, res_page=1, picked=set())
+    async with count_api_calls(budget=2) as calls:
+        await on_results_nav(callback(bot, "res:page:2"), state)
+    assert calls.methods == ["AnswerCallbackQuery", "EditMessageText"]
+
+
+async def test_rapid_picks_share_one_edit(bot, state):
+    await state.update_data(results_df=RECORDS, res_page=1, picked=set())
+
+    async def tap(username: str):
+        async with count_api_calls(budget=2) as calls:
+            await on_pick(callback(bot, f"pick:{username}"), state)
+        return calls
+
+    counters = await asyncio.gather(*(tap(u) for u in ("blogger_1", "blogger_2", "blogger_3")))
+    # Каждое нажатие отвечает на callback, а клавиатуру перерисовывает только последнее
+    assert [c.calls for c in counters] == [1, 1, 2]
+    assert bot.session.methods().count("EditMessageReplyMarkup") == 1
+
+
+async def test_budget_exceeded_raises(bot, state):
+    await state.update_data(results_df=RECORDS, res_page=1, picked=set())
+    with pytest.raises(ApiBudgetExceeded):
+        async with count_api_calls(budget=1):
+            await on_pick(callback(bot, "pick:blogger_1"), state)
+
+
+async def test_pick_after_page_turn_keeps_page_text(bot, state):
+    await state.update_data(results_df=RECORDS, res_page=1, picked=set())
+
+    async def tap(handler, data: str):
+        async with count_api_calls(budget=2):
+            await handler(callback(bot, data), state)
+
+    # Выбор блогера в окне склейки после «Вперёд»: перерисовка страницы не должна смениться правкой
+    # одной клавиатуры — иначе под текстом первой страницы окажутся кнопки второй
+    await asyncio.gather(tap(on_results_nav, "res:page:2"), tap(on_pick, "pick:blogger_5"))
+    edits = [m for m in bot.session.requests if type(m).__name__.startswith("EditMessage")]
+    assert [type(m).__name__ for m in edits] == ["EditMessageText"]
+    assert "Блогер 5" in edits[0].text and "Блогер 1" not in edits[0].text
@@ -0,0 +1,30 @@
+# tests/test_brief.py
+"""Разбор брифа одним сообщением (без ИИ-роутера)."""
+from __future__ import annotations
+
+import pytest
+
+from app.brief import parse_brief
+from app.influencers import parse_age_range, parse_followers_range
+
+
+@pytest.mark.parametrize("text, age, age_range", [
+    ("Караганда спорт 30+", "30+", (30, None)),
+    ("Алматы, мамы 25–35", "25-35", (25, 35)),
+    ("Астана, еда до 30 лет", "до 30", (None, 30)),
+])
+def test_age(cat, text, age, age_range):
+    brief = parse_brief(text, cat)
+    assert brief.age_text == age
+    assert parse_age_range(brief.age_text) == age_range
+
+
+def test_full_brief(cat):
+    brief = parse_brief("Алматы, мамы-блогеры 25–35, до 50k подписчиков, бюджет 200k", cat)
+    assert [cat.cities.values[i] for i in brief.cities] == ["Алматы"]
+    assert [cat.topics.values[i] for i in brief.topics] == ["мамы"]
+    assert brief.age_text == "25-35"
+    assert brief.followers_text == "до 50k"
+    assert parse_followers_range(brief.followers_text) == (None, 50_000)
+    assert brief.budget_text == "200k"
+    assert not brief.leftovers
@@ -0,0 +1,24 @@
+# tests/test_catalog.py
+"""Обновление снимка каталога: индексы строятся один раз на снимок."""
+from __future__ import annotations
+
+from app import catalog, influencers
+from app.routers.influencers import on_similar
+
+from conftest import callback, synthetic_df
+
+
+def test_refresh_prepares_indexes(cat, monkeypatch):
+    monkeypatch.setattr(influencers, "_read_influencers_worksheet", lambda: synthetic_df(seed=8))
+    fresh = catalog.refresh()
+    assert fresh is not cat
+    assert fresh._filter_index is not None and fresh._ranker is not None and fresh._similar_index is not None
+
+
+async def test_similar_from_prepared_snapshot(bot, state, cat):
+    cat.prepare()
+    await state.update_data(res_ver=cat.version, picked=set())
+    username = str(cat.df.iloc[0]["username"]).lstrip("@")
+    await on_similar(callback(bot, f"sim:{username}"), state)
+    sent = bot.session.requests[0]
+    assert sent.text.startswith(f"Похожие на {cat.df.iloc[0]['name']}")
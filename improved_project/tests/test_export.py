@@ -0,0 +1,94 @@
+# tests/test_export.py
+"""Экспорт: хендлер не ждёт рендер, файлы снимков не удаляются из-под заданий в очереди."""
+from __future__ import annotations
+
+import asyncio
+import collections
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import DeleteMessage
+from app import export_worker
+from app.export_cache import ExportCache
+from app.routers import influencers as router
+
+from conftest import callback
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_worker, "EXPORT_DIR", tmp_path)
+    monkeypatch.setattr(export_worker, "_snapshot_refs", collections.defaultdict(int))
+    monkeypatch.setattr(router, "export_cache", ExportCache(tmp_path / "cache", 10 ** 9))
+    return tmp_path
+
+
+class FakeExporter:
+    """Вместо пула процессов: задание завершает сам тест."""
+
+    pending = 1
+
+    def __init__(self) -> None:
+        self.jobs = []
+
+    def submit(self, user_id, fmt, source):
+        job = asyncio.get_running_loop().create_future()
+        self.jobs.append((job, source))
+        return job
+
+
+async def test_export_handler_returns_before_render(bot, state, cat, export_dir, monkeypatch):
+    exporter = FakeExporter()
+    monkeypatch.setattr(router, "exporter", exporter)
+    await router.on_export(callback(bot, "expfmt:csv:all"), state)
+
+    # Хендлер ответил на callback и показал статус, а задание ещё в очереди
+    assert bot.session.methods() == ["AnswerCallbackQuery", "SendMessage"]
+    (job, source), = exporter.jobs
+    assert source[0] == "catalog" and (export_dir / f"catalog-{cat.version}.pkl").exists()
+
+    rendered = export_dir / "tmp-1.csv"
+    rendered.write_text("name\n", encoding="utf-8")
+    job.set_result((rendered, 1))
+    await asyncio.gather(*router._exporting)
+    assert bot.session.methods()[-2:] == ["DeleteMessage", "SendDocument"]
+
+    # Та же выгрузка ещё раз — готовый файл из кеша, без нового задания
+    await router.on_export(callback(bot, "expfmt:csv:all"), state)
+    await asyncio.gather(*router._exporting)
+    assert len(exporter.jobs) == 1
+    assert bot.session.methods()[-2:] == ["AnswerCallbackQuery", "SendDocument"]
+
+
+def test_snapshot_of_queued_job_survives_new_version(cat, export_dir):
+    old = export_worker.snapshot_path(cat)
+    newer = type(cat)(cat.df.head(50))
+    new = export_worker.snapshot_path(newer)
+    # Задание по старой версии ещё в очереди — её файл на месте
+    assert old.exists() and new.exists()
+
+    export_worker.release_snapshot(old)
+    export_worker.release_snapshot(new)
+    export_worker.snapshot_path(type(cat)(cat.df.head(10)))
+    assert not old.exists() and not new.exists()
+
+
+async def test_export_sent_when_status_already_deleted(bot, state, cat, export_dir, monkeypatch):
+    exporter = FakeExporter()
+    monkeypatch.setattr(router, "exporter", exporter)
+    make_request = bot.session.make_request
+
+    async def status_gone(bot_, method, timeout=None):
+        if isinstance(method, DeleteMessage):
+            raise TelegramBadRequest(method, "Bad Request: message to delete not found")
+        return await make_request(bot_, method, timeout)
+
+    bot.session.make_request = status_gone
+    await router.on_export(callback(bot, "expfmt:csv:all"), state)
+    rendered = export_dir / "tmp-1.csv"
+    rendered.write_text("name\n", encoding="utf-8")
+    (job, _), = exporter.jobs
+    job.set_result((rendered, 1))
+    # Фоновая отправка не падает на статусе и доводит файл до пользователя
+    await asyncio.gather(*router._exporting)
+    assert bot.session.methods()[-1] == "SendDocument"
@@ -0,0 +1,37 @@
+# tests/test_middlewares.py
+"""«Печатает…» не приходит после ответа хендлера."""
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.methods import SendChatAction
+
+from app.middlewares import TypingMiddleware
+
+from conftest import message
+
+
+async def test_typing_sender_cancelled_with_handler(bot):
+    session = bot.session
+    finished = []
+    make_request = session.make_request
+
+    async def slow_chat_action(bot_, method, timeout=None):
+        if isinstance(method, SendChatAction):
+            # Запрос ждёт своей очереди отправки, пока хендлер уже отвечает
+            await asyncio.sleep(0.05)
+        result = await make_request(bot_, method, timeout)
+        finished.append(type(method).__name__)
+        return result
+
+    session.make_request = slow_chat_action
+
+    async def handler(event, data):
+        await asyncio.sleep(0)  # sendChatAction ушёл в очередь
+        await event.answer("Готово")
+
+    data = {"bot": bot, "handler": SimpleNamespace(flags={"chat_action": "typing"})}
+    await TypingMiddleware(delay_ms=0)(handler, message(bot), data)
+    await asyncio.sleep(0.1)
+    assert finished == ["SendMessage"]
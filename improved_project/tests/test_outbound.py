@@ -0,0 +1,56 @@
+# tests/test_outbound.py
+"""Очередь отправки: flood control одного чата и приоритеты внутри чата."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendDocument, SendMessage
+
+from app.outbound import OutboundMiddleware, Priority, priority
+
+GROUP, OTHER = -100, 200
+
+
+async def test_retry_after_in_one_chat_does_not_stall_others(bot):
+    outbound = OutboundMiddleware(global_rate=30, chat_rate=1, chat_burst=3, max_retries=0)
+    sent = []
+
+    async def make_request(bot_, method):
+        if method.chat_id == GROUP:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after=5)
+        sent.append(method.chat_id)
+        return True
+
+    with pytest.raises(TelegramRetryAfter):
+        await outbound(make_request, bot, SendMessage(chat_id=GROUP, text="в группу"))
+    started = time.monotonic()
+    await outbound(make_request, bot, SendMessage(chat_id=OTHER, text="в личку"))
+    # Штраф — только группе: второй чат отправляет сразу, а группа ждёт retry_after
+    assert sent == [OTHER] and time.monotonic() - started < 0.5
+    assert outbound._chat(GROUP).bucket.try_take(time.monotonic()) > 4
+
+
+async def test_interactive_reply_overtakes_export_in_same_chat(bot):
+    outbound = OutboundMiddleware(global_rate=5, chat_rate=10, chat_burst=5, max_retries=0)
+    order = []
+
+    async def make_request(bot_, method):
+        order.append(type(method).__name__)
+        return True
+
+    # Общие токены кончились — экспорт ждёт в общей очереди
+    while outbound._global.try_take(time.monotonic()) == 0:
+        pass
+
+    async def export():
+        with priority(Priority.EXPORT):
+            await outbound(make_request, bot, SendDocument(chat_id=OTHER, document="file-id"))
+
+    waiting = asyncio.ensure_future(export())
+    await asyncio.sleep(0)
+    await outbound(make_request, bot, SendMessage(chat_id=OTHER, text="ответ"))
+    await waiting
+    assert order == ["SendMessage", "SendDocument"]
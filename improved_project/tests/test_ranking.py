@@ -0,0 +1,41 @@
+# tests/test_ranking.py
+"""Ранжирование выдачи: свежесть считается на момент запроса, а не сборки снимка."""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+DAY = 86400
+
+
+def test_freshness_decays_over_snapshot_lifetime(cat):
+    ranker = cat.ranker()
+    rows = np.arange(len(cat.df))
+    newest = pd.to_datetime(cat.df["updated_at"]).max().timestamp()
+    half_life = ranker.freshness(rows, now=newest + 90 * DAY)
+    # Тот же снимок месяцами позже: очки свежести падают, хотя ranker не пересобирался
+    later = ranker.freshness(rows, now=newest + 180 * DAY)
+    assert (later < half_life).all()
+    assert np.allclose(later, half_life / 2)
+
+
+def test_freshness_ranks_recent_update_higher(cat):
+    ranker = cat.ranker()
+    order = np.argsort(pd.to_datetime(cat.df["updated_at"]).to_numpy())
+    old, new = order[0], order[-1]
+    now = pd.Timestamp("2026-01-01").timestamp()
+    fresh = ranker.freshness(np.array([old, new]), now=now)
+    assert fresh[1] > fresh[0]
+
+
+def test_higher_er_ranks_higher(cat):
+    df = cat.df.copy()
+    # Две одинаковые строки, различается только engagement rate
+    twin = df.iloc[[0]].assign(username="@twin", er="9,5%")
+    df = pd.concat([df.assign(er=df["er"].where(df.index != 0, "1%")), twin], ignore_index=True)
+    ranker = type(cat)(df).ranker()
+    low, high = 0, len(df) - 1
+    mask = np.zeros(len(df), dtype=bool)
+    mask[[low, high]] = True
+    assert ranker.er[high] > ranker.er[low]
+    assert ranker.top(mask).tolist() == [high, low]
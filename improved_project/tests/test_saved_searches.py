@@ -0,0 +1,50 @@
+# tests/test_saved_searches.py
+"""Сохранённые поиски: сверка обновления каталога в фоне и очередь оповещений до старта."""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from app import catalog, influencers, saved_searches
+from app.saved_searches import Alert, AlertQueue
+
+from conftest import CHAT_ID, synthetic_df
+
+
+def test_refresh_does_not_wait_for_percolation(cat, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    seen = {}
+
+    def slow_match(previous, fresh):
+        seen["thread"] = threading.current_thread()
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(saved_searches, "_match_update", slow_match)
+    monkeypatch.setattr(influencers, "_read_influencers_worksheet", lambda: synthetic_df(seed=9))
+    try:
+        # refresh возвращается, пока сверка ещё идёт — и идёт она не в вызвавшем потоке
+        assert catalog.refresh() is not cat
+        assert started.wait(5)
+        assert seen["thread"] is not threading.current_thread()
+    finally:
+        release.set()
+
+
+async def test_alerts_before_start_are_queued(bot):
+    queue = AlertQueue()
+    search = {"id": "s1", "chat_id": CHAT_ID, "title": "Алматы, бьюти"}
+    queue.submit([Alert(search, [{"name": "Блогер", "username": "@blogger", "followers": 1000, "price": 500}], 1)])
+
+    queue.start(bot)
+    try:
+        for _ in range(100):
+            if bot.session.requests:
+                break
+            await asyncio.sleep(0.01)
+        assert bot.session.methods() == ["SendMessage"]
+        assert bot.session.requests[0].chat_id == CHAT_ID
+    finally:
+        for task in queue._tasks:
+            task.cancel()
+        queue.shutdown()
@@ -0,0 +1,73 @@
+# tests/test_selection.py
+"""Сценарий подбора: пикеры, смена версии каталога, выдача."""
+from __future__ import annotations
+
+import pytest
+from aiogram.methods import AnswerCallbackQuery, SendMessage
+
+from app import catalog
+from app.result_cache import results
+from app.routers.influencers import (
+    on_age_text, on_brief, on_city, on_decide, on_language, on_results_nav, on_topic, start_selection,
+)
+from app.states import SelectionBasicStates
+
+from conftest import callback, message
+
+
+async def test_expired_catalog_restarts_picker(bot, state, cat):
+    await state.set_state(SelectionBasicStates.cities)
+    await state.update_data(cat_ver="evicted", sel_cities=0b11, cand=None)
+    await on_city(callback(bot, "city:d"), state)
+
+    alert, restart = bot.session.requests
+    assert isinstance(alert, AnswerCallbackQuery) and alert.show_alert
+    assert isinstance(restart, SendMessage)
+    # Подбор начат заново на текущем снимке, прежний выбор (id другой версии) сброшен
+    data = await state.get_data()
+    assert data["cat_ver"] == cat.version and data["sel_cities"] == 0
+    assert await state.get_state() == SelectionBasicStates.cities.state
+
+
+async def test_expired_catalog_in_topics(bot, state, cat):
+    await state.set_state(SelectionBasicStates.topics)
+    await state.update_data(cat_ver="evicted", sel_topics=0b1)
+    await on_topic(callback(bot, "topic:p:2"), state)
+    assert (await state.get_data())["cat_ver"] == cat.version
+    assert await state.get_state() == SelectionBasicStates.cities.state
+
+
+def test_vocabulary_never_falls_back(cat):
+    # Раньше здесь молча подставлялся текущий снимок (и мог прочитаться лист прямо в event loop)
+    with pytest.raises(catalog.CatalogExpired):
+        catalog.vocabulary("city", "evicted")
+    assert catalog.vocabulary("city", cat.version) is cat.cities
+
+
+async def test_new_selection_drops_previous_filters(bot, state, cat):
+    # Раунд 1 — бриф с возрастом и бюджетом
+    await state.update_data(paid=True)
+    await start_selection(message(bot), state)
+    await on_brief(message(bot, "Алматы, мамы 25–35, бюджет 200k"), state)
+    first = (await state.get_data())["res_filters"]
+    assert first["age_range"] == (25, 35) and first["budget_max"] == 200_000
+
+    # Раунд 2 — «Новый подбор» и пошаговые пикеры: возраст другой, бюджет не задан
+    await on_results_nav(callback(bot, "res:new"), state)
+    await on_city(callback(bot, f"city:p:{cat.cities.id_of('Астана')}"), state)
+    await on_city(callback(bot, "city:d"), state)
+    await on_topic(callback(bot, f"topic:p:{cat.topics.id_of('спорт')}"), state)
+    await on_topic(callback(bot, "topic:d"), state)
+    await on_age_text(message(bot, "20-40"), state)
+    await on_language(callback(bot, "lang:x:Пропустить"), state)
+    await on_decide(callback(bot, "decide:x:Показать результат"), state)
+
+    data = await state.get_data()
+    filters = data["res_filters"]
+    assert filters["city"] == ["Астана"] and filters["topic"] == ["спорт"]
+    assert filters["age_range"] == (20, 40)
+    assert filters["budget_max"] is None and filters["gender"] is None
+    # Под ключом этих фильтров в общем кеше лежат строки, которые им действительно удовлетворяют
+    expected = cat.filter_index().evaluate(**filters)
+    cached = results.get_or_compute(cat, filters, lambda: pytest.fail("выдача раунда 2 не попала в кеш"))
+    assert expected[cached].all() and len(cached) == int(expected.sum())
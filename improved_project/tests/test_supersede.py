@@ -0,0 +1,40 @@
+# tests/test_supersede.py
+"""Отмена устаревших действий: шаги, меняющие состояние FSM, не прерываются повторным нажатием."""
+from __future__ import annotations
+
+import asyncio
+
+from aiogram.methods import AnswerCallbackQuery, EditMessageText
+
+from app.coalesce import coalescer
+from app.routers.influencers import on_city, start_selection
+from app.states import SelectionBasicStates
+from app.supersede import interaction_key
+
+from conftest import callback, dp_state, message, update
+
+
+async def test_double_tap_done_in_city_picker(bot, cat, dispatcher):
+    state = dp_state(dispatcher, bot)
+    await start_selection(message(bot), state)
+    pick = callback(bot, f"city:p:{cat.cities.id_of('Алматы')}")
+    await on_city(pick, state)
+    await coalescer.cancel(pick.message)  # отложенная перерисовка клавиатуры тесту не нужна
+    bot.session.requests.clear()
+
+    results = await asyncio.gather(
+        *(dispatcher.feed_update(bot, update(callback(bot, "city:d"))) for _ in range(2)),
+        return_exceptions=True,
+    )
+    assert not any(isinstance(r, BaseException) for r in results)
+    # Первое нажатие довело переход до конца: состояние тематик и сообщение с их клавиатурой
+    assert await state.get_state() == SelectionBasicStates.topics.state
+    edits = [m for m in bot.session.requests if isinstance(m, EditMessageText)]
+    assert len(edits) == 1 and edits[0].text.startswith("Отличный выбор городов!")
+    assert any(isinstance(m, AnswerCallbackQuery) for m in bot.session.requests)
+
+
+def test_state_changing_callbacks_are_not_superseded():
+    for data in ("city:d", "topic:d", "decide:x:Показать результат", "pay:mock"):
+        assert interaction_key(update(callback(None, data))) is None, data
+    assert interaction_key(update(callback(None, "city:g:1"))) == "picker"
@@ -0,0 +1,44 @@
+# tests/test_watchdog.py
+"""Горячие хендлеры подбора не блокируют event loop (см. watchdog.detect_blocking)."""
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from app import catalog
+from app.routers.influencers import _show_results_or_pay, on_city, on_topic, start_selection
+from app.watchdog import LoopBlocked, detect_blocking
+
+from conftest import callback, message, synthetic_df
+
+
+@pytest.fixture
+def big_cat(cat, monkeypatch):
+    """Каталог покрупнее: на 300 строках блокировка не видна ни при каком коде."""
+    snapshot = catalog.Catalog(synthetic_df(20_000))
+    snapshot.prepare()
+    monkeypatch.setattr(catalog, "_history", type(catalog._history)({snapshot.version: snapshot}))
+    monkeypatch.setattr(catalog, "_current", snapshot)
+    return snapshot
+
+
+async def test_detects_blocking_call():
+    with pytest.raises(LoopBlocked, match="test_detects_blocking_call"):
+        async with detect_blocking(threshold_ms=50):
+            time.sleep(0.2)
+
+
+async def test_selection_handlers_do_not_block(bot, state, big_cat):
+    await state.update_data(paid=True)
+    await start_selection(message(bot), state)
+    async with detect_blocking(threshold_ms=50):
+        for city in ("Алматы", "Астана"):
+            await on_city(callback(bot, f"city:p:{big_cat.cities.id_of(city)}"), state)
+        await on_city(callback(bot, "city:d"), state)
+        for topic in ("бьюти", "мода", "еда"):
+            await on_topic(callback(bot, f"topic:p:{big_cat.topics.id_of(topic)}"), state)
+        await on_topic(callback(bot, "topic:d"), state)
+        await _show_results_or_pay(message(bot), state)
+    data = await state.get_data()
+    assert data["res_ver"] == big_cat.version and data["results_df"]